@@ -0,0 +1,29 @@
+# reverse path packets and throughput for each receiver ack policy
+# run from the repository root: python3 -m bench.ack
+import os
+from typing import List
+
+from lib.handler import FileReceiver
+from bench.loopback import transfer, sample_file
+
+FILE_SIZE = 8 * 1024 * 1024
+ACK_EVERY = [1, 2, 4, 8]
+# (loss rate, one way delay in seconds) applied to server to client datagrams
+PATHS = [(0.0, 0.0), (0.0, 0.005), (0.01, 0.005)]
+
+def main():
+    path = sample_file(FILE_SIZE)
+    receivers: List[FileReceiver] = []
+
+    try:
+        print(f"{'ack every':>9} {'loss':>6} {'delay':>7} {'segments':>9} {'acks':>6} {'acks/seg':>9} {'MB/s':>8}")
+        for (loss, delay) in PATHS:
+            for ack_every in ACK_EVERY:
+                elapsed = transfer(path, ["--cc", "reno"], loss=loss, delay=delay, client_kwargs={"ack_every": ack_every}, receivers=receivers)
+                (receiver,) = receivers
+                print(f"{ack_every:>9} {loss:>6.2%} {delay * 1000:>5.0f}ms {receiver.segments_received:>9} {receiver.acks_sent:>6} {receiver.acks_sent / receiver.segments_received:>9.2f} {FILE_SIZE / elapsed / 1e6:>8.2f}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
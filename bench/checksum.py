@@ -0,0 +1,36 @@
+# micro benchmark for the CRC-16 backends
+# run from the repository root: python3 -m bench.checksum
+import os
+import timeit
+
+from lib.checksum import BACKENDS, Checksum
+from lib.constants import PAYLOAD_SIZE
+
+PAYLOAD_SIZES = [64, 1024, 4096, PAYLOAD_SIZE]
+
+def measure(backend: str, data: bytes, repeat: int) -> float:
+    update = BACKENDS[backend]
+    elapsed = min(timeit.repeat(lambda: update(data, 0xFFFF), number=repeat, repeat=3))
+
+    return elapsed / repeat
+
+def main():
+    print(f"{'backend':10} {'size':>8} {'us/call':>12} {'MB/s':>10}")
+
+    for size in PAYLOAD_SIZES:
+        data = os.urandom(size)
+        for backend in BACKENDS:
+            # the bitwise backend is slow enough that a few calls are plenty
+            repeat = 5 if backend == "bitwise" else 200
+            per_call = measure(backend, data, repeat)
+            print(f"{backend:10} {size:>8} {per_call * 1e6:>12.2f} {size / per_call / 1e6:>10.2f}")
+
+    # streaming header + payload versus hashing a concatenated copy
+    header = os.urandom(9)
+    payload = os.urandom(PAYLOAD_SIZE)
+    concat = min(timeit.repeat(lambda: Checksum(header + payload).digest(), number=200, repeat=3)) / 200
+    stream = min(timeit.repeat(lambda: Checksum(header).update(payload).digest(), number=200, repeat=3)) / 200
+    print(f"\nheader+payload concat {concat * 1e6:.2f} us, streaming {stream * 1e6:.2f} us")
+
+if __name__ == "__main__":
+    main()
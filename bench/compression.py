@@ -0,0 +1,58 @@
+# payload bytes on the wire and transfer time without compression, with zlib and with lzma,
+# for a text log and an image that is already compressed. A link of 20 ms RTT is emulated
+# by delaying every datagram, on bare loopback the compression time dominates
+# run from the repository root: python3 -m bench.compression
+import os
+import random
+import tempfile
+
+from bench.loopback import transfer
+from lib.compression import CompressedPayload
+from lib.constants import CompressionEnum
+
+LOG_SIZE = 8 * 1024 * 1024
+DELAY = 0.01
+METHODS = [CompressionEnum.NONE, CompressionEnum.ZLIB, CompressionEnum.LZMA]
+
+def log_file(size: int) -> str:
+    rng = random.Random(1)
+    levels = ["INFO", "INFO", "INFO", "WARNING", "ERROR"]
+    events = ["Sending DATA packet to", "received ACK packet from", "Retransmitting segment for", "Connection established with"]
+    (fd, path) = tempfile.mkstemp(prefix="bench-", suffix=".log")
+    written = 0
+    with os.fdopen(fd, "w") as f:
+        while written < size:
+            line = f"2023-11-28 10:{rng.randrange(60):02}:{rng.randrange(60):02},{rng.randrange(1000):03} {rng.choice(levels)} {rng.choice(events)} 127.0.0.1:{rng.randrange(20000, 50000)} with seqnum {rng.randrange(1 << 20)}\n"
+            f.write(line)
+            written += len(line)
+
+    return path
+
+def run(name: str, path: str) -> None:
+    size = os.path.getsize(path)
+    for method in METHODS:
+        senders = []
+        compression = [method] if method != CompressionEnum.NONE else []
+        elapsed = transfer(path, ["--cc", "cubic"], delay=DELAY, client_kwargs={"compression": compression}, senders=senders)
+
+        payload = senders[0].sender_buffer.file_payload
+        if isinstance(payload, CompressedPayload):
+            wire = payload.compressor.compressed_bytes
+            cpu = payload.compressor.compression_time
+        else:
+            (wire, cpu) = (size, 0.0)
+        print(f"{name:>8} {method.name.lower():>6} {size / 1e6:>9.2f} {wire / 1e6:>9.2f} {wire / size:>7.1%} {cpu:>8.2f} {elapsed:>8.2f} {size / elapsed / 1e6:>8.2f}")
+
+def main():
+    log = log_file(LOG_SIZE)
+    image = os.path.join(os.path.dirname(__file__), "..", "file", "furina.jpeg")
+
+    print(f"{'file':>8} {'method':>6} {'file MB':>9} {'wire MB':>9} {'ratio':>7} {'cpu s':>8} {'total s':>8} {'MB/s':>8}")
+    try:
+        run("log", log)
+        run("jpeg", image)
+    finally:
+        os.remove(log)
+
+if __name__ == "__main__":
+    main()
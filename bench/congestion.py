@@ -0,0 +1,25 @@
+# loopback throughput of each congestion control algorithm
+# run from the repository root: python3 -m bench.congestion
+import os
+
+from lib.congestion import CONGESTION_CONTROLS
+from bench.loopback import transfer, sample_file
+
+FILE_SIZE = 8 * 1024 * 1024
+# (loss rate, one way delay in seconds) applied to server to client datagrams
+PATHS = [(0.0, 0.0), (0.0, 0.005), (0.01, 0.005)]
+
+def main():
+    path = sample_file(FILE_SIZE)
+
+    try:
+        print(f"{'algorithm':10} {'loss':>6} {'delay':>7} {'seconds':>8} {'MB/s':>8}")
+        for (loss, delay) in PATHS:
+            for name in CONGESTION_CONTROLS:
+                elapsed = transfer(path, ["--cc", name], loss=loss, delay=delay)
+                print(f"{name:10} {loss:>6.2%} {delay * 1000:>5.0f}ms {elapsed:>8.2f} {FILE_SIZE / elapsed / 1e6:>8.2f}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# delta mode against a full transfer, for a new version differing from the client's copy
+# by 1%, 10% and 50% in scattered 4 KiB edits plus one insertion
+# run from the repository root: python3 -m bench.delta
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from bench.loopback import transfer, free_port
+from lib.delta import np
+from lib.journal import Journal
+
+FILE_SIZE = 16 * 1024 * 1024
+EDIT_SIZE = 4096
+DIFFERENCES = [0.01, 0.10, 0.50]
+
+def edited(data: bytes, fraction: float, rng: random.Random) -> bytes:
+    result = bytearray(data)
+    blocks = len(data) // EDIT_SIZE
+    for block in rng.sample(range(blocks), int(blocks * fraction)):
+        result[block * EDIT_SIZE:(block + 1) * EDIT_SIZE] = rng.randbytes(EDIT_SIZE)
+    # an insertion shifts everything after it, fixed offsets would no longer line up
+    position = rng.randrange(len(result))
+
+    return bytes(result[:position] + rng.randbytes(100) + result[position:])
+
+def run(fraction: float, old: bytes, rng: random.Random) -> None:
+    directory = tempfile.mkdtemp(prefix="bench-")
+    source = os.path.join(directory, "source.bin")
+    new = edited(old, fraction, rng)
+    with open(source, "wb") as f:
+        f.write(new)
+
+    try:
+        start = time.perf_counter()
+        transfer(source)
+        full = time.perf_counter() - start
+
+        output = os.path.join(directory, "client")
+        os.mkdir(output)
+        with open(os.path.join(output, "source.bin"), "wb") as f:
+            f.write(old)
+
+        start = time.perf_counter()
+        receivers = []
+        first_port = free_port()
+        transfer(source, client_kwargs={"delta_source": os.path.join(output, "source.bin")}, receivers=receivers, output=output, server_port=first_port)
+        signatures = receivers[0]
+        signatures.apply_delta()
+
+        # every transfer() runs its own server, move the journal to the port of the second one
+        second_port = free_port()
+        os.replace(Journal.path_for(output, "127.0.0.1", first_port), Journal.path_for(output, "127.0.0.1", second_port))
+        transfer(source, client_kwargs={"resume": True}, receivers=receivers, output=output, server_port=second_port)
+        delta = time.perf_counter() - start
+
+        receiver = receivers[0]
+        with open(receiver.file_path, "rb") as f:
+            assert f.read() == new
+
+        chunk_size = receiver.chunk_size
+        skipped = sum(min(end * chunk_size, len(new)) - start * chunk_size for (start, end) in receiver.resumed_ranges)
+        sent = signatures.file_size_bytes + len(new) - skipped
+        print(f"{fraction:>8.0%} {len(new) / 1e6:>10.2f} {sent / 1e6:>10.2f} {sent / len(new):>7.1%} {full:>8.2f} {delta:>8.2f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def main():
+    rng = random.Random(1)
+    old = rng.randbytes(FILE_SIZE)
+
+    print(f"{FILE_SIZE // (1024 * 1024)} MiB file, {EDIT_SIZE} byte edits, hashing with {'numpy' if np is not None else 'pure python'}")
+    print(f"{'differs':>8} {'full MB':>10} {'delta MB':>10} {'ratio':>7} {'full s':>8} {'delta s':>8}")
+    for fraction in DIFFERENCES:
+        run(fraction, old, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# many clients served by the blocking receive loop versus one asyncio event loop
+# run from the repository root: python3 -m bench.event_loop
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+from lib.arg import ServerArg
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.async_tcp_manager import AsyncTCPManager
+from lib.scheduler import LoopScheduler
+from bench.loopback import transfer, sample_file, free_port
+
+FILE_SIZE = 2 * 1024 * 1024
+CLIENTS = [1, 4, 16]
+
+async def transfer_async(path: str, clients: int) -> float:
+    loop = asyncio.get_running_loop()
+    server_port = free_port()
+    manager = AsyncTCPManager(ServerArg([str(server_port), path, "--cc", "reno"]), AsyncConnection("", server_port))
+    server = asyncio.ensure_future(manager.serve(expected_connections=clients))
+    output = tempfile.mkdtemp(prefix="bench-")
+
+    receivers: List[AsyncFileReceiver] = []
+    for _ in range(clients):
+        connection = AsyncConnection("", 0)
+        await connection.open()
+        receivers.append(AsyncFileReceiver(connection, "127.0.0.1", server_port, output, scheduler=LoopScheduler(loop)))
+
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(receiver.run()) for receiver in receivers]
+    while not all(receiver.is_file_received for receiver in receivers):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    # skip the TIME_WAIT of every client
+    for task in tasks + [server]:
+        task.cancel()
+    shutil.rmtree(output, ignore_errors=True)
+
+    return elapsed
+
+def main():
+    path = sample_file(FILE_SIZE)
+
+    try:
+        print(f"{'clients':>7} {'blocking s':>11} {'asyncio s':>10}")
+        for clients in CLIENTS:
+            blocking = transfer(path, ["--cc", "reno"], clients=clients)
+            evented = asyncio.run(transfer_async(path, clients))
+            print(f"{clients:>7} {blocking:>11.2f} {evented:>10.2f}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# receiver side disk writes: one write per chunk versus the coalescing write-behind
+# thread, for chunks arriving in order and shuffled within a window
+# run from the repository root: python3 -m bench.file_builder
+import os
+import random
+import tempfile
+import time
+
+from lib.constants import PAYLOAD_SIZE, RECEIVE_WINDOW
+from lib.file import FileBuilder, FSYNC_NONE, FSYNC_END
+
+FILE_SIZE = 64 * 1024 * 1024
+
+def arrival_order(chunks: int, shuffled: bool) -> list:
+    order = list(range(chunks))
+    if shuffled:
+        # reordered inside windows of RECEIVE_WINDOW segments, like a lossy path with SACK
+        for start in range(0, chunks, RECEIVE_WINDOW):
+            window = order[start:start + RECEIVE_WINDOW]
+            random.shuffle(window)
+            order[start:start + RECEIVE_WINDOW] = window
+
+    return order
+
+def run(content: bytes, order: list, coalesce: bool, fsync_policy: str) -> tuple:
+    (fd, path) = tempfile.mkstemp(prefix="bench-")
+    os.close(fd)
+    chunk = lambda number: content[number * PAYLOAD_SIZE:(number + 1) * PAYLOAD_SIZE]
+
+    start = time.perf_counter()
+    builder = FileBuilder(path, len(content), chunk_size=PAYLOAD_SIZE, fsync_policy=fsync_policy)
+    for number in order:
+        if coalesce:
+            builder.queue(chunk(number), number * PAYLOAD_SIZE)
+        else:
+            builder.write(chunk(number), number * PAYLOAD_SIZE)
+    builder.flush()
+    elapsed = time.perf_counter() - start
+
+    assert builder.is_completed()
+    os.remove(path)
+
+    return elapsed, builder.writes
+
+def main():
+    content = os.urandom(FILE_SIZE)
+    chunks = -(-FILE_SIZE // PAYLOAD_SIZE)
+
+    print(f"{'arrival':9} {'writes':10} {'fsync':6} {'seconds':>8} {'MB/s':>8} {'syscalls':>9}")
+    for shuffled in [False, True]:
+        order = arrival_order(chunks, shuffled)
+        for fsync_policy in [FSYNC_NONE, FSYNC_END]:
+            for coalesce in [False, True]:
+                (elapsed, writes) = run(content, order, coalesce, fsync_policy)
+                print(f"{'shuffled' if shuffled else 'in order':9} {'coalesced' if coalesce else 'per chunk':10} {fsync_policy:6} {elapsed:>8.2f} {FILE_SIZE / elapsed / 1e6:>8.0f} {writes:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# chunk reads of many senders serving one file, shared mapping versus a descriptor each
+# run from the repository root: python3 -m bench.file_payload
+import os
+import time
+import tracemalloc
+
+from lib.codec import get_codec
+from lib.constants import CodecEnum
+from lib.file import FilePayload
+from bench.loopback import sample_file
+
+FILE_SIZE = 32 * 1024 * 1024
+SENDERS = 16
+CHUNK_SIZE = get_codec(CodecEnum.NONE).payload_size
+
+def serve(path: str, use_mmap: bool) -> tuple:
+    # every sender reads the whole file once,
+    # returns (seconds, peak python allocations in bytes)
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    payloads = [FilePayload(path, CHUNK_SIZE, use_mmap) for _ in range(SENDERS)]
+    for chunk_number in range(1, payloads[0].total_chunk + 1):
+        for payload in payloads:
+            payload.get_chunk(chunk_number)
+    for payload in payloads:
+        payload.close()
+
+    elapsed = time.perf_counter() - start
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+def main():
+    path = sample_file(FILE_SIZE)
+
+    try:
+        print(f"{SENDERS} senders, {FILE_SIZE // 1024 // 1024} MB file, {CHUNK_SIZE} byte chunks")
+        print(f"{'reads':8} {'seconds':>8} {'MB/s':>8} {'peak KB':>8}")
+        for (label, use_mmap) in [("buffered", False), ("mmap", True)]:
+            (elapsed, peak) = serve(path, use_mmap)
+            print(f"{label:8} {elapsed:>8.2f} {SENDERS * FILE_SIZE / elapsed / 1e6:>8.0f} {peak // 1024:>8}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
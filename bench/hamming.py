@@ -0,0 +1,41 @@
+# throughput of scalar vs batch hamming encoding for whole send windows
+# run from the repository root: python3 -m bench.hamming
+import os
+import time
+
+from lib import hamming as hamming_module
+from lib.hamming import Hamming
+from lib.constants import PAYLOAD_SIZE, HEADER_SIZE
+
+WINDOW_SIZES = [4, 16, 64, 256]
+
+def throughput(function, window, rounds: int = 3) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(window)
+        best = min(best, time.perf_counter() - start)
+
+    return sum(len(payload) for payload in window) / best / 1e6
+
+def main():
+    hamming = Hamming()
+    numpy_available = hamming_module.np is not None
+    if not numpy_available:
+        print("numpy is not installed, batch calls use the pure python fallback")
+
+    print(f"{'window':>6} {'scalar enc MB/s':>16} {'batch enc MB/s':>15} {'scalar dec MB/s':>16} {'batch dec MB/s':>15}")
+
+    for size in WINDOW_SIZES:
+        window = [os.urandom(HEADER_SIZE + PAYLOAD_SIZE) for _ in range(size)]
+        encoded = hamming.encode_batch(window)
+
+        scalar_encode = throughput(lambda w: [hamming.encode(payload) for payload in w], window)
+        batch_encode = throughput(hamming.encode_batch, window)
+        scalar_decode = throughput(lambda w: [hamming.decode(datagram) for datagram in w], encoded)
+        batch_decode = throughput(hamming.decode_batch, encoded)
+
+        print(f"{size:>6} {scalar_encode:>16.1f} {batch_encode:>15.1f} {scalar_decode:>16.1f} {batch_decode:>15.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# run a server and clients inside one process over loopback, used by the benchmarks
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from socket import timeout as socket_timeout
+from typing import Dict, List, Optional, Type
+
+from lib.arg import ServerArg
+from lib.connection import Connection
+from lib.constants import RECEIVE_BATCH
+from lib.handler import FileReceiver, FileSender
+from lib.scheduler import get_scheduler
+from lib.tcp_manager import TCPManager
+
+class LossySocket:
+    # drops and delays outgoing datagrams to emulate a real path, counts what is sent
+    def __init__(self, socket, loss: float, delay: float) -> None:
+        self.socket = socket
+        self.loss = loss
+        self.delay = delay
+        self.sent_bytes = 0
+
+    def sendto(self, data, address):
+        self.sent_bytes += len(data)
+        if self.loss and random.random() < self.loss:
+            return len(data)
+
+        if self.delay:
+            get_scheduler().schedule(self.delay, lambda: self.socket.sendto(data, address) and None)
+            return len(data)
+
+        return self.socket.sendto(data, address)
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        return self.sendto(b"".join(buffers), address)
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+def free_port(count: int = 2) -> int:
+    # the server port and the client ports after it, benchmarks running many transfers
+    # still hold the sockets of the earlier ones
+    while True:
+        port = random.randint(20000, 50000)
+        probes = []
+        try:
+            for offset in range(count):
+                probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                probes.append(probe)
+                probe.bind(("", port + offset))
+            return port
+        except OSError:
+            continue
+        finally:
+            for probe in probes:
+                probe.close()
+
+def transfer(path: str,
+             server_argv: Optional[List[str]] = None,
+             clients: int = 1,
+             loss: float = 0.0,
+             delay: float = 0.0,
+             client_kwargs: Optional[Dict] = None,
+             timeout: float = 300,
+             receivers: Optional[List[FileReceiver]] = None,
+             socket_kwargs: Optional[Dict] = None,
+             max_batch: int = RECEIVE_BATCH,
+             output: Optional[str] = None,
+             server_port: Optional[int] = None,
+             senders: Optional[List[FileSender]] = None,
+             receiver_class: Type[FileReceiver] = FileReceiver,
+             managers: Optional[List[TCPManager]] = None,
+             per_client_kwargs: Optional[List[Dict]] = None) -> float:
+    # returns the seconds from the end of the handshakes until every client has the file,
+    # the clients are appended to receivers when given. socket_kwargs go to every Connection.
+    # A given output folder is kept afterwards, the server side of every connection goes to senders
+    # and the server itself to managers. A server started with --multicast sends to its group.
+    # per_client_kwargs adds arguments to the receiver of each client, e.g. its stripe
+    if server_port is None:
+        server_port = free_port(clients + 1)
+    args = ServerArg([str(server_port), path] + (server_argv or []))
+    server_connection = Connection("", server_port, **(socket_kwargs or {}))
+    server_connection.socket = LossySocket(server_connection.socket, loss, delay)
+    manager = TCPManager(args=args, connection=server_connection)
+    if managers is not None:
+        managers.clear()
+        managers.append(manager)
+
+    keep_output = output is not None
+    if output is None:
+        output = tempfile.mkdtemp(prefix="bench-")
+    if receivers is None:
+        receivers = []
+    receivers.clear()
+
+    def run_client(index: int):
+        connection = Connection("", server_port + 1 + index, **(socket_kwargs or {}))
+        kwargs = dict(client_kwargs or {}, **(per_client_kwargs[index] if per_client_kwargs else {}))
+        receiver = receiver_class(connection, "127.0.0.1", server_port, output, **kwargs)
+        receivers.append(receiver)
+        receiver.connect()
+
+        while not receiver.closed:
+            try:
+                for message in connection.receive_batch(max_batch=max_batch):
+                    receiver.handle_message(message)
+            except socket_timeout:
+                continue
+
+    for index in range(clients):
+        threading.Thread(target=run_client, args=(index,), daemon=True).start()
+
+    manager.listen_for_connection(expected_connections=clients)
+    if senders is not None:
+        senders.clear()
+        senders.extend(manager.tcp_connections.values())
+
+    start = time.perf_counter()
+    threading.Thread(target=manager.multicast_handle if args.multicast is not None else manager.parallel_handle, daemon=True).start()
+
+    while not (len(receivers) == clients and all(receiver.is_file_received for receiver in receivers)):
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"transfer of {path} did not finish in {timeout} seconds")
+        time.sleep(0.001)
+
+    elapsed = time.perf_counter() - start
+    if not keep_output:
+        shutil.rmtree(output, ignore_errors=True)
+
+    return elapsed
+
+def sample_file(size: int) -> str:
+    (fd, path) = tempfile.mkstemp(prefix="bench-", suffix=".bin")
+    with os.fdopen(fd, "wb") as f:
+        f.write(os.urandom(size))
+
+    return path
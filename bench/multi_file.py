@@ -0,0 +1,46 @@
+# many small files: one connection for the whole directory against one connection per file
+# run from the repository root: python3 -m bench.multi_file
+import os
+import shutil
+import tempfile
+import time
+
+from bench.loopback import transfer
+
+FILES = 200
+FILE_SIZE = 4096
+
+def sample_tree(files: int, size: int) -> str:
+    root = tempfile.mkdtemp(prefix="bench-")
+    for index in range(files):
+        directory = os.path.join(root, f"dir{index % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{index}.bin"), "wb") as f:
+            f.write(os.urandom(size))
+
+    return root
+
+def main():
+    root = sample_tree(FILES, FILE_SIZE)
+    paths = sorted(os.path.join(current, name) for (current, _, names) in os.walk(root) for name in names)
+
+    try:
+        # wall clock including the handshakes, the TIME_WAIT of each client is not waited for
+        start = time.perf_counter()
+        transfer(root)
+        directory = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for path in paths:
+            transfer(path)
+        per_file = time.perf_counter() - start
+
+        print(f"{FILES} files of {FILE_SIZE} bytes")
+        print(f"{'mode':>16} {'seconds':>8} {'files/s':>8}")
+        print(f"{'one connection':>16} {directory:>8.2f} {FILES / directory:>8.1f}")
+        print(f"{'per file':>16} {per_file:>8.2f} {FILES / per_file:>8.1f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
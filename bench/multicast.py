@@ -0,0 +1,40 @@
+# server egress and transfer time for N clients of the same file: one unicast transfer per
+# client against one multicast transfer to a group all of them joined, over loopback
+# run from the repository root: python3 -m bench.multicast
+import os
+import random
+
+from bench.loopback import transfer, free_port, sample_file
+from lib.constants import CodecEnum
+from lib.multicast import MulticastReceiver
+
+FILE_SIZE = 8 * 1024 * 1024
+CLIENTS = [1, 2, 4, 8]
+# loopback multicast is limited by how fast the python clients drain their sockets
+RATE = 40
+
+def run(path: str, clients: int) -> None:
+    for mode in ["unicast", "multicast"]:
+        managers = []
+        argv = ["--fec", "none", "--cc", "cubic"]
+        kwargs = {}
+        if mode == "multicast":
+            argv += ["--multicast", f"239.255.{random.randint(0, 255)}.{random.randint(1, 254)}:{free_port(1)}", "--multicast-rate", str(RATE)]
+            kwargs = {"receiver_class": MulticastReceiver}
+        elapsed = transfer(path, argv, clients=clients, client_kwargs={"codecs": [CodecEnum.NONE]}, managers=managers, **kwargs)
+
+        sent = managers[0].connection.socket.sent_bytes
+        print(f"{clients:>7} {mode:>9} {sent / 1e6:>10.2f} {sent / FILE_SIZE:>8.2f}x {elapsed:>8.2f} {clients * FILE_SIZE / elapsed / 1e6:>9.2f}")
+
+def main():
+    path = sample_file(FILE_SIZE)
+    print(f"{FILE_SIZE // (1024 * 1024)} MiB file, codec none")
+    print(f"{'clients':>7} {'mode':>9} {'egress MB':>10} {'of file':>9} {'time s':>8} {'MB/s all':>9}")
+    try:
+        for clients in CLIENTS:
+            run(path, clients)
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# time and memory allocated per segment on the serialize and decode paths
+# run from the repository root: python3 -m bench.segment
+import os
+import sys
+import time
+import tracemalloc
+
+from lib.segment import Segment
+from lib.constants import PAYLOAD_SIZE
+
+COUNT = 2000
+
+def per_segment(function) -> tuple:
+    # returns (microseconds, peak transient bytes, allocated blocks) per call
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        function()
+    elapsed = (time.perf_counter() - start) / COUNT
+
+    tracemalloc.start()
+    function()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # keep every result alive so the blocks they own stay allocated
+    results = []
+    before = sys.getallocatedblocks()
+    for _ in range(100):
+        results.append(function())
+    blocks = (sys.getallocatedblocks() - before) / 100
+
+    return elapsed * 1e6, peak, blocks
+
+def main():
+    for size in [0, 1024, PAYLOAD_SIZE]:
+        segment = Segment.data_segment(os.urandom(size))
+        segment.sequence_number = 42
+        raw = bytes(segment.to_raw_bytes())
+        encoded = segment.to_bytes()
+
+        print(f"payload {size} bytes")
+        for (name, function) in [
+            ("to_raw_bytes", segment.to_raw_bytes),
+            ("to_bytes", segment.to_bytes),
+            ("from_raw_bytes", lambda: Segment.from_raw_bytes(raw)),
+            ("from_bytes", lambda: Segment.from_bytes(encoded)),
+        ]:
+            (micros, peak, blocks) = per_segment(function)
+            print(f"  {name:15} {micros:>9.2f} us  peak {peak:>7} B  {blocks:>5.1f} blocks kept per segment")
+
+if __name__ == "__main__":
+    main()
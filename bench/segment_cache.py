@@ -0,0 +1,56 @@
+# parallel clients of one file with and without the shared encoded payload cache
+# run from the repository root: python3 -m bench.segment_cache
+import os
+import time
+
+from lib.codec import get_codec
+from lib.segment_cache import SegmentCache, get_segment_cache
+from lib.segment_sender import SenderBuffer
+from bench.loopback import transfer, sample_file
+
+FILE_SIZE = 4 * 1024 * 1024
+CLIENTS = [1, 4, 8]
+
+class NullConnection:
+    # the sender side alone, every datagram is dropped before the socket
+    def get_codec(self, ip, port):
+        return get_codec()
+
+    def send(self, message, encoded=None):
+        pass
+
+def encode_only(path: str, senders: int, cache: SegmentCache) -> float:
+    # seconds for every sender to put the whole file on the wire once
+    start = time.perf_counter()
+    for _ in range(senders):
+        sender = SenderBuffer(NullConnection(), "127.0.0.1", 1, path, 0, segment_cache=cache)  # type: ignore[arg-type]
+        sender._start_task(sender.file_payload.total_chunk + 1)
+        sender.cancel_all()
+
+    return time.perf_counter() - start
+
+def main():
+    path = sample_file(FILE_SIZE)
+    cache = get_segment_cache()
+
+    try:
+        print("sender side only")
+        print(f"{'senders':>7} {'no cache s':>11} {'cache s':>8}")
+        for senders in CLIENTS:
+            print(f"{senders:>7} {encode_only(path, senders, None):>11.2f} {encode_only(path, senders, SegmentCache()):>8.2f}")
+
+        print("over loopback, cpu of server and clients")
+        print(f"{'clients':>7} {'cache':>6} {'seconds':>8} {'cpu s':>7} {'hits':>6} {'misses':>7}")
+        for clients in CLIENTS:
+            for size in [0, 64]:
+                cache.clear()
+                (hits, misses) = (cache.hits, cache.misses)
+                cpu = time.process_time()
+                elapsed = transfer(path, ["--cc", "reno", "--segment-cache", str(size)], clients=clients)
+                cpu = time.process_time() - cpu
+                print(f"{clients:>7} {'on' if size else 'off':>6} {elapsed:>8.2f} {cpu:>7.2f} {cache.hits - hits:>6} {cache.misses - misses:>7}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
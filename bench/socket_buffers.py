@@ -0,0 +1,45 @@
+# kernel drops on the receiving socket with one datagram per receive versus batched
+# draining, under the default and an enlarged SO_RCVBUF. Drops are read from the
+# RcvbufErrors counter of /proc/net/snmp, so linux only
+# run from the repository root: python3 -m bench.socket_buffers
+import os
+
+from lib.constants import RECEIVE_BATCH
+from lib.codec import parse_codecs
+from bench.loopback import transfer, sample_file
+
+FILE_SIZE = 16 * 1024 * 1024
+RCVBUF = 4 * 1024 * 1024
+# (label, max_batch, rcvbuf)
+CASES = [
+    ("single", 1, None),
+    ("batch", RECEIVE_BATCH, None),
+    ("single", 1, RCVBUF),
+    ("batch", RECEIVE_BATCH, RCVBUF),
+]
+
+def udp_counters() -> dict:
+    with open("/proc/net/snmp") as f:
+        lines = [line.split() for line in f if line.startswith("Udp:")]
+
+    return dict(zip(lines[0][1:], map(int, lines[1][1:])))
+
+def main():
+    path = sample_file(FILE_SIZE)
+
+    try:
+        print(f"{'fec':8} {'receive':8} {'rcvbuf':>8} {'seconds':>8} {'MB/s':>8} {'datagrams':>9} {'dropped':>8} {'drop %':>7}")
+        for fec in ["hamming", "none"]:
+            for (label, max_batch, rcvbuf) in CASES:
+                before = udp_counters()
+                elapsed = transfer(path, ["--cc", "reno", "--fec", fec], client_kwargs={"codecs": parse_codecs(fec)},
+                                   socket_kwargs={"rcvbuf": rcvbuf}, max_batch=max_batch)
+                after = udp_counters()
+                datagrams = after["InDatagrams"] - before["InDatagrams"]
+                dropped = after["RcvbufErrors"] - before["RcvbufErrors"]
+                print(f"{fec:8} {label:8} {'default' if rcvbuf is None else rcvbuf // 1024:>8} {elapsed:>8.2f} {FILE_SIZE / elapsed / 1e6:>8.2f} {datagrams:>9} {dropped:>8} {dropped / max(1, datagrams + dropped):>7.2%}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# throughput of one large file fetched over K striped sub-connections, over plain loopback
+# and over a path with delay and loss where a single window cannot fill the link
+# run from the repository root: python3 -m bench.striped
+import os
+
+from bench.loopback import transfer, sample_file
+from lib.constants import CodecEnum
+from lib.stripe import SharedFile, StripeReceiver
+
+FILE_SIZE = 32 * 1024 * 1024
+STREAMS = [1, 2, 4, 8]
+# (loss, one way delay in seconds)
+PATHS = [(0.0, 0.0), (0.01, 0.03)]
+RECEIVE_WINDOW = 32
+
+def run(path: str, streams: int, loss: float, delay: float) -> None:
+    shared = SharedFile()
+    per_client_kwargs = [{"shared": shared, "index": index, "count": streams} for index in range(streams)]
+    elapsed = transfer(path, ["--fec", "none", "--cc", "cubic"], clients=streams, loss=loss, delay=delay, client_kwargs={"codecs": [CodecEnum.NONE], "receive_window": RECEIVE_WINDOW}, receiver_class=StripeReceiver, per_client_kwargs=per_client_kwargs)
+
+    print(f"{loss:>6.1%} {delay * 1000:>6.0f} {streams:>7} {elapsed:>8.2f} {FILE_SIZE / elapsed / 1e6:>8.2f}")
+
+def main():
+    path = sample_file(FILE_SIZE)
+    print(f"{FILE_SIZE // (1024 * 1024)} MiB file, codec none, receive window {RECEIVE_WINDOW} segments per stream, {os.cpu_count()} cores")
+    print(f"{'loss':>6} {'ms':>6} {'streams':>7} {'seconds':>8} {'MB/s':>8}")
+    try:
+        for (loss, delay) in PATHS:
+            for streams in STREAMS:
+                run(path, streams, loss, delay)
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
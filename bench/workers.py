@@ -0,0 +1,86 @@
+# many clients served by 1..N worker processes sharing the server port
+# run from the repository root: python3 -m bench.workers
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+from lib.arg import ServerArg
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.scheduler import LoopScheduler
+from lib.tcp import TCPStatusEnum
+from lib.workers import WorkerPool
+from bench.loopback import sample_file, free_port
+
+FILE_SIZE = 2 * 1024 * 1024
+CLIENTS = 16
+WORKERS = sorted({1, 2, 4, os.cpu_count() or 1})
+# the clients run in their own processes too, so the server side is what is measured
+CLIENT_PROCESSES = max(1, min(CLIENTS, os.cpu_count() or 1))
+
+async def receive_all(server_port: int, clients: int, output: str) -> None:
+    loop = asyncio.get_running_loop()
+
+    receivers: List[AsyncFileReceiver] = []
+    for _ in range(clients):
+        connection = AsyncConnection("", 0)
+        await connection.open()
+        receivers.append(AsyncFileReceiver(connection, "127.0.0.1", server_port, output, scheduler=LoopScheduler(loop)))
+
+    tasks = [asyncio.ensure_future(receiver.run()) for receiver in receivers]
+    # wait for the FIN exchange so every worker releases and reports its connections,
+    # the TIME_WAIT of every client is skipped
+    while not all(receiver.status in (TCPStatusEnum.CLOSE_TIME_WAIT, TCPStatusEnum.CLOSED) for receiver in receivers):
+        await asyncio.sleep(0.001)
+
+    for task in tasks:
+        task.cancel()
+
+def run_clients(server_port: int, clients: int, output: str) -> None:
+    asyncio.run(receive_all(server_port, clients, output))
+
+def transfer_workers(path: str, workers: int) -> float:
+    server_port = free_port()
+    pool = WorkerPool(ServerArg([str(server_port), path, "--cc", "reno", "--workers", str(workers)]), workers)
+    pool.start()
+    # let every worker bind before the first SYN, a SYN hashed to a missing socket is lost
+    time.sleep(0.5)
+    output = tempfile.mkdtemp(prefix="bench-")
+
+    try:
+        start = time.perf_counter()
+        shares = [CLIENTS // CLIENT_PROCESSES + (1 if index < CLIENTS % CLIENT_PROCESSES else 0) for index in range(CLIENT_PROCESSES)]
+        clients = [multiprocessing.Process(target=run_clients, args=(server_port, share, output)) for share in shares]
+        for process in clients:
+            process.start()
+
+        stats = pool.collect(expected_connections=CLIENTS, timeout=300)
+        elapsed = time.perf_counter() - start
+
+        for process in clients:
+            process.join()
+    finally:
+        pool.stop()
+        shutil.rmtree(output, ignore_errors=True)
+
+    print(f"{workers:>7} {elapsed:>8.2f} {CLIENTS * FILE_SIZE / elapsed / 1e6:>8.2f} {stats.retransmissions:>8}")
+
+    return elapsed
+
+def main():
+    path = sample_file(FILE_SIZE)
+
+    try:
+        print(f"{CLIENTS} clients in {CLIENT_PROCESSES} processes, {os.cpu_count()} cores")
+        print(f"{'workers':>7} {'seconds':>8} {'MB/s':>8} {'retrans':>8}")
+        for workers in WORKERS:
+            transfer_workers(path, workers)
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,119 @@
 # client.py
 from lib.connection import Connection
 from lib.handler import FileReceiver
+from lib.multicast import MulticastReceiver
+from lib.stripe import SharedFile, StripeReceiver
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.scheduler import LoopScheduler
 from lib.arg import ClientArg
 from lib.constants import TIMEOUT
 from socket import timeout as socket_timeout
 
+import asyncio
+from typing import List, Optional
 import logging
 import sys
 import socket
+import threading
 
-def main():
-    logging.basicConfig(format="[i] [Client] %(message)s", level=logging.INFO)
+async def main_async(args: ClientArg):
+    connection = AsyncConnection("", args.port_client, rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
+    await connection.open()
 
-    args = ClientArg()
+    tcp = AsyncFileReceiver(connection, args.host_server, args.port_server, args.file_path, args.codecs, args.receive_window, args.ack_every, args.ack_delay, LoopScheduler(asyncio.get_running_loop()), args.fsync_policy, args.resume, args.delta, args.compression)
+    await tcp.run()
 
-    file_path = args.file_path  
+    if tcp.signature_header is not None:
+        # the signatures are in, fetch whatever the old copy did not have
+        tcp.apply_delta()
+        tcp = AsyncFileReceiver(connection, args.host_server, args.port_server, args.file_path, args.codecs, args.receive_window, args.ack_every, args.ack_delay, LoopScheduler(asyncio.get_running_loop()), args.fsync_policy, True, compression=args.compression)
+        await tcp.run()
 
-    connection = Connection("", args.port_client)
+    connection.close()
 
-    tcp = FileReceiver(connection, args.host_server, args.port_server, file_path)
+def receive(connection: Connection, args: ClientArg, resume: bool, delta_source: Optional[str]) -> FileReceiver:
+    receiver_class = MulticastReceiver if args.multicast else FileReceiver
+    tcp = receiver_class(connection, args.host_server, args.port_server, args.file_path, args.codecs, args.receive_window, args.ack_every, args.ack_delay, fsync_policy=args.fsync_policy, resume=resume, delta_source=delta_source, compression=args.compression)
     tcp.connect()
 
-    while not tcp.closed:
+    try:
+        while not tcp.closed:
+            try:
+                for message in connection.receive_batch():
+                    tcp.handle_message(message)
+            except socket_timeout:
+                continue
+    except KeyboardInterrupt:
+        # with --resume the journal keeps what is already written
+        logging.info("Transfer interrupted")
+        if tcp.is_metadata_received:
+            tcp.file_handle.close()
+        raise
+
+    return tcp
+
+def receive_striped(args: ClientArg) -> List[StripeReceiver]:
+    # one thread and one port per stream, every stream writes into the same file
+    shared = SharedFile()
+    receivers = []
+
+    def run(index: int):
+        connection = Connection("", args.port_client + index, rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
+        tcp = StripeReceiver(connection, args.host_server, args.port_server, args.file_path, shared, index, args.streams, codecs=args.codecs, receive_window=args.receive_window, ack_every=args.ack_every, ack_delay=args.ack_delay, fsync_policy=args.fsync_policy, compression=args.compression)
+        receivers.append(tcp)
+        tcp.connect()
+
+        while not tcp.closed:
+            try:
+                for message in connection.receive_batch():
+                    tcp.handle_message(message)
+            except socket_timeout:
+                continue
+        connection.close()
+
+    threads = [threading.Thread(target=run, args=(index,), daemon=True) for index in range(args.streams)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            # a timeout keeps Ctrl+C working while waiting
+            while thread.is_alive():
+                thread.join(TIMEOUT)
+    except KeyboardInterrupt:
+        logging.info("Transfer interrupted")
+        if shared.builder is not None:
+            shared.builder.close()
+        raise
+
+    return receivers
+
+def main():
+    logging.basicConfig(format="[i] [Client] %(message)s", level=logging.INFO)
+
+    args = ClientArg()
+
+    if args.use_asyncio:
+        asyncio.run(main_async(args))
+        return
+
+    if args.streams > 1:
         try:
-            message = connection.receive()
-            tcp.handle_message(message)
-        except socket_timeout:
-            continue
+            receive_striped(args)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    connection = Connection("", args.port_client, rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
 
+    try:
+        tcp = receive(connection, args, args.resume, args.delta)
+        if tcp.signature_header is not None:
+            # the signatures are in, fetch whatever the old copy did not have
+            tcp.apply_delta()
+            receive(connection, args, True, None)
+    except KeyboardInterrupt:
+        pass
 
     connection.close()
 
@@ -1,5 +1,12 @@
 import argparse
 import socket
+from typing import List, Optional, Tuple
+from .constants import CodecEnum, CompressionEnum, MAX_PENDING, MULTICAST_RATE, MIN_RTO, RECEIVE_WINDOW, ACK_EVERY, ACK_DELAY, SEGMENT_CACHE_SIZE
+from .codec import parse_codecs
+from .compression import parse_compression
+from .multicast import parse_group
+from .congestion import CONGESTION_CONTROLS, DEFAULT_CONGESTION_CONTROL
+from .file import FSYNC_POLICIES, FSYNC_NONE
 
 
 class ClientArg:
@@ -7,8 +14,21 @@ class ClientArg:
     port_server: int
     host_server: str
     file_path: str  
+    codecs: List[CodecEnum]
+    receive_window: int
+    ack_every: int
+    ack_delay: float
+    fsync_policy: str
+    resume: bool
+    delta: Optional[str]
+    compression: List[CompressionEnum]
+    multicast: bool
+    streams: int
+    use_asyncio: bool
+    rcvbuf: Optional[int]
+    sndbuf: Optional[int]
 
-    def __init__(self) -> None:
+    def __init__(self, argv: Optional[List[str]] = None) -> None:
         parser = argparse.ArgumentParser(
             description="Client for handling file transfer connection from server"
         )
@@ -41,18 +61,148 @@ class ClientArg:
             help="broadcast host for server address"
         )
 
-        args = parser.parse_args()
+        parser.add_argument(
+            "--fec",
+            metavar="CODECS",
+            type=parse_codecs,
+            default=[CodecEnum.HAMMING],
+            help="error correction codecs offered to the server by preference, e.g. none,hamming (default: hamming)"
+        )
+
+        parser.add_argument(
+            "--receive-window",
+            metavar="SEGMENTS",
+            type=int,
+            default=RECEIVE_WINDOW,
+            help=f"out-of-order segments buffered while waiting for a missing one (default: {RECEIVE_WINDOW})"
+        )
+
+        parser.add_argument(
+            "--ack-every",
+            metavar="SEGMENTS",
+            type=int,
+            default=ACK_EVERY,
+            help=f"send one cumulative ACK per this many in-order segments, 1 acks every segment (default: {ACK_EVERY})"
+        )
+
+        parser.add_argument(
+            "--ack-delay",
+            metavar="SECONDS",
+            type=float,
+            default=ACK_DELAY,
+            help=f"longest time an in-order segment waits for its ACK (default: {ACK_DELAY})"
+        )
+
+        parser.add_argument(
+            "--fsync",
+            choices=FSYNC_POLICIES,
+            default=FSYNC_NONE,
+            help=f"when the received file is synced to disk: left to the OS, once complete, or also every few MB (default: {FSYNC_NONE})"
+        )
+
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="keep a progress journal in the output folder and continue an interrupted transfer of the same file"
+        )
+
+        parser.add_argument(
+            "--delta",
+            metavar="OLD_FILE",
+            type=str,
+            default=None,
+            help="older copy of the file, only the chunks it does not have are transferred"
+        )
+
+        parser.add_argument(
+            "--compress",
+            metavar="METHODS",
+            type=parse_compression,
+            default=[],
+            help="compression offered to the server by preference, e.g. zlib,lzma (default: none)"
+        )
+
+        parser.add_argument(
+            "--multicast",
+            action="store_true",
+            help="join the multicast group of a server started with --multicast and report missing segments with NAKs"
+        )
+
+        parser.add_argument(
+            "--streams",
+            metavar="K",
+            type=int,
+            default=1,
+            help="fetch the file over K sub-connections from client port onwards, each carrying a contiguous stripe of it (default: 1)"
+        )
+
+        parser.add_argument(
+            "--asyncio",
+            action="store_true",
+            help="drive the connection from an asyncio event loop instead of blocking receives"
+        )
+
+        parser.add_argument(
+            "--rcvbuf",
+            metavar="BYTES",
+            type=int,
+            default=None,
+            help="kernel receive buffer of the socket, datagrams arriving while it is full are dropped (default: system)"
+        )
+
+        parser.add_argument(
+            "--sndbuf",
+            metavar="BYTES",
+            type=int,
+            default=None,
+            help="kernel send buffer of the socket (default: system)"
+        )
+
+        args = parser.parse_args(argv)
 
         self.port_client = getattr(args, "client_port")
         self.port_server = getattr(args, "broadcast_port")
         self.file_path = getattr(args, "file_path")
         self.host_server = getattr(args, "host")
+        self.codecs = getattr(args, "fec")
+        self.receive_window = getattr(args, "receive_window")
+        self.ack_every = getattr(args, "ack_every")
+        self.ack_delay = getattr(args, "ack_delay")
+        self.fsync_policy = getattr(args, "fsync")
+        self.resume = getattr(args, "resume")
+        self.delta = getattr(args, "delta")
+        self.compression = [method for method in getattr(args, "compress") if method != CompressionEnum.NONE]
+        self.multicast = getattr(args, "multicast")
+        self.streams = getattr(args, "streams")
+        self.use_asyncio = getattr(args, "asyncio")
+        self.rcvbuf = getattr(args, "rcvbuf")
+        self.sndbuf = getattr(args, "sndbuf")
+
+        if self.multicast and self.use_asyncio:
+            parser.error("--multicast is not available with --asyncio")
+        if self.streams < 1:
+            parser.error("--streams must be at least 1")
+        if self.streams > 1 and (self.multicast or self.use_asyncio or self.resume or self.delta is not None):
+            parser.error("--streams is not available with --multicast, --asyncio, --resume or --delta")
 
 class ServerArg:
     port_server: int
     file_path: str
+    codecs: List[CodecEnum]
+    adaptive_codec: bool
+    compression: List[CompressionEnum]
+    multicast: Optional[Tuple[str, int]]
+    multicast_rate: float
+    min_rto: float
+    congestion_control: str
+    use_asyncio: bool
+    workers: int
+    segment_cache_size: int
+    syn_cookies: bool
+    rcvbuf: Optional[int]
+    sndbuf: Optional[int]
 
-    def __init__(self) -> None:
+    def __init__(self, argv: Optional[List[str]] = None) -> None:
         parser = argparse.ArgumentParser(
             description="Server for sending file transfer to client"
         )
@@ -68,12 +218,129 @@ class ServerArg:
             "file_path",
             metavar="[file input path]",
             type=str,
-            help="location of file input path"
+            help="location of file input path, a directory is sent whole over one connection"
+        )
+
+        parser.add_argument(
+            "--fec",
+            metavar="CODECS",
+            type=parse_codecs,
+            default=[CodecEnum.HAMMING],
+            help="error correction codecs the server accepts, e.g. none,hamming (default: hamming)"
+        )
+
+        parser.add_argument(
+            "--adaptive-fec",
+            action="store_true",
+            help="switch codec mid-connection based on observed bit errors and checksum failures"
+        )
+
+        parser.add_argument(
+            "--compress",
+            metavar="METHODS",
+            type=parse_compression,
+            default=[CompressionEnum.ZLIB, CompressionEnum.LZMA],
+            help="compression the server accepts when a client offers it, none to refuse (default: zlib,lzma)"
         )
 
-        args = parser.parse_args()
+        parser.add_argument(
+            "--multicast",
+            metavar="GROUP:PORT",
+            type=parse_group,
+            default=None,
+            help="send the file once to this multicast group for every client started with --multicast, e.g. 239.255.0.1:9100"
+        )
+
+        parser.add_argument(
+            "--multicast-rate",
+            metavar="MB/S",
+            type=float,
+            default=MULTICAST_RATE,
+            help=f"highest rate of the multicast transfer, lowered while clients report loss (default: {MULTICAST_RATE})"
+        )
+
+        parser.add_argument(
+            "--min-rto",
+            metavar="SECONDS",
+            type=float,
+            default=MIN_RTO,
+            help=f"lower bound of the adaptive retransmission timeout (default: {MIN_RTO})"
+        )
+
+        parser.add_argument(
+            "--cc",
+            choices=list(CONGESTION_CONTROLS),
+            default=DEFAULT_CONGESTION_CONTROL,
+            help=f"congestion control algorithm driving the send window (default: {DEFAULT_CONGESTION_CONTROL})"
+        )
+
+        parser.add_argument(
+            "--asyncio",
+            action="store_true",
+            help="serve every client from one asyncio event loop, each transfer starts right after its handshake"
+        )
+
+        parser.add_argument(
+            "--rcvbuf",
+            metavar="BYTES",
+            type=int,
+            default=None,
+            help="kernel receive buffer of the socket, datagrams arriving while it is full are dropped (default: system)"
+        )
+
+        parser.add_argument(
+            "--sndbuf",
+            metavar="BYTES",
+            type=int,
+            default=None,
+            help="kernel send buffer of the socket (default: system)"
+        )
+
+        parser.add_argument(
+            "--workers",
+            metavar="N",
+            type=int,
+            default=1,
+            help="serve from N processes sharing the port with SO_REUSEPORT, each one runs the asyncio server (default: 1)"
+        )
+
+        parser.add_argument(
+            "--segment-cache",
+            metavar="MB",
+            type=int,
+            default=SEGMENT_CACHE_SIZE // (1024 * 1024),
+            help=f"memory for encoded payloads shared by every client of the process, 0 disables it (default: {SEGMENT_CACHE_SIZE // (1024 * 1024)})"
+        )
+
+        parser.add_argument(
+            "--syn-cookies",
+            action="store_true",
+            help=f"keep no state for a SYN, the initial sequence number is a keyed hash checked on the final ACK (always used while {MAX_PENDING} handshakes are pending)"
+        )
+
+        args = parser.parse_args(argv)
 
         self.port_server = getattr(args, "server_port")
         self.file_path = getattr(args, "file_path")
+        self.codecs = getattr(args, "fec")
+        self.adaptive_codec = getattr(args, "adaptive_fec")
+        self.compression = [method for method in getattr(args, "compress") if method != CompressionEnum.NONE]
+        self.multicast = getattr(args, "multicast")
+        self.multicast_rate = getattr(args, "multicast_rate") * 1e6
+        self.min_rto = getattr(args, "min_rto")
+        self.congestion_control = getattr(args, "cc")
+        self.use_asyncio = getattr(args, "asyncio")
+        self.rcvbuf = getattr(args, "rcvbuf")
+        self.sndbuf = getattr(args, "sndbuf")
+        self.workers = getattr(args, "workers")
+        self.segment_cache_size = getattr(args, "segment_cache") * 1024 * 1024
+        self.syn_cookies = getattr(args, "syn_cookies")
+
+        if self.workers < 1:
+            parser.error("--workers must be at least 1")
+        if self.multicast is not None and (self.use_asyncio or self.workers > 1):
+            parser.error("--multicast is not available with --asyncio or --workers")
+        if self.workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+            parser.error("--workers needs SO_REUSEPORT, which this platform does not have")
 
     
\ No newline at end of file
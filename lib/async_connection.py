@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from socket import timeout as socket_timeout
+from typing import Optional, Sequence, Tuple
+
+from .connection import Connection, MessageInfo
+from .constants import TIMEOUT
+from .hamming import Buffer
+
+# decoded messages waiting for the driver, datagrams beyond this are dropped like a full socket buffer
+RECEIVE_QUEUE_SIZE = 4096
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    connection: 'AsyncConnection'
+
+    def __init__(self, connection: 'AsyncConnection') -> None:
+        self.connection = connection
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        message = self.connection._decode(data, addr)
+        if message is None:
+            return
+
+        try:
+            self.connection.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logging.info(f"from {message.ip}:{message.port} receive queue full. dropping ...")
+
+    def error_received(self, exc: Exception) -> None:
+        logging.info(f"Socket error: {exc}")
+
+class AsyncConnection(Connection):
+    # same codecs and framing as Connection, the socket is served by an asyncio event loop.
+    # Datagrams are decoded as they arrive and receive() awaits them, no blocking
+    # recvfrom and no settimeout per packet
+    loop: Optional[asyncio.AbstractEventLoop]
+    transport: Optional[asyncio.DatagramTransport]
+    queue: 'asyncio.Queue[MessageInfo]'
+
+    def __init__(self, ip: str, port: int, reuse_port: bool = False, rcvbuf: Optional[int] = None, sndbuf: Optional[int] = None) -> None:
+        super().__init__(ip, port, reuse_port, rcvbuf, sndbuf)
+        self.socket.setblocking(False)
+        self.loop = None
+        self.transport = None
+        self.queue = asyncio.Queue(RECEIVE_QUEUE_SIZE)
+
+    async def open(self) -> None:
+        # call listen() first to bind, a client socket is bound by its first send
+        self.loop = asyncio.get_running_loop()
+        (self.transport, _) = await self.loop.create_datagram_endpoint(lambda: DatagramProtocol(self), sock=self.socket)
+
+    async def receive(self, timeout: float = TIMEOUT) -> MessageInfo:  # type: ignore[override]
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise socket_timeout
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        else:
+            super().close()
+
+    def _sendto(self, encoded: bytes, address: Tuple[str, int]):
+        assert self.loop is not None and self.transport is not None, "open() the connection first"
+
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+
+        if in_loop:
+            self.transport.sendto(encoded, address)
+        else:
+            # window updates are sent from the file writer thread
+            self.loop.call_soon_threadsafe(self.transport.sendto, encoded, address)
+
+    def _sendmsg(self, buffers: Sequence[Buffer], address: Tuple[str, int]):
+        # datagram transports have no scatter-gather send
+        self._sendto(b"".join(buffers), address)
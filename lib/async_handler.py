@@ -0,0 +1,88 @@
+import logging
+from socket import timeout as socket_timeout
+
+from .async_connection import AsyncConnection
+from .connection import MessageInfo
+from .constants import FlagEnum, TIMEOUT, TIME_WAIT
+from .handler import FileReceiver
+from .segment import Segment
+from .tcp import TCPStatusEnum
+
+class AsyncFileReceiver(FileReceiver):
+    # FileReceiver driven by an event loop, the handshake and teardown await the
+    # connection instead of blocking on it. Pass a LoopScheduler for the delayed ACKs
+    connection: AsyncConnection
+
+    async def run(self):
+        await self.connect_async()
+
+        while not self.closed:
+            if self.status == TCPStatusEnum.ACTIVE_CLOSE:
+                await self.close_async()
+                break
+
+            try:
+                message = await self.connection.receive()
+                self.handle_message(message)
+            except socket_timeout:
+                continue
+
+    async def connect_async(self):
+        logging.info("Initiating three-way handshake")
+        syn_segment = Segment.syn_segment(self.handshake_sequence_number, self.handshake_options.to_bytes())
+
+        self.connection.send(MessageInfo(self.ip, self.port, syn_segment))
+        self.status = TCPStatusEnum.WAITING_SYN_ACK
+
+        while self.status == TCPStatusEnum.WAITING_SYN_ACK:
+            try:
+                message = await self.connection.receive(TIMEOUT)
+            except socket_timeout:
+                logging.info(f"Timeout error during phase {self.status} ... will retry")
+                self.connection.send(MessageInfo(self.ip, self.port, syn_segment))
+                continue
+
+            if message.segment.flag != FlagEnum.SYN_ACK_FLAG:
+                logging.info("Received packet with flag other than SYN-ACK. Dropping ...")
+            elif message.segment.ack != self.handshake_sequence_number + 1:
+                logging.info("Invalid ack number. Dropping ...")
+            else:
+                self.server_sequence_number = message.segment.sequence_number + 1
+                self.connection.send(MessageInfo(self.ip, self.port, self._handshake_ack()))
+                self._apply_handshake_options(message.segment)
+                self.status = TCPStatusEnum.WAITING_FIRST_PACKET
+                self.scheduler.schedule(TIMEOUT, self._resend_handshake_ack)
+
+    def close(self):
+        # called by handle_data once the file is complete, run() awaits the FIN exchange
+        self.status = TCPStatusEnum.ACTIVE_CLOSE
+
+    async def close_async(self):
+        fin_segment = Segment.fin_segment(self.handshake_sequence_number)
+
+        self.connection.send(MessageInfo(self.ip, self.port, fin_segment))
+        self.status = TCPStatusEnum.WAITING_FIN_ACK
+
+        while not self.closed:
+            try:
+                message = await self.connection.receive(TIME_WAIT if self.status == TCPStatusEnum.CLOSE_TIME_WAIT else TIMEOUT)
+            except socket_timeout:
+                if self.status == TCPStatusEnum.CLOSE_TIME_WAIT:
+                    logging.info("Connection closed")
+                    self.status = TCPStatusEnum.CLOSED
+                else:
+                    self.connection.send(MessageInfo(self.ip, self.port, fin_segment))
+                continue
+
+            if message.segment.flag != FlagEnum.FIN_ACK_FLAG:
+                logging.info("Received packet with flag other than FIN-ACK. Dropping ...")
+            elif message.segment.ack != self.handshake_sequence_number + 1:
+                logging.info("Invalid ack number. Dropping ...")
+            else:
+                # also answers a FIN-ACK retransmitted because our ACK was lost
+                self.server_sequence_number = message.segment.sequence_number + 1
+                self.connection.send(MessageInfo(self.ip, self.port, Segment.ack_segment(0, self.server_sequence_number)))
+
+                if self.status != TCPStatusEnum.CLOSE_TIME_WAIT:
+                    logging.info(f"Waiting {TIME_WAIT} seconds before closing connection ...")
+                    self.status = TCPStatusEnum.CLOSE_TIME_WAIT
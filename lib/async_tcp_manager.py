@@ -0,0 +1,47 @@
+import asyncio
+import logging
+from socket import timeout as socket_timeout
+
+from .async_connection import AsyncConnection
+from .constants import FlagEnum, TIMEOUT
+from .scheduler import LoopScheduler
+from .tcp_manager import TCPManager
+
+class AsyncTCPManager(TCPManager):
+    # one event loop serves every handshake and transfer, a transfer starts as soon
+    # as its handshake completes instead of after the listening phase
+    connection: AsyncConnection
+
+    async def serve(self, expected_connections: int = 0):
+        # expected_connections > 0 returns once that many transfers are done
+        self.scheduler = LoopScheduler(asyncio.get_running_loop())
+        await self.connection.open()
+        completed = 0
+
+        logging.info("Begin listening for connections. Use Ctrl+C to stop")
+
+        while not expected_connections or completed < expected_connections:
+            try:
+                message = await self.connection.receive(TIMEOUT)
+            except socket_timeout:
+                continue
+
+            tcp_server = self.tcp_connections.get((message.ip, message.port))
+
+            if tcp_server is None:
+                if message.segment.flag == FlagEnum.SYN_FLAG or message.segment.is_handshake_ack() or self.pending_connections.is_pending(message.ip, message.port):
+                    self._handle_connection_message(message, True)
+
+                    tcp_server = self.tcp_connections.get((message.ip, message.port))
+                    if tcp_server is not None:
+                        tcp_server.begin_transfer()
+                else:
+                    logging.info("Detected packet for unknown connection. Dropping ...")
+                continue
+
+            tcp_server.handle_message(message)
+
+            if tcp_server.closed:
+                self.tcp_connections.pop((message.ip, message.port))
+                self._release_connection(tcp_server)
+                completed += 1
@@ -1,8 +1,32 @@
+import binascii
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple, Union
+
 CRC16_CONSTRANT = 0x1021
+CRC16_INIT = 0xFFFF
+
+Buffer = Union[bytes, bytearray, memoryview]
 
 # CRC-16/CCITT-FALSE
-def calculate_checksum(data: bytes):
-    crc16 = 0xFFFF
+# every backend has the signature (data, crc) -> crc so the register can be
+# carried between calls, which is what the streaming Checksum class relies on
+
+def _build_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc16 = byte << 8
+        for _ in range(8):
+            if crc16 & 0x8000:
+                crc16 = ((crc16 << 1) ^ CRC16_CONSTRANT) & 0xFFFF
+            else:
+                crc16 = (crc16 << 1) & 0xFFFF
+        table.append(crc16)
+
+    return table
+
+CRC16_TABLE = _build_table()
+
+def crc16_bitwise(data: Buffer, crc16: int = CRC16_INIT) -> int:
     for byte in data:
         byte_to_calc = byte
         for _ in range(8):
@@ -11,9 +35,84 @@ def calculate_checksum(data: bytes):
             msb_is_set = msb_byte ^ msb_crc
             crc16 = (crc16 << 1) & 0xFFFF
             if msb_is_set:
-                crc16 = crc16 ^ 0x1021
+                crc16 = crc16 ^ CRC16_CONSTRANT
 
             byte_to_calc = (byte_to_calc << 1) & 0xFF
 
     return crc16 & 0xFFFF
 
+def crc16_table(data: Buffer, crc16: int = CRC16_INIT) -> int:
+    table = CRC16_TABLE
+    for byte in data:
+        crc16 = ((crc16 << 8) & 0xFFFF) ^ table[(crc16 >> 8) ^ byte]
+
+    return crc16
+
+def crc16_binascii(data: Buffer, crc16: int = CRC16_INIT) -> int:
+    # crc_hqx implements the same polynomial in C, only the initial value differs
+    return binascii.crc_hqx(data, crc16)
+
+BACKENDS: Dict[str, Callable[[Buffer, int], int]] = {
+    "binascii": crc16_binascii,
+    "table": crc16_table,
+    "bitwise": crc16_bitwise,
+}
+
+DEFAULT_BACKEND = "binascii"
+
+_backend = BACKENDS[DEFAULT_BACKEND]
+
+def set_backend(name: str) -> None:
+    global _backend
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown checksum backend {name}, expected one of {', '.join(BACKENDS)}")
+
+    _backend = BACKENDS[name]
+
+def get_backend() -> Callable[[Buffer, int], int]:
+    return _backend
+
+def calculate_checksum(data: Buffer, backend: str = "") -> int:
+    if backend:
+        return BACKENDS[backend](data, CRC16_INIT)
+
+    return _backend(data, CRC16_INIT)
+
+@lru_cache(maxsize=64)
+def _shift_columns(length: int) -> Tuple[int, ...]:
+    # the register after length zero bytes is linear in the register before them,
+    # column i is where bit i ends up
+    return tuple(binascii.crc_hqx(bytes(length), 1 << bit) for bit in range(16))
+
+def crc16_shift(crc16: int, length: int) -> int:
+    # same as feeding length zero bytes to the register, without reading them
+    result = 0
+    for (bit, column) in enumerate(_shift_columns(length)):
+        if crc16 >> bit & 1:
+            result ^= column
+
+    return result
+
+def crc16_combine(prefix_crc16: int, data_crc16: int, length: int) -> int:
+    # CRC of prefix + data from the CRC of the prefix and the CRC of data alone started
+    # from 0, so a payload shared by many segments is only read once
+    return crc16_shift(prefix_crc16, length) ^ data_crc16
+
+class Checksum:
+    # incremental CRC, feed header and payload separately instead of concatenating them
+    crc16: int
+
+    def __init__(self, data: Buffer = b"", backend: str = "") -> None:
+        self.crc16 = CRC16_INIT
+        self._update = BACKENDS[backend] if backend else _backend
+
+        if data:
+            self.update(data)
+
+    def update(self, data: Buffer) -> 'Checksum':
+        self.crc16 = self._update(data, self.crc16)
+        return self
+
+    def digest(self) -> int:
+        return self.crc16 & 0xFFFF
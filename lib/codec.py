@@ -0,0 +1,141 @@
+import logging
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Sequence, Tuple
+
+from .constants import CodecEnum, PAYLOAD_SIZE, RAW_PAYLOAD_SIZE, ADAPTIVE_CODEC_WINDOW, ADAPTIVE_CODEC_MAX_FAILURE_RATE
+from .hamming import Hamming, Buffer
+
+class Codec:
+    # error correction applied to the whole serialized segment
+    codec_id: CodecEnum
+    payload_size: int
+    # encode returns its input, the segment can be sent as separate header and payload buffers
+    identity: bool = False
+    # every byte is encoded on its own, so header and payload can be encoded separately
+    bytewise: bool = False
+
+    def encode(self, data: Buffer) -> bytes:
+        raise NotImplementedError("encode is an abstract function that need to be implemented")
+
+    def decode_with_errors(self, data: Buffer) -> Tuple[bytes, int]:
+        raise NotImplementedError("decode_with_errors is an abstract function that need to be implemented")
+
+    def encode_batch(self, payloads: Sequence[Buffer]) -> List[bytes]:
+        return [self.encode(payload) for payload in payloads]
+
+    def __str__(self) -> str:
+        return self.codec_id.name.lower()
+
+class NoCodec(Codec):
+    # CRC only, for clean links where the hamming expansion is pure overhead
+    codec_id = CodecEnum.NONE
+    payload_size = RAW_PAYLOAD_SIZE
+    identity = True
+    bytewise = True
+
+    def encode(self, data: Buffer) -> bytes:
+        return data if isinstance(data, bytes) else bytes(data)
+
+    def decode_with_errors(self, data: Buffer) -> Tuple[bytes, int]:
+        return data if isinstance(data, bytes) else bytes(data), 0
+
+class HammingCodec(Codec):
+    codec_id = CodecEnum.HAMMING
+    payload_size = PAYLOAD_SIZE
+    bytewise = True
+
+    def __init__(self) -> None:
+        self.hamming = Hamming()
+
+    def encode(self, data: Buffer) -> bytes:
+        return self.hamming.encode(data)
+
+    def decode_with_errors(self, data: Buffer) -> Tuple[bytes, int]:
+        return self.hamming.decode_with_errors(data)
+
+    def encode_batch(self, payloads: Sequence[Buffer]) -> List[bytes]:
+        return list(self.hamming.encode_batch(payloads))
+
+CODECS: Dict[CodecEnum, Codec] = {
+    CodecEnum.NONE: NoCodec(),
+    CodecEnum.HAMMING: HammingCodec(),
+}
+
+DEFAULT_CODEC = CodecEnum.HAMMING
+
+def get_codec(codec_id: CodecEnum = DEFAULT_CODEC) -> Codec:
+    return CODECS[codec_id]
+
+def parse_codecs(names: str) -> List[CodecEnum]:
+    # comma separated list from the command line, e.g. "none,hamming"
+    codecs = []
+    for name in names.split(","):
+        name = name.strip().upper()
+        if name not in CodecEnum.__members__:
+            raise ValueError(f"Unknown codec {name.lower()}, expected one of {', '.join(c.name.lower() for c in CodecEnum)}")
+        codecs.append(CodecEnum[name])
+
+    return codecs
+
+def choose_codec(offered: Iterable[CodecEnum], allowed: Iterable[CodecEnum]) -> CodecEnum:
+    # first codec in the client preference that the server allows
+    allowed = list(allowed)
+    for codec_id in offered:
+        if codec_id in allowed:
+            return codec_id
+
+    return DEFAULT_CODEC
+
+def chunk_size_for(codec_id: CodecEnum, adaptive: bool) -> int:
+    # chunks must fit the largest encoding the connection may switch to
+    if adaptive:
+        return min(codec.payload_size for codec in CODECS.values())
+
+    return CODECS[codec_id].payload_size
+
+class CodecState:
+    # per peer codec and what has been observed on packets received from it
+    codec: Codec
+    adaptive: bool
+    packets: int
+    corrected_errors: int
+    checksum_failures: int
+    window: Deque[Tuple[int, bool]]
+
+    def __init__(self, codec_id: CodecEnum = DEFAULT_CODEC, adaptive: bool = False) -> None:
+        self.codec = get_codec(codec_id)
+        self.adaptive = adaptive
+        self.packets = 0
+        self.corrected_errors = 0
+        self.checksum_failures = 0
+        self.window = deque(maxlen=ADAPTIVE_CODEC_WINDOW)
+
+    def record(self, corrected_errors: int, valid: bool) -> None:
+        self.packets += 1
+        self.corrected_errors += corrected_errors
+        if not valid:
+            self.checksum_failures += 1
+
+        self.window.append((corrected_errors, valid))
+
+        if self.adaptive:
+            self._adapt()
+
+    def _adapt(self) -> None:
+        # what arrives from the peer is used as a proxy for the quality of the
+        # path towards it, the peer decodes whatever codec we pick by fallback
+        if len(self.window) < ADAPTIVE_CODEC_WINDOW:
+            return
+
+        failures = sum(1 for (_, valid) in self.window if not valid)
+        corrected = sum(corrected for (corrected, _) in self.window)
+
+        if self.codec.codec_id == CodecEnum.NONE and failures / len(self.window) > ADAPTIVE_CODEC_MAX_FAILURE_RATE:
+            self._switch(CodecEnum.HAMMING, f"{failures} checksum failures in the last {len(self.window)} packets")
+        elif self.codec.codec_id == CodecEnum.HAMMING and failures == 0 and corrected == 0:
+            self._switch(CodecEnum.NONE, f"no bit errors in the last {len(self.window)} packets")
+
+    def _switch(self, codec_id: CodecEnum, reason: str) -> None:
+        logging.info(f"Switching codec from {self.codec} to {get_codec(codec_id)}: {reason}")
+        self.codec = get_codec(codec_id)
+        self.window.clear()
@@ -0,0 +1,216 @@
+import logging
+import lzma
+import zlib
+from time import perf_counter
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+from .constants import CompressionEnum, COMPRESSION_PROBE_SIZE, COMPRESSION_PROBE_RATIO, COMPRESSION_ADAPT_CHUNKS
+from .delta import SignaturePayload
+from .file import FilePayload
+from .hamming import Buffer
+from .manifest import TreePayload
+from .segment import Segment
+
+# with compression on, every data payload starts with the CompressionEnum it was sent with,
+# NONE when the chunk did not get smaller
+METHOD_SIZE = 1
+# (lowest, default, highest) level of every method
+LEVELS = {
+    CompressionEnum.ZLIB: (1, 6, 9),
+    CompressionEnum.LZMA: (0, 2, 9),
+}
+# incompressible chunks in a row before probing backs off, and the longest stretch skipped
+PROBE_BACKOFF_AFTER = 4
+MAX_PROBE_SKIP = 64
+
+def parse_compression(names: str) -> List[CompressionEnum]:
+    # comma separated list from the command line, e.g. "zlib,lzma"
+    methods = []
+    for name in names.split(","):
+        name = name.strip().upper()
+        if name not in CompressionEnum.__members__:
+            raise ValueError(f"Unknown compression {name.lower()}, expected one of {', '.join(c.name.lower() for c in CompressionEnum)}")
+        methods.append(CompressionEnum[name])
+
+    return methods
+
+def choose_compression(offered: Iterable[CompressionEnum], allowed: Iterable[CompressionEnum]) -> CompressionEnum:
+    allowed = list(allowed)
+    for method in offered:
+        if method in allowed:
+            return method
+
+    return CompressionEnum.NONE
+
+def compress(method: CompressionEnum, data: Buffer, level: int) -> bytes:
+    if method == CompressionEnum.ZLIB:
+        return zlib.compress(data, level)
+
+    return lzma.compress(data, format=lzma.FORMAT_ALONE, preset=level)
+
+def decompress(data: Buffer) -> bytes:
+    # a payload as Compressor.compress made it
+    view = memoryview(data)
+    method = view[0]
+
+    if method == int(CompressionEnum.NONE):
+        return bytes(view[METHOD_SIZE:])
+    if method == int(CompressionEnum.ZLIB):
+        return zlib.decompress(view[METHOD_SIZE:])
+    if method == int(CompressionEnum.LZMA):
+        return lzma.decompress(view[METHOD_SIZE:], format=lzma.FORMAT_ALONE)
+
+    raise Exception(f"Unknown compression method {method}")
+
+class Compressor:
+    # per connection: skips data that does not compress and picks the level from how fast
+    # compression runs against how fast the link drains
+    method: CompressionEnum
+    level: int
+    # bytes per second the link takes, None until it is known
+    link_rate: Callable[[], Optional[float]]
+    # chunks left to send raw without probing after a run of incompressible ones
+    probe_skip: int
+    incompressible_run: int
+    backoff: int
+    raw_bytes: int
+    compressed_bytes: int
+    compression_time: float
+    chunks_compressed: int
+    chunks_skipped: int
+    # since the last level change
+    window_bytes: int
+    window_time: float
+    window_chunks: int
+
+    def __init__(self, method: CompressionEnum, link_rate: Callable[[], Optional[float]] = lambda: None) -> None:
+        self.method = method
+        self.level = LEVELS[method][1]
+        self.link_rate = link_rate
+        self.probe_skip = 0
+        self.incompressible_run = 0
+        self.backoff = PROBE_BACKOFF_AFTER
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compression_time = 0
+        self.chunks_compressed = 0
+        self.chunks_skipped = 0
+        self.window_bytes = 0
+        self.window_time = 0
+        self.window_chunks = 0
+
+    def compress(self, data: Buffer) -> bytes:
+        start = perf_counter()
+        result = self._compress(data)
+        elapsed = perf_counter() - start
+
+        self.raw_bytes += len(data)
+        self.compressed_bytes += len(result)
+        self.compression_time += elapsed
+
+        return result
+
+    def _compress(self, data: Buffer) -> bytes:
+        raw = bytes([int(CompressionEnum.NONE)]) + bytes(data)
+
+        if self.probe_skip > 0:
+            self.probe_skip -= 1
+            self.chunks_skipped += 1
+            return raw
+
+        # compressed, encrypted and media data is caught by a cheap look at the start of the chunk
+        probe = memoryview(data)[:COMPRESSION_PROBE_SIZE]
+        if len(zlib.compress(probe, 1)) > len(probe) * COMPRESSION_PROBE_RATIO:
+            self._incompressible()
+            return raw
+
+        start = perf_counter()
+        compressed = compress(self.method, data, self.level)
+        self._adapt(len(data), perf_counter() - start)
+
+        if len(compressed) >= len(data):
+            self._incompressible()
+            return raw
+
+        self.incompressible_run = 0
+        self.backoff = PROBE_BACKOFF_AFTER
+        self.chunks_compressed += 1
+
+        return bytes([int(self.method)]) + compressed
+
+    def _incompressible(self) -> None:
+        self.chunks_skipped += 1
+        self.incompressible_run += 1
+        if self.incompressible_run >= self.backoff:
+            # the rest of the file is likely the same, probe again less and less often
+            self.probe_skip = self.backoff
+            self.backoff = min(self.backoff * 2, MAX_PROBE_SKIP)
+            self.incompressible_run = 0
+
+    def _adapt(self, length: int, elapsed: float) -> None:
+        self.window_bytes += length
+        self.window_time += elapsed
+        self.window_chunks += 1
+        if self.window_chunks < COMPRESSION_ADAPT_CHUNKS:
+            return
+
+        speed = self.window_bytes / max(self.window_time, 1e-9)
+        link = self.link_rate()
+        (lowest, _, highest) = LEVELS[self.method]
+        self.window_bytes = 0
+        self.window_time = 0
+        self.window_chunks = 0
+        if not link:
+            return
+
+        # compression runs before every send, it must stay well ahead of the link
+        if speed < 2 * link and self.level > lowest:
+            self.level -= 1
+            logging.info(f"Compression at {speed / 1e6:.1f} MB/s against a {link / 1e6:.1f} MB/s link, {self.method.name.lower()} level {self.level}")
+        elif speed > 8 * link and self.level < highest:
+            self.level += 1
+            logging.info(f"Compression at {speed / 1e6:.1f} MB/s against a {link / 1e6:.1f} MB/s link, {self.method.name.lower()} level {self.level}")
+
+    @property
+    def ratio(self) -> float:
+        return self.compressed_bytes / self.raw_bytes if self.raw_bytes else 1.0
+
+    def __str__(self) -> str:
+        return (f"{self.method.name.lower()} level {self.level}, {self.raw_bytes} bytes to {self.compressed_bytes} ({self.ratio:.1%}) "
+                f"in {self.compression_time:.2f}s, {self.chunks_compressed} chunks compressed, {self.chunks_skipped} sent raw")
+
+class CompressedPayload:
+    # wraps a payload, every data chunk is compressed when it is read. The metadata chunk
+    # and the chunk numbering stay those of the wrapped payload
+    payload: Union[FilePayload, TreePayload, SignaturePayload]
+    compressor: Compressor
+    path: str
+    chunk_size: int
+    filesize: int
+    total_chunk: int
+    key: Tuple[str, int, int, int, int]
+
+    def __init__(self, payload: Union[FilePayload, TreePayload, SignaturePayload], compressor: Compressor) -> None:
+        self.payload = payload
+        self.compressor = compressor
+        self.path = payload.path
+        self.chunk_size = payload.chunk_size
+        self.filesize = payload.filesize
+        self.total_chunk = payload.total_chunk
+        # the bytes of a chunk depend on the level and probing state of this connection, the
+        # key never names them in the segment cache and these payloads bypass it
+        (path, *rest) = payload.key
+        self.key = (f"{path}#{compressor.method.name.lower()}", *rest)
+
+    def get_chunk(self, chunk_number: int) -> Union[bytes, memoryview]:
+        chunk = self.payload.get_chunk(chunk_number)
+        if chunk_number < 1:
+            return chunk
+
+        return self.compressor.compress(chunk)
+
+    def get_segment(self, segment_number: int) -> Segment:
+        return Segment.data_segment(self.get_chunk(segment_number))
+
+    def close(self):
+        self.payload.close()
@@ -0,0 +1,131 @@
+import logging
+from time import monotonic
+from typing import Dict, Type
+
+from .constants import INITIAL_CWND, MAX_CWND
+
+class CongestionControl:
+    # window counted in segments, fractional growth is kept in cwnd
+    name: str = ""
+    cwnd: float
+    ssthresh: float
+
+    def __init__(self) -> None:
+        self.cwnd = INITIAL_CWND
+        self.ssthresh = MAX_CWND
+
+    @property
+    def window(self) -> int:
+        return max(1, min(int(self.cwnd), MAX_CWND))
+
+    def on_ack(self, acked: int, srtt: float) -> None:
+        raise NotImplementedError("on_ack is an abstract function that need to be implemented")
+
+    def on_timeout(self, in_flight: int) -> None:
+        # a retransmission timeout means the pipe drained, restart from one segment
+        self.ssthresh = max(in_flight / 2, 2)
+        self.cwnd = 1
+        logging.info(f"[{self.name}] timeout, ssthresh {self.ssthresh:.1f}, cwnd {self.cwnd:.1f}")
+
+    def on_fast_loss(self, in_flight: int) -> None:
+        # loss inferred from duplicate acks or sack, the pipe is still flowing so only halve
+        self.ssthresh = max(in_flight / 2, 2)
+        self.cwnd = self.ssthresh
+        logging.info(f"[{self.name}] fast retransmit, ssthresh {self.ssthresh:.1f}, cwnd {self.cwnd:.1f}")
+
+    def __str__(self) -> str:
+        return f"{self.name} cwnd {self.cwnd:.1f} ssthresh {self.ssthresh:.1f}"
+
+class FixedWindow(CongestionControl):
+    # the original behaviour, a constant number of segments in flight
+    name = "fixed"
+
+    def on_ack(self, acked: int, srtt: float) -> None:
+        pass
+
+    def on_timeout(self, in_flight: int) -> None:
+        pass
+
+    def on_fast_loss(self, in_flight: int) -> None:
+        pass
+
+class Reno(CongestionControl):
+    name = "reno"
+
+    def on_ack(self, acked: int, srtt: float) -> None:
+        for _ in range(acked):
+            if self.cwnd < self.ssthresh:
+                # slow start, one segment per acked segment
+                self.cwnd += 1
+            else:
+                # congestion avoidance, one segment per window
+                self.cwnd += 1 / self.cwnd
+
+        self.cwnd = min(self.cwnd, MAX_CWND)
+
+class Cubic(CongestionControl):
+    # window grows as a cubic function of the time since the last loss
+    name = "cubic"
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start = 0.0
+        self.w_est = 0.0
+
+    def on_ack(self, acked: int, srtt: float) -> None:
+        if self.cwnd < self.ssthresh:
+            self.cwnd = min(self.cwnd + acked, MAX_CWND)
+            return
+
+        now = monotonic()
+        if self.epoch_start == 0:
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1 / 3)
+            else:
+                self.k = 0
+                self.w_max = self.cwnd
+            self.w_est = self.cwnd
+
+        t = now - self.epoch_start + srtt
+        target = self.C * (t - self.k) ** 3 + self.w_max
+
+        # reno friendly region, never grow slower than reno would
+        self.w_est += acked * 3 * (1 - self.BETA) / (1 + self.BETA) / self.cwnd
+        target = max(target, self.w_est)
+
+        if target > self.cwnd:
+            self.cwnd += acked * (target - self.cwnd) / self.cwnd
+        else:
+            self.cwnd += acked * 0.01 / self.cwnd
+
+        self.cwnd = min(self.cwnd, MAX_CWND)
+
+    def on_timeout(self, in_flight: int) -> None:
+        self.w_max = max(self.cwnd, in_flight)
+        self.epoch_start = 0
+        self.ssthresh = max(in_flight * self.BETA, 2)
+        self.cwnd = 1
+        logging.info(f"[{self.name}] timeout, ssthresh {self.ssthresh:.1f}, cwnd {self.cwnd:.1f}")
+
+    def on_fast_loss(self, in_flight: int) -> None:
+        self.w_max = max(self.cwnd, in_flight)
+        self.epoch_start = 0
+        self.ssthresh = max(in_flight * self.BETA, 2)
+        self.cwnd = self.ssthresh
+        logging.info(f"[{self.name}] fast retransmit, ssthresh {self.ssthresh:.1f}, cwnd {self.cwnd:.1f}")
+
+CONGESTION_CONTROLS: Dict[str, Type[CongestionControl]] = {
+    FixedWindow.name: FixedWindow,
+    Reno.name: Reno,
+    Cubic.name: Cubic,
+}
+
+DEFAULT_CONGESTION_CONTROL = FixedWindow.name
+
+def create_congestion_control(name: str = DEFAULT_CONGESTION_CONTROL) -> CongestionControl:
+    return CONGESTION_CONTROLS[name]()
@@ -1,11 +1,21 @@
-from socket import socket as Socket, AF_INET, SOCK_DGRAM, timeout as socket_timeout
-from .constants import TIMEOUT, SEGMENT_SIZE
+from socket import socket as Socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF, SO_SNDBUF, SO_REUSEADDR, timeout as socket_timeout
+import select
+import socket
+import struct
+from .constants import TIMEOUT, SEGMENT_SIZE, RECEIVE_BATCH
+from .constants import CodecEnum
 from .segment import Segment, InvalidChecksumException
+from .codec import Codec, CodecState, CODECS, get_codec
+from .hamming import Buffer
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import random
 import logging
 
 class MessageInfo:
+    __slots__ = ("ip", "port", "segment")
+
     ip: str
     port: int
     segment: Segment
@@ -20,39 +30,212 @@ class Connection:
     socket: Socket
     ip: str
     port: int
+    codec_states: Dict[Tuple[str, int], CodecState]
+    # last timeout given to the socket, settimeout is only called when it changes
+    timeout: Optional[float]
+    # receive_batch drains the kernel queue into these before decoding anything
+    buffers: List[memoryview]
+    rcvbuf: Optional[int]
+    # multicast client: a second socket on the group port, receive_batch takes from both
+    group_socket: Optional[Socket]
 
     def __init__(
         self,
         ip: str,
         port: int,
+        reuse_port: bool = False,
+        rcvbuf: Optional[int] = None,
+        sndbuf: Optional[int] = None,
     ) -> None:
         # initialize UDP socket
         self.socket = Socket(AF_INET, SOCK_DGRAM)
+        if reuse_port:
+            # several worker processes bind the same port, the kernel hashes each peer to one of them
+            self.socket.setsockopt(SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if rcvbuf is not None:
+            self.socket.setsockopt(SOL_SOCKET, SO_RCVBUF, rcvbuf)
+        if sndbuf is not None:
+            self.socket.setsockopt(SOL_SOCKET, SO_SNDBUF, sndbuf)
+        if rcvbuf is not None or sndbuf is not None:
+            # the kernel may double or cap the request, e.g. at net.core.rmem_max on linux
+            logging.info(f"Socket buffers: receive {self.socket.getsockopt(SOL_SOCKET, SO_RCVBUF)} bytes, send {self.socket.getsockopt(SOL_SOCKET, SO_SNDBUF)} bytes")
         self.ip = ip
         self.port = port
+        self.codec_states = {}
+        self.timeout = None
+        self.buffers = []
+        self.rcvbuf = rcvbuf
+        self.group_socket = None
 
     def listen(self):
         self.socket.bind((self.ip, self.port))
         logging.info(f"Socket started at {self.ip}:{self.port}")
 
     def close(self):
+        self.leave_group()
         self.socket.close()
 
-    def receive(self, timeout: int = TIMEOUT) -> MessageInfo:
-        self.socket.settimeout(timeout)
+    def join_group(self, group: Tuple[str, int], interface: str) -> None:
+        (address, port) = group
+        group_socket = Socket(AF_INET, SOCK_DGRAM)
+        # every client on the host binds the group port
+        group_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        if self.rcvbuf is not None:
+            group_socket.setsockopt(SOL_SOCKET, SO_RCVBUF, self.rcvbuf)
+        try:
+            # only datagrams of this group, where the platform allows binding a group address
+            group_socket.bind((address, port))
+        except OSError:
+            group_socket.bind(("", port))
+        group_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack("4s4s", socket.inet_aton(address), socket.inet_aton(interface)))
+        group_socket.setblocking(False)
+        self.group_socket = group_socket
+        logging.info(f"Joined multicast group {address}:{port} on {interface}")
+
+    def leave_group(self) -> None:
+        if self.group_socket is not None:
+            self.group_socket.close()
+            self.group_socket = None
+
+    def enable_multicast(self, interface: str) -> None:
+        # datagrams sent to a group leave through interface and stay on the local network,
+        # looped back so clients on this host get them as well
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+    def set_codec(self, ip: str, port: int, codec_id: CodecEnum, adaptive: bool = False) -> None:
+        self.codec_states[(ip, port)] = CodecState(codec_id, adaptive)
+        logging.info(f"Using {get_codec(codec_id)} codec for {ip}:{port}{' (adaptive)' if adaptive else ''}")
+
+    def get_codec(self, ip: str, port: int) -> Codec:
+        state = self.codec_states.get((ip, port))
+
+        return state.codec if state is not None else get_codec()
+
+    def remove_codec(self, ip: str, port: int) -> None:
+        self.codec_states.pop((ip, port), None)
+
+    def receive(self, timeout: float = TIMEOUT) -> MessageInfo:
+        if timeout != self.timeout:
+            self.socket.settimeout(timeout)
+            self.timeout = timeout
         [payload, source] =  self.socket.recvfrom(SEGMENT_SIZE)
+
+        message = self._decode(payload, source)
+        if message is None:
+            raise socket_timeout
+
+        return message
+
+    def receive_batch(self, timeout: float = TIMEOUT, max_batch: int = RECEIVE_BATCH) -> List[MessageInfo]:
+        # waits up to timeout for the first datagram only, then takes whatever else is
+        # already queued without blocking. Every datagram is copied out of the kernel
+        # before the first one is decoded, so a burst does not overflow SO_RCVBUF while
+        # hamming decodes. The pool buffers are reused, decoding always produces new bytes
+        if not self.buffers:
+            self.buffers = [memoryview(bytearray(SEGMENT_SIZE)) for _ in range(RECEIVE_BATCH)]
+
+        received: List[Tuple[memoryview, Tuple[str, int]]] = []
+        if self.group_socket is not None:
+            # wait on both sockets, then take what is queued on either without blocking
+            (readable, _, _) = select.select([self.socket, self.group_socket], [], [], timeout)
+            if not readable:
+                raise socket_timeout
+            if self.timeout != 0:
+                self.socket.settimeout(0)
+                self.timeout = 0
+            buffers = iter(self.buffers[:max_batch])
+            for sock in readable:
+                self._drain(sock, buffers, received)
+        else:
+            if timeout != self.timeout:
+                self.socket.settimeout(timeout)
+                self.timeout = timeout
+
+            for buffer in self.buffers[:max_batch]:
+                try:
+                    (size, source) = self.socket.recvfrom_into(buffer, SEGMENT_SIZE)
+                except BlockingIOError:
+                    break
+                received.append((buffer[:size], source))
+
+                if self.timeout != 0:
+                    self.socket.settimeout(0)
+                    self.timeout = 0
+
+        messages = []
+        for (payload, source) in received:
+            message = self._decode(payload, source)
+            if message is not None:
+                messages.append(message)
+
+        if not messages:
+            raise socket_timeout
+
+        return messages
+
+    @staticmethod
+    def _drain(sock: Socket, buffers: Iterator[memoryview], received: List[Tuple[memoryview, Tuple[str, int]]]) -> None:
+        for buffer in buffers:
+            try:
+                (size, source) = sock.recvfrom_into(buffer, SEGMENT_SIZE)
+            except BlockingIOError:
+                return
+            received.append((buffer[:size], source))
+
+    def _decode(self, payload: Buffer, source: Tuple[str, int]) -> Optional[MessageInfo]:
         [host, port] = source
 
-        try:
-            segment = Segment.from_bytes(payload)
-        except InvalidChecksumException:
+        state = self.codec_states.get((host, port))
+        current = state.codec if state is not None else get_codec()
+        segment = None
+        corrected = 0
+
+        # the peer may have switched codec, the others are only tried when the
+        # current one does not produce a valid segment
+        for codec in [current] + [codec for codec in CODECS.values() if codec is not current]:
+            (decoded, corrected) = codec.decode_with_errors(payload)
+            try:
+                segment = Segment.from_raw_bytes(decoded)
+                break
+            except InvalidChecksumException:
+                continue
+
+        if state is not None:
+            state.record(corrected if segment is not None else 0, segment is not None)
+
+        if segment is None:
             logging.info(f"from {host}:{port} received invalid packet. dropping ...")
-            raise socket_timeout
+            return None
 
         logging.info(f"from {host}:{port} received {segment.flag} packet with seqnum {segment.sequence_number} and ack {segment.ack}")
 
         return MessageInfo(host, port, segment)
     
-    def send(self, message: MessageInfo):
+    def send(self, message: MessageInfo, encoded: Optional[Union[bytes, Sequence[Buffer]]] = None):
+        # encoded can carry the already encoded segment, e.g. from a batch encode, or its
+        # encoded pieces to send as one datagram
         logging.info(f"Sending {message.segment.flag} packet to {message.ip}:{message.port} with seqnum {message.segment.sequence_number} and ack {message.segment.ack}")
-        self.socket.sendto(message.segment.to_bytes(), (message.ip, message.port))
+
+        if encoded is None:
+            codec = self.get_codec(message.ip, message.port)
+            if codec.identity:
+                # nothing to encode, header and payload go out without being joined
+                self._sendmsg([message.segment.pack_header(), message.segment.data], (message.ip, message.port))
+                return
+            encoded = codec.encode(message.segment.to_raw_bytes())
+        elif not isinstance(encoded, bytes):
+            self._sendmsg(encoded, (message.ip, message.port))
+            return
+
+        self._sendto(encoded, (message.ip, message.port))
+
+    def _sendto(self, encoded: bytes, address: Tuple[str, int]):
+        self.socket.sendto(encoded, address)
+
+    def _sendmsg(self, buffers: Sequence[Buffer], address: Tuple[str, int]):
+        if hasattr(self.socket, "sendmsg"):
+            self.socket.sendmsg(buffers, (), 0, address)
+        else:
+            self._sendto(b"".join(buffers), address)
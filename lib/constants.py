@@ -4,10 +4,80 @@ DEFAULT_IP = "127.0.0.1"
 DEFAULT_CLIENT_PORT = 3000
 DEFAULT_BROADCAST_PORT = 8000
 TIMEOUT = 5
-HEADER_SIZE = 12
+# seconds the client lingers after its last ACK in case the FIN-ACK is retransmitted
+TIME_WAIT = 10
+MAX_RETRY = 10
+# half-open handshakes the server keeps, each one dropped PENDING_TIMEOUT seconds after its SYN
+MAX_PENDING = 1024
+PENDING_TIMEOUT = TIMEOUT * MAX_RETRY
+# SYN cookies: the time part changes every SYN_COOKIE_SLOT seconds and a cookie is accepted
+# for SYN_COOKIE_SLOTS of them
+SYN_COOKIE_SLOT = TIMEOUT
+SYN_COOKIE_SLOTS = MAX_RETRY
+# retransmission timeout bounds in seconds, the actual value follows the measured RTT
+INITIAL_RTO = 1
+MIN_RTO = 0.2
+MAX_RTO = 60
+# congestion window bounds in segments
+INITIAL_CWND = 4
+MAX_CWND = 256
+# duplicate acks, or segments sacked above a hole, that mark the hole as lost
+DUPLICATE_ACK_THRESHOLD = 3
+# lower bound of the tail loss probe timeout in seconds, the probe fires after two srtt
+MIN_PROBE_TIMEOUT = 0.01
+# out-of-order segments the receiver keeps while waiting for a gap to fill
+RECEIVE_WINDOW = 256
+# the receiver acks every ACK_EVERY in-order segments, or ACK_DELAY seconds after an unacked one
+ACK_EVERY = 2
+ACK_DELAY = 0.02
+# selective ack blocks reported in a single ACK
+MAX_SACK_BLOCKS = 16
+# largest single write of adjacent chunks on the receiver, and the bytes between two
+# fdatasync calls with the interval fsync policy
+COALESCE_BYTES = 1024 * 1024
+FSYNC_INTERVAL_BYTES = 8 * 1024 * 1024
+# bytes written between two saves of the resume journal, and the chunk ranges a client
+# may ask to skip in its SYN
+JOURNAL_INTERVAL_BYTES = 8 * 1024 * 1024
+MAX_RESUME_RANGES = 1024
+# content defined chunks of the delta mode: a boundary where the low DELTA_MASK_BITS of a
+# gear hash are zero, 8 KiB on average, never shorter or longer than these
+DELTA_MIN_CHUNK = 2 * 1024
+DELTA_MASK_BITS = 13
+DELTA_MAX_CHUNK = 64 * 1024
+# compression: bytes of a chunk compressed at the fastest level to tell whether it is worth
+# it, the largest compressed/raw ratio that still is, and the chunks between level changes
+COMPRESSION_PROBE_SIZE = 4096
+COMPRESSION_PROBE_RATIO = 0.9
+COMPRESSION_ADAPT_CHUNKS = 16
+# multicast: seconds a client waits on a new gap before its NAK and between two NAKs of
+# the same gap. The server waits MULTICAST_REPAIR_DELAY for the NAKs of other members before
+# a repair and ignores NAKs for a segment repaired less than the holdoff ago
+MULTICAST_NAK_DELAY = 0.005
+MULTICAST_NAK_INTERVAL = 0.05
+MULTICAST_REPAIR_DELAY = 0.01
+MULTICAST_REPAIR_HOLDOFF = 0.02
+# segments the group may take in one burst, default rate in MB/s and the lowest fraction of
+# it the rate backs off to while NAKs report loss
+MULTICAST_BURST = 4
+MULTICAST_RATE = 20
+MULTICAST_MIN_RATE_FRACTION = 1 / 16
+# missing ranges reported in a single NAK
+MAX_NAK_RANGES = 64
+# bytes of encoded payloads the server keeps for every sender in the process
+SEGMENT_CACHE_SIZE = 64 * 1024 * 1024
+# datagrams a single receive_batch call takes from the socket
+RECEIVE_BATCH = 32
+HEADER_SIZE = 14
 SEGMENT_SIZE = 32768
 BUFFER_FOR_HAMMING = 20000
 PAYLOAD_SIZE = SEGMENT_SIZE - HEADER_SIZE - BUFFER_FOR_HAMMING
+RAW_PAYLOAD_SIZE = SEGMENT_SIZE - HEADER_SIZE
+
+# adaptive FEC: decisions are taken over this many received packets
+ADAPTIVE_CODEC_WINDOW = 64
+# switch to hamming when more than this fraction of packets failed the checksum
+ADAPTIVE_CODEC_MAX_FAILURE_RATE = 0.01
 
 class FlagEnum(Enum):
     NO_FLAG: int = 0b0 # type: ignore
@@ -18,4 +88,34 @@ class FlagEnum(Enum):
     FIN_ACK_FLAG: int = FIN_FLAG | ACK_FLAG # type: ignore
 
     def __int__(self) -> int:
-        return self.value
\ No newline at end of file
+        return self.value
+
+class CodecEnum(Enum):
+    NONE: int = 0 # type: ignore
+    HAMMING: int = 1 # type: ignore
+
+    def __int__(self) -> int:
+        return self.value
+
+class CompressionEnum(Enum):
+    NONE: int = 0 # type: ignore
+    ZLIB: int = 1 # type: ignore
+    LZMA: int = 2 # type: ignore
+
+    def __int__(self) -> int:
+        return self.value
+
+class OptionEnum(Enum):
+    CODECS: int = 1 # type: ignore # codecs offered by the client, by preference
+    CODEC: int = 2 # type: ignore # codec chosen by the server
+    ADAPTIVE_CODEC: int = 3 # type: ignore # server may switch codec mid-connection
+    CHUNK_SIZE: int = 4 # type: ignore # file bytes carried by every data segment but the last
+    FILE_ID: int = 5 # type: ignore # identity of the file the server sends
+    RESUME: int = 6 # type: ignore # file id and chunk ranges the client already has
+    SIGNATURES: int = 7 # type: ignore # send chunk signatures of the file instead of the file
+    COMPRESSION: int = 8 # type: ignore # methods offered by the client, or the one chosen by the server
+    MULTICAST: int = 9 # type: ignore # client can join a group, the server answers with the group address
+    STRIPE: int = 10 # type: ignore # index and count of a sub-connection, echoed when the server stripes the file
+
+    def __int__(self) -> int:
+        return self.value
@@ -0,0 +1,273 @@
+import bisect
+import hashlib
+import logging
+import math
+import os
+import random
+import struct
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
+
+from .constants import DELTA_MIN_CHUNK, DELTA_MASK_BITS, DELTA_MAX_CHUNK, PAYLOAD_SIZE
+from .file import MappedFile, create_file, pwrite_all
+from .hamming import Buffer
+from .segment import Segment
+
+# first field of the metadata segment, next to the file metadata and MANIFEST_MARKER
+SIGNATURE_MARKER = 0xFFFFFFFE
+# marker, signature bytes, size of the file, signature count, file name length
+SIGNATURE_HEADER_STRUCT = struct.Struct("<IQQIH")
+# length of the chunk and a digest of its content, chunks follow each other from offset 0
+SIGNATURE_STRUCT = struct.Struct("<I8s")
+DIGEST_SIZE = 8
+# signature lists the server keeps, by file identity
+SIGNATURE_CACHE_ENTRIES = 8
+
+_random = random.Random(0x6765_6172)
+GEAR = [_random.getrandbits(32) for _ in range(256)]
+del _random
+MASK = (1 << DELTA_MASK_BITS) - 1
+# the masked gear hash only depends on the last DELTA_MASK_BITS bytes
+WINDOW = DELTA_MASK_BITS
+
+# optional numpy acceleration of the hash over a whole file, the pure python loop
+# is used when numpy is not installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if np is not None:
+    GEAR_ARRAY = np.array(GEAR, dtype=np.uint32) & MASK
+    # bytes hashed per numpy pass
+    HASH_BLOCK = 8 * 1024 * 1024
+
+def _candidates(data: Buffer) -> List[int]:
+    # every position the hash allows a boundary after, numpy only
+    assert np is not None
+    array = np.frombuffer(data, dtype=np.uint8)
+    result = []
+
+    for start in range(0, len(array), HASH_BLOCK):
+        # WINDOW - 1 bytes of the previous block warm the hash up
+        begin = max(0, start - WINDOW + 1)
+        gears = GEAR_ARRAY[array[begin:start + HASH_BLOCK]]
+        hashes = gears.copy()
+        for shift in range(1, WINDOW):
+            hashes[shift:] += gears[:-shift] << shift
+        hashes &= MASK
+
+        positions = np.flatnonzero(hashes[start - begin:] == 0) + start
+        result.append(positions[positions >= WINDOW - 1])
+
+    return np.concatenate(result).tolist() if result else []
+
+def content_chunks(data: Buffer) -> List[int]:
+    # end offset of every content defined chunk. A boundary depends on the bytes right
+    # before it only, an insertion moves the chunks after it instead of changing them
+    size = len(data)
+    ends: List[int] = []
+    start = 0
+
+    if np is not None:
+        candidates = _candidates(data)
+        while start < size:
+            index = bisect.bisect_left(candidates, start + DELTA_MIN_CHUNK - 1)
+            end = candidates[index] + 1 if index < len(candidates) else size
+            end = min(end, start + DELTA_MAX_CHUNK, size)
+            ends.append(end)
+            start = end
+
+        return ends
+
+    view = memoryview(data).cast("B")
+    while start < size:
+        end = min(start + DELTA_MAX_CHUNK, size)
+        position = start + DELTA_MIN_CHUNK - 1
+        hash_value = 0
+        for offset in range(max(start, position - WINDOW + 1), min(position, end)):
+            hash_value = ((hash_value << 1) + GEAR[view[offset]]) & MASK
+
+        while position < end:
+            hash_value = ((hash_value << 1) + GEAR[view[position]]) & MASK
+            if hash_value == 0:
+                end = position + 1
+                break
+            position += 1
+
+        ends.append(end)
+        start = end
+
+    return ends
+
+def signatures(data: Buffer) -> List[Tuple[int, bytes]]:
+    # (length, digest) of every content defined chunk
+    view = memoryview(data)
+    result = []
+    start = 0
+
+    for end in content_chunks(data):
+        result.append((end - start, hashlib.blake2b(view[start:end], digest_size=DIGEST_SIZE).digest()))
+        start = end
+
+    return result
+
+def file_signatures(path: str) -> List[Tuple[int, bytes]]:
+    if os.path.getsize(path) == 0:
+        return []
+
+    mapped = MappedFile.acquire(path)
+    try:
+        return signatures(mapped.view)
+    finally:
+        mapped.release()
+
+class SignatureHeader:
+    # carried by the metadata segment when the server sends signatures instead of the file
+    file_name: str
+    file_size: int
+    signatures_size: int
+    count: int
+
+    def __init__(self, file_name: str, file_size: int, count: int) -> None:
+        self.file_name = file_name
+        self.file_size = file_size
+        self.count = count
+        self.signatures_size = count * SIGNATURE_STRUCT.size
+
+    def to_bytes(self) -> bytes:
+        name = self.file_name.encode("utf-8")
+
+        return SIGNATURE_HEADER_STRUCT.pack(SIGNATURE_MARKER, self.signatures_size, self.file_size, self.count, len(name)) + name
+
+    @staticmethod
+    def is_signatures(src: Union[bytes, memoryview]) -> bool:
+        return len(src) >= SIGNATURE_HEADER_STRUCT.size and struct.unpack_from("<I", src)[0] == SIGNATURE_MARKER
+
+    @staticmethod
+    def from_bytes(src: Union[bytes, memoryview]) -> 'SignatureHeader':
+        src = bytes(src)
+        (_, signatures_size, file_size, count, name_length) = SIGNATURE_HEADER_STRUCT.unpack_from(src)
+        file_name = src[SIGNATURE_HEADER_STRUCT.size:SIGNATURE_HEADER_STRUCT.size + name_length].decode("utf-8")
+        if not file_name or file_name in (".", "..") or "/" in file_name or os.sep in file_name:
+            raise NameError(f"Invalid file name {file_name!r}")
+        if signatures_size != count * SIGNATURE_STRUCT.size:
+            raise Exception(f"{count} signatures do not take {signatures_size} bytes")
+
+        return SignatureHeader(file_name, file_size, count)
+
+class SignatureCache:
+    # computing the signatures reads the whole file, every delta client of the same file shares them
+    entries: 'OrderedDict[bytes, bytes]'
+
+    def __init__(self) -> None:
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, identity: bytes, path: str) -> bytes:
+        with self.lock:
+            encoded = self.entries.get(identity)
+            if encoded is not None:
+                self.entries.move_to_end(identity)
+                return encoded
+
+        encoded = b"".join(SIGNATURE_STRUCT.pack(length, digest) for (length, digest) in file_signatures(path))
+
+        with self.lock:
+            self.entries[identity] = encoded
+            while len(self.entries) > SIGNATURE_CACHE_ENTRIES:
+                self.entries.popitem(last=False)
+
+        return encoded
+
+signature_cache = SignatureCache()
+
+class SignaturePayload:
+    # FilePayload for the signature list of a file, what a delta client asks for first
+    path: str
+    chunk_size: int
+    filesize: int
+    total_chunk: int
+    key: Tuple[str, int, int, int, int]
+    header: SignatureHeader
+    encoded: bytes
+
+    def __init__(self, path: str, identity: bytes, chunk_size: int = PAYLOAD_SIZE) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.encoded = signature_cache.get(identity, path)
+        stats = os.stat(path)
+        self.header = SignatureHeader(os.path.basename(path), stats.st_size, len(self.encoded) // SIGNATURE_STRUCT.size)
+        self.filesize = len(self.encoded)
+        self.total_chunk = math.ceil(self.filesize / self.chunk_size)
+        self.key = (os.path.realpath(path) + "#signatures", stats.st_dev, stats.st_ino, self.filesize, stats.st_mtime_ns)
+
+        logging.info(f"Sending {self.header.count} signatures of {path} instead of its {stats.st_size} bytes")
+
+    def get_chunk(self, chunk_number: int) -> Union[bytes, memoryview]:
+        if chunk_number < 1:
+            return self.header.to_bytes()
+
+        if chunk_number > self.total_chunk:
+            raise Exception("Invalid chunk number")
+
+        offset = (chunk_number - 1) * self.chunk_size
+
+        return memoryview(self.encoded)[offset:offset + self.chunk_size]
+
+    def get_segment(self, segment_number: int) -> Segment:
+        return Segment.data_segment(self.get_chunk(segment_number))
+
+    def close(self):
+        pass
+
+def rebuild(header: SignatureHeader, encoded: bytes, old_path: str, directory: str, chunk_size: int) -> Tuple[bytearray, int]:
+    # writes directory/file_name with every chunk of the new file found in the old copy,
+    # returns the bitmap of the chunk_size pieces it completes and the bytes copied
+    old_chunks = {}
+    old_mapped = MappedFile.acquire(old_path) if os.path.getsize(old_path) > 0 else None
+    old_view = old_mapped.view if old_mapped is not None else memoryview(b"")
+
+    offset = 0
+    for (length, digest) in signatures(old_view):
+        old_chunks.setdefault(digest, (offset, length))
+        offset += length
+
+    # the old copy may be the file being replaced, it is read until the rename
+    temporary = os.path.join(directory, f".{header.file_name}.delta")
+    fd = create_file(temporary, header.file_size)
+    runs: List[Tuple[int, int]] = []
+    copied = 0
+    offset = 0
+
+    try:
+        for (length, digest) in SIGNATURE_STRUCT.iter_unpack(encoded):
+            match = old_chunks.get(digest)
+            if match is not None and match[1] == length:
+                pwrite_all(fd, old_view[match[0]:match[0] + length], offset)
+                copied += length
+                if runs and runs[-1][1] == offset:
+                    runs[-1] = (runs[-1][0], offset + length)
+                else:
+                    runs.append((offset, offset + length))
+            offset += length
+    finally:
+        os.close(fd)
+        if old_mapped is not None:
+            old_view = memoryview(b"")
+            old_mapped.release()
+
+    if offset != header.file_size:
+        os.remove(temporary)
+        raise Exception(f"Signatures cover {offset} bytes, the file has {header.file_size}")
+    os.replace(temporary, os.path.join(directory, header.file_name))
+
+    # only pieces copied whole can be skipped, the rest is sent again
+    bitmap = bytearray((math.ceil(header.file_size / chunk_size) + 7) // 8)
+    for (start, end) in runs:
+        last = end // chunk_size if end < header.file_size else math.ceil(end / chunk_size)
+        for chunk in range(math.ceil(start / chunk_size), last):
+            bitmap[chunk >> 3] |= 1 << (chunk & 7)
+
+    return (bitmap, copied)
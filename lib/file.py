@@ -1,31 +1,112 @@
 import os
+import hashlib
 import math
-from io import BufferedReader, BufferedWriter
-from .constants import PAYLOAD_SIZE
+import mmap
+import stat
+import threading
+from collections import deque
+from io import BufferedReader
+from .constants import PAYLOAD_SIZE, COALESCE_BYTES, FSYNC_INTERVAL_BYTES, JOURNAL_INTERVAL_BYTES
 from .segment import Segment
 from .metadata import Metadata
+from .journal import Journal
 import logging
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+class MappedFile:
+    # one read-only mapping per file, shared by every FilePayload serving it
+    path: str
+    identity: Tuple[int, int, int, int]
+    mapping: mmap.mmap
+    view: memoryview
+    users: int
+
+    registry: Dict[str, 'MappedFile'] = {}
+    lock = threading.Lock()
+
+    def __init__(self, path: str, identity: Tuple[int, int, int, int]) -> None:
+        self.path = path
+        self.identity = identity
+        self.users = 0
+
+        with open(path, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            # the mapping keeps its own reference to the file, the descriptor can go
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if hasattr(self.mapping, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.mapping.madvise(mmap.MADV_SEQUENTIAL)
+        self.view = memoryview(self.mapping)
+
+    @staticmethod
+    def acquire(path: str) -> 'MappedFile':
+        # a file replaced or modified since it was mapped gets a new mapping
+        stats = os.stat(path)
+        key = os.path.realpath(path)
+        identity = (stats.st_dev, stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+        with MappedFile.lock:
+            mapped = MappedFile.registry.get(key)
+            if mapped is None or mapped.identity != identity:
+                mapped = MappedFile(key, identity)
+                MappedFile.registry[key] = mapped
+            mapped.users += 1
+
+        return mapped
+
+    def release(self) -> None:
+        with MappedFile.lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if MappedFile.registry.get(self.path) is self:
+                del MappedFile.registry[self.path]
+
+        self.view.release()
+        try:
+            self.mapping.close()
+        except BufferError:
+            # chunks still referenced by segments in flight, the mapping goes with the last of them
+            pass
 
 class FilePayload:
     path: str
     chunk_size: int
     filesize: int
     total_chunk: int
-    fd: BufferedReader
+    # identifies the file content, a modified file gets a new key
+    key: Tuple[str, int, int, int, int]
+    # chunks are slices of a shared mapping, or read from fd when the file can not be mapped
+    mapped: Optional[MappedFile]
+    fd: Optional[BufferedReader]
     
-    def __init__(self, path: str, chunk_size: int = PAYLOAD_SIZE):
+    def __init__(self, path: str, chunk_size: int = PAYLOAD_SIZE, use_mmap: bool = True):
         try:
             self.path = path
             self.chunk_size = chunk_size
             stats = os.stat(path)
             self.filesize = stats.st_size
             self.total_chunk = math.ceil(self.filesize/self.chunk_size)
-            self.fd = open(self.path, "rb")
+            self.key = (os.path.realpath(path), stats.st_dev, stats.st_ino, stats.st_size, stats.st_mtime_ns)
         except Exception as e:
             print(e)
             raise Exception("File not found")
 
-    def get_chunk(self, chunk_number: int) -> bytes:
+        self.mapped = None
+        self.fd = None
+
+        try:
+            # empty files, pipes and character devices can not be mapped
+            if use_mmap and self.filesize > 0 and stat.S_ISREG(stats.st_mode):
+                self.mapped = MappedFile.acquire(path)
+        except (OSError, ValueError) as e:
+            logging.info(f"Can not map {path} ({e}), using buffered reads")
+
+        if self.mapped is None:
+            self.fd = open(self.path, "rb")
+
+    def get_chunk(self, chunk_number: int) -> Union[bytes, memoryview]:
         if (chunk_number < 1):
             return Metadata(self.path, self.filesize).to_bytes()
         
@@ -33,6 +114,12 @@ class FilePayload:
             raise Exception("Invalid chunk number")
         
         offset = (chunk_number - 1) * self.chunk_size
+
+        if self.mapped is not None:
+            # no copy, the segment keeps a view of the page cache
+            return self.mapped.view[offset:offset + self.chunk_size]
+
+        assert self.fd is not None
         self.fd.seek(offset)
 
         return self.fd.read(self.chunk_size)
@@ -41,39 +128,303 @@ class FilePayload:
         return Segment.data_segment(self.get_chunk(segment_number))
     
     def close(self):
-        if (not self.fd.closed):
+        if self.mapped is not None:
+            self.mapped.release()
+            self.mapped = None
+        if self.fd is not None and not self.fd.closed:
             self.fd.close()
 
+FSYNC_NONE = "none"
+FSYNC_END = "end"
+FSYNC_INTERVAL = "interval"
+# none leaves flushing to the OS, end syncs once the file is complete,
+# interval also syncs after every FSYNC_INTERVAL_BYTES written
+FSYNC_POLICIES = [FSYNC_NONE, FSYNC_END, FSYNC_INTERVAL]
+
+def file_identity(path: str) -> Optional[bytes]:
+    # the same while the file is not replaced or modified, also across server restarts.
+    # Directories have none
+    try:
+        stats = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(stats.st_mode):
+        return None
+
+    key = (os.path.realpath(path), stats.st_dev, stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+    return hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+
+def create_file(path: str, size: int, truncate: bool = True) -> int:
+    # truncated, with the whole size reserved up front so out of order writes land inside it
+    # and it is not fragmented. A resumed file keeps its content
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    if truncate:
+        flags |= os.O_TRUNC
+    fd = os.open(path, flags, 0o644)
+    if size == 0:
+        return fd
+
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return fd
+        except OSError as e:
+            logging.info(f"posix_fallocate on {path} failed ({e}), truncating instead")
+
+    os.ftruncate(fd, size)
+
+    return fd
+
+def pwrite_all(fd: int, data: Union[bytes, memoryview], offset: int) -> int:
+    # returns the number of system calls it took
+    view = memoryview(data)
+    calls = 0
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+        calls += 1
+
+    return calls
+
+def sync_file(fd: int):
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
 class FileBuilder:
     path: str
     filesize: int
+    chunk_size: int
     bytes_written: int
-    fd: BufferedWriter
+    fd: int
+    # writes handed over by queue() and not on disk yet, (offset, data) written by a writer thread
+    pending: Deque[Tuple[int, Union[bytes, memoryview]]]
+    # offset of the next queue() call without one, the end of the highest write so far
+    next_offset: int
+    # one bit per chunk_size piece of the file, set once it is on disk
+    bitmap: bytearray
+    chunks: int
+    chunks_written: int
+    fsync_policy: str
+    unsynced_bytes: int
+    # system calls issued by the writer, adjacent queued chunks share one
+    writes: int
+    on_written: Optional[Callable[[], None]]
+    writer: Optional[threading.Thread]
+    error: Optional[Exception]
+    # [start, end) chunks already in the file from an earlier transfer, kept instead of truncated
+    resumed: List[Tuple[int, int]]
+    # saved every JOURNAL_INTERVAL_BYTES so a transfer started again skips what is on disk
+    journal: Optional[Journal]
+    unjournaled_bytes: int
 
-    def __init__(self, path: str, filesize: int):
+    def __init__(self, path: str, filesize: int, on_written: Optional[Callable[[], None]] = None, chunk_size: int = PAYLOAD_SIZE, fsync_policy: str = FSYNC_NONE, resumed: Sequence[Tuple[int, int]] = (), journal: Optional[Journal] = None):
         self.bytes_written = 0
         self.path = path
         self.filesize = filesize
+        self.chunk_size = chunk_size
+        self.pending = deque()
+        self.next_offset = 0
+        self.chunks = math.ceil(filesize / chunk_size)
+        self.bitmap = bytearray((self.chunks + 7) // 8)
+        self.chunks_written = 0
+        self.fsync_policy = fsync_policy
+        self.unsynced_bytes = 0
+        self.writes = 0
+        self.on_written = on_written
+        self.writer = None
+        self.error = None
+        self.condition = threading.Condition()
+        self.resumed = list(resumed)
+        self.journal = journal
+        self.unjournaled_bytes = 0
+
+        self.fd = -1
+        self._open()
+
+        for (start, end) in self.resumed:
+            self._mark(start * chunk_size, min(end * chunk_size, filesize) - start * chunk_size)
+        if self.resumed:
+            logging.info(f"Resuming {path} with {self.chunks_written} of {self.chunks} chunks already written")
+        if self.journal is not None and not self.is_completed():
+            # a journal left by another file is replaced right away
+            self.journal.save(bytes(self.bitmap))
+
+        if self.is_completed():
+            self._complete()
+
+    def _open(self):
+        self.fd = create_file(self.path, self.filesize, truncate=not self.resumed)
+
+    def write(self, data: Union[bytes, memoryview], offset: Optional[int] = None):
+        # offset is a multiple of chunk_size, None appends after the highest write
+        self._write([data], self._offset(data, offset))
+
+    def queue(self, data: Union[bytes, memoryview], offset: Optional[int] = None):
+        # write behind, the receive loop keeps going while the disk catches up
+        with self.condition:
+            if self.error is not None:
+                raise self.error
+
+            self.pending.append((self._offset(data, offset), data))
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._run, name=f"writer {self.path}", daemon=True)
+                self.writer.start()
+            self.condition.notify()
+
+    def _offset(self, data: Union[bytes, memoryview], offset: Optional[int]) -> int:
+        if offset is None:
+            offset = self.next_offset
+        if offset % self.chunk_size:
+            raise Exception(f"Offset {offset} is not a multiple of the chunk size {self.chunk_size}")
+        if offset + len(data) > self.filesize:
+            raise Exception(f"Written data {offset + len(data)} bytes are more than expected {self.filesize} bytes")
+
+        self.next_offset = max(self.next_offset, offset + len(data))
+
+        return offset
+
+    @property
+    def backlog(self) -> int:
+        return len(self.pending)
+
+    def flush(self):
+        # block until every queued chunk is on disk
+        with self.condition:
+            while self.pending and self.error is None:
+                self.condition.wait()
+
+            if self.error is not None:
+                raise self.error
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                # everything queued so far goes out together, the entries stay in pending
+                # until written so backlog keeps counting them
+                batch = list(self.pending)
+
+            try:
+                for (offset, buffers) in self._coalesce(batch):
+                    self._write(buffers, offset)
+            except Exception as e:
+                logging.info(f"Writing {self.path} failed: {e}")
+                with self.condition:
+                    self.error = e
+                    self.pending.clear()
+                    self.condition.notify_all()
+                return
 
-        self.fd = open(path, "wb")
+            with self.condition:
+                for _ in batch:
+                    self.pending.popleft()
+                self.condition.notify_all()
 
-    def write(self, data: bytes):
-        if self.bytes_written == self.filesize:
+            if self.on_written is not None:
+                self.on_written()
+
+            if self.is_completed():
+                return
+
+    @staticmethod
+    def _coalesce(batch: List[Tuple[int, Union[bytes, memoryview]]]) -> List[Tuple[int, List[Union[bytes, memoryview]]]]:
+        # runs of adjacent chunks become one write of up to COALESCE_BYTES
+        runs: List[Tuple[int, List[Union[bytes, memoryview]]]] = []
+        end = -1
+        size = 0
+
+        for (offset, data) in sorted(batch, key=lambda entry: entry[0]):
+            if offset == end and size + len(data) <= COALESCE_BYTES:
+                runs[-1][1].append(data)
+                size += len(data)
+            else:
+                runs.append((offset, [data]))
+                size = len(data)
+            end = offset + len(data)
+
+        return runs
+
+    def _write(self, buffers: List[Union[bytes, memoryview]], offset: int):
+        if self.is_completed():
             raise Exception("File already written completely")
 
-        self.bytes_written += len(data)
-        self.fd.write(data)
+        length = sum(len(data) for data in buffers)
+        self._pwritev(buffers, offset, length)
 
-        if self.bytes_written > self.filesize:
-            raise Exception(f"Written data {self.bytes_written} bytes are more than expected {self.filesize} bytes")
-        elif self.bytes_written == self.filesize:
-            logging.info("File received successfully")
-            # auto close if file written successfully
-            self.fd.close()
+        self.bytes_written += length
+        self.unsynced_bytes += length
+        self._mark(offset, length)
+
+        if self.fsync_policy == FSYNC_INTERVAL and self.unsynced_bytes >= FSYNC_INTERVAL_BYTES:
+            self._sync()
+
+        if self.is_completed():
+            self._complete()
+        elif self.journal is not None:
+            self.unjournaled_bytes += length
+            if self.unjournaled_bytes >= JOURNAL_INTERVAL_BYTES:
+                self._save_journal()
+
+    def _pwritev(self, buffers: List[Union[bytes, memoryview]], offset: int, length: int):
+        if hasattr(os, "pwritev"):
+            written = os.pwritev(self.fd, buffers, offset)
+            self.writes += 1
+            if written < length:
+                # short write, the rest goes out as one buffer
+                self.writes += pwrite_all(self.fd, b"".join(buffers)[written:], offset + written)
+        else:
+            self.writes += pwrite_all(self.fd, b"".join(buffers), offset)
+
+    def _mark(self, offset: int, length: int):
+        for chunk in range(offset // self.chunk_size, math.ceil((offset + length) / self.chunk_size)):
+            mask = 1 << (chunk & 7)
+            if not self.bitmap[chunk >> 3] & mask:
+                self.bitmap[chunk >> 3] |= mask
+                self.chunks_written += 1
+
+    def has_chunk(self, chunk: int) -> bool:
+        return bool(self.bitmap[chunk >> 3] & (1 << (chunk & 7)))
+
+    def _sync(self):
+        sync_file(self.fd)
+        self.unsynced_bytes = 0
+
+    def _save_journal(self):
+        assert self.journal is not None
+        # the journal never claims chunks that are not synced yet
+        if self.fsync_policy != FSYNC_NONE:
+            self._sync()
+        self.journal.save(bytes(self.bitmap))
+        self.unjournaled_bytes = 0
+
+    def _complete(self):
+        logging.info("File received successfully")
+        if self.fsync_policy != FSYNC_NONE:
+            self._sync()
+        if self.journal is not None:
+            self.journal.remove()
+        # auto close if file written successfully
+        self.close()
 
     def is_completed(self) -> bool:
-        return self.bytes_written == self.filesize
+        return self.chunks_written == self.chunks
+
+    def close(self):
+        if getattr(self, "fd", -1) >= 0:
+            # stopped before the end, keep what was written for the next attempt
+            if self.journal is not None and self.unjournaled_bytes and not self.is_completed():
+                self._save_journal()
+            os.close(self.fd)
+            self.fd = -1
 
     def __del__(self):
-        if (not self.fd.closed):
-            self.fd.close()
\ No newline at end of file
+        self.close()
@@ -1,137 +1,190 @@
-import logging
-from random import Random
-from functools import reduce
+from typing import List, Sequence, Tuple, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# hamming(8,4): every nibble becomes one codeword byte, high nibble first.
+# Bit positions are counted from the MSB. Data bits sit at positions 3, 5, 6
+# and 7, parity bits at 1, 2 and 4, and position 0 is always zero. The
+# syndrome is the XOR of the positions of every set bit, which points
+# directly at a single flipped bit.
+
+def _syndrome(codeword: int) -> int:
+    syndrome = 0
+    for position in range(8):
+        if codeword & (0x80 >> position):
+            syndrome ^= position
+
+    return syndrome
+
+def _encode_nibble(nibble: int) -> int:
+    codeword = 0
+    for position, bit in zip((3, 5, 6, 7), (3, 2, 1, 0)):
+        if nibble & (1 << bit):
+            codeword |= 0x80 >> position
+
+    syndrome = _syndrome(codeword)
+    for i in range(3):
+        if syndrome & (1 << i):
+            codeword |= 0x80 >> (1 << i)
+
+    return codeword
+
+def _decode_codeword(codeword: int) -> Tuple[int, bool]:
+    syndrome = _syndrome(codeword)
+    if syndrome != 0:
+        codeword ^= 0x80 >> syndrome
+
+    nibble = 0
+    for position, bit in zip((3, 5, 6, 7), (3, 2, 1, 0)):
+        if codeword & (0x80 >> position):
+            nibble |= 1 << bit
+
+    return nibble, syndrome != 0
+
+ENCODE_TABLE: List[int] = [_encode_nibble(nibble) for nibble in range(16)]
+DECODE_TABLE: List[int] = [_decode_codeword(codeword)[0] for codeword in range(256)]
+ERROR_TABLE: List[bool] = [_decode_codeword(codeword)[1] for codeword in range(256)]
+
+# translation tables so whole payloads go through bytes.translate in C
+ENCODE_HIGH = bytes(ENCODE_TABLE[byte >> 4] for byte in range(256))
+ENCODE_LOW = bytes(ENCODE_TABLE[byte & 0x0F] for byte in range(256))
+DECODE_HIGH = bytes(DECODE_TABLE[codeword] << 4 for codeword in range(256))
+DECODE_LOW = bytes(DECODE_TABLE)
+ERROR_FLAGS = bytes(int(error) for error in ERROR_TABLE)
+
 
 class Hamming:
     # implement hamming(8,4) code
+    error: bool
+    corrected_errors: int
+
     def __init__(self):
         self.error = False
-        self.error_bit = 0
-
-    def bytes_to_bits(self, data: bytes) -> str:
-        bits = [bin(byte)[2:].zfill(8) for byte in data]
-    
-        bit_string = ''.join(bits)
-    
-        return bit_string
-    
-    def bits_to_bytes(self, bit_string: str) -> bytes:
-        chunks = [bit_string[i:i+8] for i in range(0, len(bit_string), 8)]
-    
-        byte_data = bytes([int(chunk, 2) for chunk in chunks])
-    
-        return byte_data
-    
-    def encode(self, data: bytes) -> bytes:
-        bit_string = self.bytes_to_bits(data)
-        encoded_bit_string = self.encode_bits(bit_string)
-        encoded_data = self.bits_to_bytes(encoded_bit_string)
-        return encoded_data
-    
-    def encode_bits(self, bit_string: str) -> str:
-        chunks = [bit_string[i:i+4] for i in range(0, len(bit_string), 4)]
-    
-        encoded_chunks = [self.encode_chunk(chunk) for chunk in chunks]
-    
-        encoded_bit_string = ''.join(encoded_chunks)
-        return encoded_bit_string
-    
-    def encode_chunk_alternative(self, chunk: str) -> str:
-        p1 = self.parity(chunk, [0, 1, 3])
-        p2 = self.parity(chunk, [0, 2, 3])
-        p3 = self.parity(chunk, [1, 2, 3])
-    
-        return "0" + p1 + p2 + chunk[0] + p3 + chunk[1:]
-    
-    def encode_chunk(self, chunk: str) -> str:
-        eight_bit = self.get_eight_bit(chunk)
-        if eight_bit == "00000000":
-            return eight_bit
-        parity_bit = reduce(lambda x, y: x^y, [i for i, bin in enumerate(eight_bit) if bin == '1'])
-
-        for i in range(0, 3):
-            if parity_bit & (1 << i):
-                eight_bit = eight_bit[:1<<i] + '1' + eight_bit[(1<<i)+1:]
-            else:
-                eight_bit = eight_bit[:1<<i] + '0' + eight_bit[(1<<i)+1:]
-
-        return eight_bit
-    
-    def get_eight_bit(self, bit_string: str) -> str:
-        return "000" + bit_string[0] + "0" + bit_string[1] + bit_string[2] + bit_string[3]
-    
-    def parity(self, bit_string: str, indices: list) -> str:
-        parity_bit = str(sum([int(bit_string[i]) for i in indices]) % 2)
-        return parity_bit
-    
-    def decode(self, data: bytes) -> bytes:
-        bit_string = self.bytes_to_bits(data)
-        decoded_bit_string = self.decode_bits(bit_string)
-        decoded_data = self.bits_to_bytes(decoded_bit_string)
-        return decoded_data
-    
-    def decode_bits(self, bit_string: str) -> str:
-        chunks = [bit_string[i:i+8] for i in range(0, len(bit_string), 8)]
-        decoded_chunks = [self.decode_chunk(chunk) for chunk in chunks]
-        decoded_bit_string = ''.join(decoded_chunks)
-        return decoded_bit_string
-    
-    def decode_chunk_alternative(self, chunk: str) -> str:
-        chunk = chunk[1:]
-        print(f"decode chunk {chunk}")
-        s1 = self.parity(chunk, [0, 2, 4, 6])
-        s2 = self.parity(chunk, [1, 2, 5, 6])
-        s3 = self.parity(chunk, [3, 4, 5, 6])
-        syndrome = int(s3 + s2 + s1, 2)
-        print(f"syndrome {syndrome}")
-        if syndrome != 0:
-            self.error = True
-            self.error_bit_index = syndrome - 1
-            chunk = chunk[:self.error_bit_index] + str(1 - int(chunk[self.error_bit_index])) + chunk[self.error_bit_index+1:]
-    
-        return chunk[2] + chunk[4] + chunk[5] + chunk[6]
-    
-    def decode_chunk(self, chunk: str) -> str:
-        if chunk == "00000000":
-            return "0000"
-        parity_bit = reduce(lambda x, y: x^y, [i for i, bin in enumerate(chunk) if bin == '1'])
-
-        if parity_bit != 0:
-            self.error = True
-            chunk = chunk[:parity_bit] + str(1 - int(chunk[parity_bit])) + chunk[parity_bit+1:]
-            # logging.info(f"Error detected, trying to correct bit")
-
-        return chunk[3] + chunk[5] + chunk[6] + chunk[7]
-
-
-        
-    
-
-# def main():
-#     hamming = Hamming()
-#     data = b"123456789"
-#     # print(f"length {len(data)}")
-#     print(f"original data {data}")
-#     encoded = hamming.encode(data)
-#     # print(f"len encoded {len(encoded)}")
-#     encoded = switch_random_bit(encoded)
-#     # print(f"encoded data {encoded}")
-#     decoded = hamming.decode(encoded)
-#     print(f"decoded data {decoded}")
-#     # print(1 << 7)
-
-# def switch_random_bit(data: bytes) -> bytes:
-#     new_data = b""
-#     for byte in data:
-#         # print(f"byte before{byte}")
-#         # code to change bit
-#         random = Random()
-#         byte = bytes([byte ^ (1 << random.randint(1, 7))])
-#         # print(f"byte after {byte}")
-#         new_data = new_data + byte
-
-#     return new_data
-
-
-# if __name__ == "__main__":
-#     main()
\ No newline at end of file
+        self.corrected_errors = 0
+
+    def encode(self, data: Buffer) -> bytes:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+
+        result = bytearray(len(data) * 2)
+        result[0::2] = data.translate(ENCODE_HIGH)
+        result[1::2] = data.translate(ENCODE_LOW)
+
+        return bytes(result)
+
+    def decode(self, data: Buffer) -> bytes:
+        decoded, corrected = self.decode_with_errors(data)
+        self.corrected_errors = corrected
+        self.error = corrected > 0
+
+        return decoded
+
+    def decode_with_errors(self, data: Buffer) -> Tuple[bytes, int]:
+        # returns the decoded payload and how many codewords had to be corrected
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+
+        length = len(data) // 2
+        if len(data) % 2:
+            # a trailing half codeword can not carry a full byte
+            data = data[:length * 2]
+
+        high = data[0::2].translate(DECODE_HIGH)
+        low = data[1::2].translate(DECODE_LOW)
+
+        # high nibbles are already shifted, OR both halves at once as big integers
+        decoded = (int.from_bytes(high, "big") | int.from_bytes(low, "big")).to_bytes(length, "big")
+        corrected = data.translate(ERROR_FLAGS).count(1)
+
+        return decoded, corrected
+
+    def encode_batch(self, payloads: Union[Sequence[Buffer], "np.ndarray"]) -> Union[List[bytes], "np.ndarray"]:
+        # encode a whole send window at once, a 2-D uint8 array comes back as a 2-D array
+        if np is None:
+            if isinstance(payloads, (bytes, bytearray, memoryview)):
+                raise TypeError("encode_batch expects a sequence of payloads")
+            return [self.encode(payload) for payload in payloads]
+
+        if isinstance(payloads, np.ndarray):
+            return _encode_array(payloads)
+
+        (flat, offsets) = _concat(payloads)
+        encoded = _encode_array(flat[np.newaxis, :])[0]
+
+        return _split(encoded, offsets, 2)
+
+    def decode_batch(self, datagrams: Union[Sequence[Buffer], "np.ndarray"]) -> Union[List[bytes], "np.ndarray"]:
+        (decoded, corrected) = self.decode_batch_with_errors(datagrams)
+        self.corrected_errors = sum(corrected)
+        self.error = self.corrected_errors > 0
+
+        return decoded
+
+    def decode_batch_with_errors(self, datagrams: Union[Sequence[Buffer], "np.ndarray"]) -> Tuple[Union[List[bytes], "np.ndarray"], List[int]]:
+        # returns the decoded payloads and the corrected codeword count of each one
+        if np is None:
+            results = [self.decode_with_errors(datagram) for datagram in datagrams]
+            return [decoded for (decoded, _) in results], [corrected for (_, corrected) in results]
+
+        if isinstance(datagrams, np.ndarray):
+            return _decode_array(datagrams)
+
+        # odd trailing bytes are dropped per datagram, the same as decode_with_errors
+        (flat, offsets) = _concat([datagram[:len(datagram) - len(datagram) % 2] for datagram in datagrams])
+        (decoded, errors) = _decode_array(flat[np.newaxis, :], per_codeword=True)
+        corrected = [int(errors[0, start // 2:end // 2].sum()) for (start, end) in zip(offsets, offsets[1:])]
+
+        return _split(decoded[0], [offset // 2 for offset in offsets], 1), corrected
+
+
+# optional numpy acceleration for whole windows, the pure python path above
+# is used when numpy is not installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if np is not None:
+    # one gather per byte: a byte maps to both of its codewords as a little endian
+    # uint16, and a pair of codewords maps back to the byte and its error count
+    _pairs = np.arange(65536)
+    ENCODE_PAIR_ARRAY = (np.frombuffer(ENCODE_HIGH, dtype=np.uint8).astype(np.uint16)
+                         | (np.frombuffer(ENCODE_LOW, dtype=np.uint8).astype(np.uint16) << 8))
+    DECODE_PAIR_ARRAY = (np.frombuffer(DECODE_HIGH, dtype=np.uint8)[_pairs & 0xFF]
+                         | np.frombuffer(DECODE_LOW, dtype=np.uint8)[_pairs >> 8])
+    ERROR_PAIR_ARRAY = (np.frombuffer(ERROR_FLAGS, dtype=np.uint8)[_pairs & 0xFF]
+                        + np.frombuffer(ERROR_FLAGS, dtype=np.uint8)[_pairs >> 8])
+    del _pairs
+
+def _concat(buffers: Sequence[Buffer]) -> Tuple["np.ndarray", List[int]]:
+    offsets = [0]
+    for buffer in buffers:
+        offsets.append(offsets[-1] + len(buffer))
+
+    return np.frombuffer(b"".join(buffers), dtype=np.uint8), offsets
+
+def _split(array: "np.ndarray", offsets: List[int], scale: int) -> List[bytes]:
+    data = array.tobytes()
+
+    return [data[start * scale:end * scale] for (start, end) in zip(offsets, offsets[1:])]
+
+def _encode_array(payloads: "np.ndarray") -> "np.ndarray":
+    payloads = np.ascontiguousarray(payloads, dtype=np.uint8)
+    if payloads.ndim != 2:
+        raise ValueError("Expected a 2-D array of equally sized payloads")
+
+    return ENCODE_PAIR_ARRAY.take(payloads).astype("<u2", copy=False).view(np.uint8)
+
+def _decode_array(datagrams: "np.ndarray", per_codeword: bool = False):
+    datagrams = np.ascontiguousarray(datagrams, dtype=np.uint8)
+    if datagrams.ndim != 2 or datagrams.shape[1] % 2:
+        raise ValueError("Expected a 2-D array of equally sized, even length datagrams")
+
+    codeword_pairs = datagrams.view("<u2")
+    decoded = DECODE_PAIR_ARRAY.take(codeword_pairs)
+    errors = ERROR_PAIR_ARRAY.take(codeword_pairs)
+
+    if per_codeword:
+        return decoded, errors
+
+    return decoded, [int(count) for count in errors.sum(axis=1)]
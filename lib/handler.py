@@ -1,22 +1,127 @@
 from mimetypes import init
 from .connection import MessageInfo, Connection
 from .segment import FlagEnum
+from .constants import CodecEnum, CompressionEnum, PAYLOAD_SIZE, MIN_RTO, RECEIVE_WINDOW, MAX_SACK_BLOCKS, ACK_EVERY, ACK_DELAY, TIMEOUT
 from .segment import Segment
 from .tcp import TCPClient, TCPStatusEnum, TCPServer
 from .segment_sender import SenderBuffer
+from .segment_cache import SegmentCache
+from .scheduler import AnyScheduler, Timer, get_scheduler
+from .congestion import DEFAULT_CONGESTION_CONTROL
 import logging
+from threading import Lock
 from .metadata import Metadata
+import os
 from os import path
-from .file import FileBuilder
+from .file import FileBuilder, FSYNC_NONE
+from .manifest import Manifest, TreeBuilder
+from .journal import Journal
+from .delta import SignatureHeader, rebuild
+from .compression import decompress
+from collections import deque
+from .handshake import HandshakeOptions
+from .codec import DEFAULT_CODEC, chunk_size_for
+from typing import Deque, Dict, List, Optional, Sequence, Tuple, Union
 
 class FileReceiver(TCPClient):
     file_handle: FileBuilder
+    # segments that arrived ahead of a gap. Once the file exists they are written at their
+    # offset right away and only the sequence number stays, mapped to None
+    out_of_order: Dict[int, Optional[Union[bytes, memoryview]]]
+    # file bytes in every data segment but the last, announced by the server in the handshake
+    chunk_size: int
+    # sequence number of the first data segment, the one after the metadata
+    data_sequence_number: int
+    fsync_policy: str
+    # --resume: the journal of an earlier transfer from this server, if any, and the chunk
+    # ranges of it the server agreed to skip
+    resume: bool
+    journal: Optional[Journal]
+    file_id: Optional[bytes]
+    resumed_ranges: List[Tuple[int, int]]
+    # the same ranges as sequence numbers, delivered without data once reached
+    resumed: Deque[Tuple[int, int]]
+    # --delta: an older copy of the file. The server then sends the signatures of its file,
+    # apply_delta rebuilds what matches and a --resume transfer fetches the rest
+    delta_source: Optional[str]
+    signature_header: Optional[SignatureHeader]
+    # --compress: offered methods go in the handshake, data payloads then start with a method byte
+    compression: CompressionEnum
+    # segments buffered between the network and the disk, out of order or waiting to be written
+    receive_window: int
+    advertised_window: int
+    delivered_bytes: int
+    # delayed ack: one ACK per ack_every in-order segments, or after ack_delay seconds
+    ack_every: int
+    ack_delay: float
+    unacked: int
+    ack_timer: Optional[Timer]
+    scheduler: AnyScheduler
+    segments_received: int
+    acks_sent: int
 
-    def __init__(self, connection: Connection, ip: str, port: int, file_path: str) -> None:
-        super().__init__(connection, ip, port)
+    def __init__(self,
+                 connection: Connection,
+                 ip: str,
+                 port: int,
+                 file_path: str,
+                 codecs: Optional[List[CodecEnum]] = None,
+                 receive_window: int = RECEIVE_WINDOW,
+                 ack_every: int = ACK_EVERY,
+                 ack_delay: float = ACK_DELAY,
+                 scheduler: Optional[AnyScheduler] = None,
+                 fsync_policy: str = FSYNC_NONE,
+                 resume: bool = False,
+                 delta_source: Optional[str] = None,
+                 compression: Optional[List[CompressionEnum]] = None) -> None:
+        super().__init__(connection, ip, port, codecs)
         self.file_path = file_path
         self.is_metadata_received = False
         self.is_file_received = False
+        self.out_of_order = {}
+        self.chunk_size = PAYLOAD_SIZE
+        self.data_sequence_number = 0
+        self.fsync_policy = fsync_policy
+        self.resume = resume
+        self.journal = None
+        self.file_id = None
+        self.resumed_ranges = []
+        self.resumed = deque()
+        if resume:
+            self._load_journal()
+        self.delta_source = delta_source
+        self.signature_header = None
+        if delta_source is not None:
+            self.handshake_options.signatures = True
+        self.handshake_options.compression = compression if compression is not None else []
+        self.compression = CompressionEnum.NONE
+        self.receive_window = receive_window
+        self.advertised_window = receive_window
+        self.delivered_bytes = 0
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.unacked = 0
+        self.ack_timer = None
+        self.segments_received = 0
+        self.acks_sent = 0
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        # the delayed ack fires on the scheduler thread while segments arrive on the receive loop
+        self.ack_lock = Lock()
+
+    def connect(self, init=True):
+        super().connect(init)
+        if init:
+            self.scheduler.schedule(TIMEOUT, self._resend_handshake_ack)
+
+    def _resend_handshake_ack(self) -> Optional[float]:
+        # scheduler callback: a server using SYN cookies kept nothing to resend its SYN-ACK
+        # from, the ACK is repeated until the first segment shows it arrived
+        if self.status != TCPStatusEnum.WAITING_FIRST_PACKET:
+            return None
+
+        self.connection.send(MessageInfo(self.ip, self.port, self._handshake_ack()))
+
+        return TIMEOUT
 
     def handle_message(self, message: MessageInfo):
         # initial three-way handshake
@@ -36,60 +141,240 @@ class FileReceiver(TCPClient):
         if self.is_file_received:
             logging.info("File already received")
             return
-        
-        if segment.sequence_number == self.server_sequence_number:
-            if not self.is_metadata_received:
-                self._handle_metadata(segment)
-                self.is_metadata_received = True
-                return
-            
-            self.file_handle.write(segment.data)
 
-            self.server_sequence_number += 1
+        with self.ack_lock:
+            self.segments_received += 1
+            # duplicates, out-of-order segments and the metadata are acked right away
+            immediate = segment.sequence_number != self.server_sequence_number or not self.is_metadata_received
+
+            window = self._window()
+            if segment.sequence_number >= self.server_sequence_number + window:
+                # nothing fits while the disk catches up, zero window probes end up here as well
+                logging.info(f"Ignoring segment {segment.sequence_number} beyond the receive window of {window}")
 
-            # send ACK for the received segment
-            ack_segment = Segment.ack_segment(0, segment.sequence_number + 1)
-            self.connection.send(MessageInfo(self.ip, self.port, ack_segment))
+            elif segment.sequence_number == self.server_sequence_number:
+                # a segment filling a gap is acked right away so the sender leaves recovery
+                immediate = immediate or bool(self.out_of_order)
+                self._deliver(segment.data)
 
-            if self.file_handle.bytes_written >= self.file_size_bytes:
-                self.is_file_received = True
-                self.close()
+                # the segment may have filled a gap, flush whatever follows it
+                while True:
+                    if self.server_sequence_number in self.out_of_order:
+                        self._deliver(self.out_of_order.pop(self.server_sequence_number))
+                    elif not self._skip_resumed():
+                        break
 
-        elif segment.sequence_number < self.server_sequence_number:
-            ack_segment = Segment.ack_segment(0, self.server_sequence_number)
-            self.connection.send(MessageInfo(self.ip, self.port, ack_segment))
+            elif segment.sequence_number > self.server_sequence_number and segment.sequence_number not in self.out_of_order:
+                if self.is_metadata_received:
+                    self.file_handle.queue(self._decompress(segment.data), self._offset(segment.sequence_number))
+                    self.out_of_order[segment.sequence_number] = None
+                else:
+                    self.out_of_order[segment.sequence_number] = segment.data
+
+            self.unacked += 1
+            completed = self.is_metadata_received and self.delivered_bytes >= self.file_size_bytes
+
+            if immediate or completed or self.unacked >= self.ack_every:
+                self._send_ack()
+            elif self.ack_timer is None:
+                self.ack_timer = self.scheduler.schedule(self.ack_delay, self._on_ack_timer)
+
+        if completed:
+            self.file_handle.flush()
+            logging.info(f"{self.segments_received} segments received, {self.acks_sent} ACKs sent")
+            self.is_file_received = True
+            self.close()
+
+    def _send_ack(self):
+        if self.ack_timer is not None:
+            self.scheduler.cancel(self.ack_timer)
+            self.ack_timer = None
+        self.unacked = 0
+        self.acks_sent += 1
+        self.advertised_window = self._window()
+
+        # the sack blocks tell the sender what is missing
+        ack_segment = Segment.ack_segment(0, self.server_sequence_number, self._sack_blocks(), self.advertised_window)
+        self.connection.send(MessageInfo(self.ip, self.port, ack_segment))
+
+    def _window(self) -> int:
+        backlog = self.file_handle.backlog if self.is_metadata_received else 0
+
+        return max(0, min(self.receive_window - backlog, 0xFFFF))
+
+    def _on_written(self):
+        # the sender may be stalled on a small or zero window, tell it once half the buffer is free again
+        with self.ack_lock:
+            if self.is_file_received:
+                return
+
+            if self._window() - self.advertised_window >= max(1, self.receive_window // 2):
+                self._send_ack()
+
+    def _on_ack_timer(self):
+        with self.ack_lock:
+            self.ack_timer = None
+            if self.unacked and not self.is_file_received:
+                self._send_ack()
+
+    def _deliver(self, data: Optional[Union[bytes, memoryview]]):
+        if not self.is_metadata_received:
+            assert data is not None
+            self._handle_metadata(data)
+            self.is_metadata_received = True
         else:
-            logging.info(f"Ignoring out-of-order with sequence number {segment.sequence_number}")
+            offset = self._offset(self.server_sequence_number)
+            if data is None:
+                # written when it arrived ahead of the gap
+                self.delivered_bytes += min(self.chunk_size, self.file_size_bytes - offset)
+            else:
+                data = self._decompress(data)
+                self.file_handle.queue(data, offset)
+                self.delivered_bytes += len(data)
 
-    def _handle_metadata(self, segment: Segment):
-        (filename, extension, file_size_bytes) = Metadata.get_metadata(segment.data)
-        self.file_size_bytes = file_size_bytes
         self.server_sequence_number += 1
 
-        self.file_path = path.join(self.file_path, filename + extension)
-        self.file_handle = FileBuilder(self.file_path, file_size_bytes)
+    def _skip_resumed(self) -> bool:
+        # chunks kept from the earlier transfer count as delivered, the server never sends them
+        if not self.resumed or self.resumed[0][0] > self.server_sequence_number:
+            return False
+
+        (_, end) = self.resumed.popleft()
+        if end > self.server_sequence_number:
+            self.delivered_bytes += min(self._offset(end), self.file_size_bytes) - self._offset(self.server_sequence_number)
+            self.server_sequence_number = end
+
+        return True
+
+    def _decompress(self, data: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+        return decompress(data) if self.compression != CompressionEnum.NONE else data
+
+    def _offset(self, sequence_number: int) -> int:
+        return (sequence_number - self.data_sequence_number) * self.chunk_size
+
+    def _apply_handshake_options(self, segment: Segment) -> HandshakeOptions:
+        options = super()._apply_handshake_options(segment)
+        # servers that do not announce it chunk by the largest payload of the codec
+        codec = options.codec if options.codec is not None else DEFAULT_CODEC
+        self.chunk_size = options.chunk_size if options.chunk_size is not None else chunk_size_for(codec, options.adaptive_codec)
+        self.file_id = options.file_id
+        self.compression = options.compression[0] if options.compression else CompressionEnum.NONE
+
+        if self.journal is not None and options.resume_id == self.journal.file_id:
+            self.resumed_ranges = options.resume_ranges
+            logging.info(f"Server resumes {self.journal.file_name}, skipping {sum(end - start for (start, end) in self.resumed_ranges)} chunks")
+        elif self.journal is not None:
+            logging.info(f"Server no longer has {self.journal.file_name} as it was, starting over")
+
+        return options
+
+    def apply_delta(self) -> int:
+        # after the signatures are in: returns the bytes taken from the old copy, the journal
+        # written here makes a --resume transfer from this server skip them
+        assert self.delta_source is not None and self.signature_header is not None and self.file_id is not None
+        header = self.signature_header
+        directory = path.dirname(self.file_path)
+
+        with open(self.file_path, "rb") as f:
+            encoded = f.read()
+        (bitmap, copied) = rebuild(header, encoded, self.delta_source, directory, self.chunk_size)
+        os.remove(self.file_path)
+        self.file_path = path.join(directory, header.file_name)
+
+        Journal(Journal.path_for(directory, self.ip, self.port), self.file_id, self.chunk_size, header.file_size, header.file_name).save(bytes(bitmap))
+        logging.info(f"{copied} of {header.file_size} bytes of {header.file_name} found in {self.delta_source}")
+
+        return copied
+
+    def _load_journal(self):
+        journal = Journal.load(Journal.path_for(self.file_path, self.ip, self.port))
+        if journal is None:
+            return
+
+        try:
+            size = path.getsize(path.join(self.file_path, journal.file_name))
+        except OSError:
+            size = -1
+        if size != journal.file_size:
+            logging.info(f"{journal.file_name} changed since the journal was written, not resuming")
+            return
+
+        self.journal = journal
+        self.handshake_options.chunk_size = journal.chunk_size
+        self.handshake_options.resume_id = journal.file_id
+        self.handshake_options.resume_ranges = journal.ranges()
+
+    def _sack_blocks(self) -> List[Tuple[int, int]]:
+        blocks: List[Tuple[int, int]] = []
+
+        for sequence_number in sorted(self.out_of_order):
+            if blocks and blocks[-1][1] == sequence_number:
+                blocks[-1] = (blocks[-1][0], sequence_number + 1)
+            elif len(blocks) == MAX_SACK_BLOCKS:
+                break
+            else:
+                blocks.append((sequence_number, sequence_number + 1))
+
+        return blocks
+
+    def _handle_metadata(self, data: Union[bytes, memoryview]):
+        if SignatureHeader.is_signatures(data):
+            # kept aside until apply_delta, the file itself is fetched by the next connection
+            self.signature_header = SignatureHeader.from_bytes(data)
+            self.file_size_bytes = self.signature_header.signatures_size
+            self.file_path = path.join(self.file_path, f".{self.signature_header.file_name}.signatures")
+            self.file_handle = FileBuilder(self.file_path, self.file_size_bytes, self._on_written, self.chunk_size, self.fsync_policy)
+        elif Manifest.is_manifest(data):
+            # a directory, the data segments carry its entries and then every file
+            manifest = Manifest.from_header(data)
+            self.file_size_bytes = manifest.stream_size
+            self.file_path = path.join(self.file_path, manifest.root)
+            self.file_handle = TreeBuilder(self.file_path, manifest, self._on_written, self.chunk_size, self.fsync_policy)
+        else:
+            (filename, extension, file_size_bytes) = Metadata.get_metadata(data)
+            self.file_size_bytes = file_size_bytes
+            self.file_handle = self._open_file(filename + extension, file_size_bytes)
+        self.data_sequence_number = self.server_sequence_number + 1
+        self.resumed = deque((self.data_sequence_number + start, self.data_sequence_number + end) for (start, end) in self.resumed_ranges)
+
+        # segments that came before the metadata can go to disk now
+        for (sequence_number, data) in self.out_of_order.items():
+            if data is not None:
+                self.file_handle.queue(self._decompress(data), self._offset(sequence_number))
+                self.out_of_order[sequence_number] = None
+
+    def _open_file(self, file_name: str, file_size_bytes: int) -> FileBuilder:
+        journal = None
+        if self.resumed_ranges:
+            assert self.journal is not None and self.journal.file_name == file_name
+            journal = self.journal
+        elif self.resume and self.file_id is not None:
+            journal = Journal(Journal.path_for(self.file_path, self.ip, self.port), self.file_id, self.chunk_size, file_size_bytes, file_name)
+
+        self.file_path = path.join(self.file_path, file_name)
+
+        return FileBuilder(self.file_path, file_size_bytes, self._on_written, self.chunk_size, self.fsync_policy, self.resumed_ranges, journal)
 
-        # send ACK for the received segment
-        ack_segment = Segment.ack_segment(0, segment.sequence_number + 1)
-        self.connection.send(MessageInfo(self.ip, self.port, ack_segment))
-        
 class FileSender(TCPServer):
     sender_buffer: SenderBuffer
     receiver_ack_number: int
 
-    def __init__(self, filePath: str, connection: Connection, ip: str, port: int, ack_number: int) -> None:
-        super().__init__(connection, ip, port)
+    def __init__(self, filePath: str, connection: Connection, ip: str, port: int, ack_number: int, chunk_size: int = PAYLOAD_SIZE, min_rto: float = MIN_RTO, congestion_control: str = DEFAULT_CONGESTION_CONTROL, scheduler: Optional[AnyScheduler] = None, segment_cache: Optional[SegmentCache] = None, resumed: Sequence[Tuple[int, int]] = (), signatures: bool = False, compression: CompressionEnum = CompressionEnum.NONE) -> None:
+        super().__init__(connection, ip, port, scheduler)
         self.receiver_ack_number = ack_number
-        self.sender_buffer = SenderBuffer(connection, ip, port, filePath, ack_number)
+        self.sender_buffer = SenderBuffer(connection, ip, port, filePath, ack_number, chunk_size, self.scheduler, min_rto, congestion_control, segment_cache, resumed, signatures, compression)
 
     def begin_transfer(self):
         self.sender_buffer.send(self.receiver_ack_number)
 
     def handle_message(self, message: MessageInfo):
+        if message.segment.is_handshake_ack():
+            # repeated by the client until the first segment reaches it, carries its offer and no sack blocks
+            return
         if self.status == TCPStatusEnum.ESTABLISHED and message.segment.flag != FlagEnum.FIN_FLAG:
-            self.sender_buffer.send(message.segment.ack)
+            self.sender_buffer.send(message.segment.ack, message.segment.sack_blocks(), message.segment.window)
         else:
             super().handle_message(message)
 
             if self.closed:
-                self.sender_buffer.set_all_thread()
\ No newline at end of file
+                self.sender_buffer.cancel_all()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import socket
+import struct
+import logging
+from typing import List, Optional, Tuple, Union
+
+from .constants import CodecEnum, CompressionEnum, OptionEnum
+
+# every option is type, length, value so unknown options can be skipped
+OPTION_HEADER_STRUCT = struct.Struct("<BH")
+CHUNK_SIZE_STRUCT = struct.Struct("<I")
+FILE_ID_SIZE = 8
+# [start, end) of chunks already on the client, after the file id in the resume option
+RESUME_RANGE_STRUCT = struct.Struct("<II")
+# group address and port in the server answer to a client that can join one
+MULTICAST_GROUP_STRUCT = struct.Struct("<4sH")
+# index of a sub-connection and how many the client opened for the same file
+STRIPE_STRUCT = struct.Struct("<HH")
+
+class HandshakeOptions:
+    # carried in the payload of SYN (client offer) and SYN-ACK (server answer)
+    codecs: List[CodecEnum]
+    codec: Optional[CodecEnum]
+    adaptive_codec: bool
+    chunk_size: Optional[int]
+    file_id: Optional[bytes]
+    # offered by the client from its journal, echoed by the server when it skips them
+    resume_id: Optional[bytes]
+    resume_ranges: List[Tuple[int, int]]
+    # asked by a delta client, answered by a server sending the signatures of the file
+    signatures: bool
+    # methods offered by the client by preference, the answer holds the one chosen
+    compression: List[CompressionEnum]
+    # offered by a client that can join a multicast group, answered with the group it joins
+    multicast: bool
+    multicast_group: Optional[Tuple[str, int]]
+    # sent by every sub-connection of a striped client, echoed when only its stripe is sent
+    stripe: Optional[Tuple[int, int]]
+
+    def __init__(self,
+                 codecs: Optional[List[CodecEnum]] = None,
+                 codec: Optional[CodecEnum] = None,
+                 adaptive_codec: bool = False,
+                 chunk_size: Optional[int] = None,
+                 file_id: Optional[bytes] = None,
+                 resume_id: Optional[bytes] = None,
+                 resume_ranges: Optional[List[Tuple[int, int]]] = None,
+                 signatures: bool = False,
+                 compression: Optional[List[CompressionEnum]] = None,
+                 multicast: bool = False,
+                 multicast_group: Optional[Tuple[str, int]] = None,
+                 stripe: Optional[Tuple[int, int]] = None) -> None:
+        self.codecs = codecs if codecs is not None else []
+        self.codec = codec
+        self.adaptive_codec = adaptive_codec
+        self.chunk_size = chunk_size
+        self.file_id = file_id
+        self.resume_id = resume_id
+        self.resume_ranges = resume_ranges if resume_ranges is not None else []
+        self.signatures = signatures
+        self.compression = compression if compression is not None else []
+        self.multicast = multicast
+        self.multicast_group = multicast_group
+        self.stripe = stripe
+
+    def to_bytes(self) -> bytes:
+        result = b""
+
+        if self.codecs:
+            result += self._option(OptionEnum.CODECS, bytes(int(codec) for codec in self.codecs))
+        if self.codec is not None:
+            result += self._option(OptionEnum.CODEC, bytes([int(self.codec)]))
+        if self.adaptive_codec:
+            result += self._option(OptionEnum.ADAPTIVE_CODEC, b"")
+        if self.chunk_size is not None:
+            result += self._option(OptionEnum.CHUNK_SIZE, CHUNK_SIZE_STRUCT.pack(self.chunk_size))
+        if self.file_id is not None:
+            result += self._option(OptionEnum.FILE_ID, self.file_id)
+        if self.resume_id is not None:
+            ranges = b"".join(RESUME_RANGE_STRUCT.pack(start, end) for (start, end) in self.resume_ranges)
+            result += self._option(OptionEnum.RESUME, self.resume_id + ranges)
+        if self.signatures:
+            result += self._option(OptionEnum.SIGNATURES, b"")
+        if self.compression:
+            result += self._option(OptionEnum.COMPRESSION, bytes(int(method) for method in self.compression))
+        if self.multicast_group is not None:
+            (address, port) = self.multicast_group
+            result += self._option(OptionEnum.MULTICAST, MULTICAST_GROUP_STRUCT.pack(socket.inet_aton(address), port))
+        elif self.multicast:
+            result += self._option(OptionEnum.MULTICAST, b"")
+        if self.stripe is not None:
+            result += self._option(OptionEnum.STRIPE, STRIPE_STRUCT.pack(*self.stripe))
+
+        return result
+
+    @staticmethod
+    def _option(option: OptionEnum, value: bytes) -> bytes:
+        return OPTION_HEADER_STRUCT.pack(int(option), len(value)) + value
+
+    @staticmethod
+    def from_bytes(src: Union[bytes, memoryview]) -> 'HandshakeOptions':
+        options = HandshakeOptions()
+        src = bytes(src)
+        offset = 0
+
+        while offset + OPTION_HEADER_STRUCT.size <= len(src):
+            (option, length) = OPTION_HEADER_STRUCT.unpack_from(src, offset)
+            offset += OPTION_HEADER_STRUCT.size
+            value = src[offset:offset + length]
+            offset += length
+
+            if option == int(OptionEnum.CODECS):
+                options.codecs = [CodecEnum(codec) for codec in value if codec in CodecEnum._value2member_map_]
+            elif option == int(OptionEnum.CODEC) and len(value) == 1 and value[0] in CodecEnum._value2member_map_:
+                options.codec = CodecEnum(value[0])
+            elif option == int(OptionEnum.ADAPTIVE_CODEC):
+                options.adaptive_codec = True
+            elif option == int(OptionEnum.CHUNK_SIZE) and len(value) == CHUNK_SIZE_STRUCT.size:
+                (options.chunk_size,) = CHUNK_SIZE_STRUCT.unpack(value)
+            elif option == int(OptionEnum.FILE_ID) and len(value) == FILE_ID_SIZE:
+                options.file_id = value
+            elif option == int(OptionEnum.RESUME) and len(value) >= FILE_ID_SIZE and (len(value) - FILE_ID_SIZE) % RESUME_RANGE_STRUCT.size == 0:
+                options.resume_id = value[:FILE_ID_SIZE]
+                options.resume_ranges = [
+                    (start, end) for (start, end) in RESUME_RANGE_STRUCT.iter_unpack(value[FILE_ID_SIZE:]) if start < end
+                ]
+            elif option == int(OptionEnum.SIGNATURES):
+                options.signatures = True
+            elif option == int(OptionEnum.COMPRESSION):
+                options.compression = [CompressionEnum(method) for method in value if method in CompressionEnum._value2member_map_ and method != int(CompressionEnum.NONE)]
+            elif option == int(OptionEnum.MULTICAST):
+                options.multicast = True
+                if len(value) == MULTICAST_GROUP_STRUCT.size:
+                    (address, port) = MULTICAST_GROUP_STRUCT.unpack(value)
+                    options.multicast_group = (socket.inet_ntoa(address), port)
+            elif option == int(OptionEnum.STRIPE) and len(value) == STRIPE_STRUCT.size:
+                (index, count) = STRIPE_STRUCT.unpack(value)
+                if index < count:
+                    options.stripe = (index, count)
+            else:
+                logging.info(f"Ignoring unknown handshake option {option}")
+
+        return options
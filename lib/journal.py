@@ -0,0 +1,98 @@
+import logging
+import os
+import struct
+from typing import List, Optional, Tuple
+
+from .constants import MAX_RESUME_RANGES
+
+# file id, chunk size, file size, file name length, then the name and the chunk bitmap
+JOURNAL_STRUCT = struct.Struct("<8sIQH")
+
+class Journal:
+    # progress of one transfer kept next to the output, one bit per chunk already on disk.
+    # A client started again asks the server to skip the chunks set here
+    path: str
+    file_id: bytes
+    chunk_size: int
+    file_size: int
+    file_name: str
+    bitmap: bytes
+
+    def __init__(self, path: str, file_id: bytes, chunk_size: int, file_size: int, file_name: str, bitmap: bytes = b"") -> None:
+        self.path = path
+        self.file_id = file_id
+        self.chunk_size = chunk_size
+        self.file_size = file_size
+        self.file_name = file_name
+        self.bitmap = bitmap
+
+    @staticmethod
+    def path_for(directory: str, ip: str, port: int) -> str:
+        # the name of the file is only known after the handshake, the server address is not
+        return os.path.join(directory, f".{ip}_{port}.journal")
+
+    @staticmethod
+    def load(path: str) -> Optional['Journal']:
+        try:
+            with open(path, "rb") as f:
+                src = f.read()
+            (file_id, chunk_size, file_size, name_length) = JOURNAL_STRUCT.unpack_from(src)
+            offset = JOURNAL_STRUCT.size
+            file_name = src[offset:offset + name_length].decode("utf-8")
+            bitmap = src[offset + name_length:]
+        except FileNotFoundError:
+            return None
+        except (OSError, struct.error, UnicodeDecodeError) as e:
+            logging.info(f"Ignoring unreadable journal {path}: {e}")
+            return None
+
+        if chunk_size == 0 or len(bitmap) != (-(-file_size // chunk_size) + 7) // 8:
+            logging.info(f"Ignoring journal {path} that does not match its file size")
+            return None
+
+        return Journal(path, file_id, chunk_size, file_size, file_name, bitmap)
+
+    def save(self, bitmap: bytes) -> None:
+        # written aside and renamed, a crash leaves the previous journal whole
+        self.bitmap = bitmap
+        name = self.file_name.encode("utf-8")
+        temporary = self.path + ".tmp"
+
+        with open(temporary, "wb") as f:
+            f.write(JOURNAL_STRUCT.pack(self.file_id, self.chunk_size, self.file_size, len(name)))
+            f.write(name)
+            f.write(bitmap)
+        os.replace(temporary, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def ranges(self, limit: int = MAX_RESUME_RANGES) -> List[Tuple[int, int]]:
+        # chunks on disk as [start, end) ranges, the first limit of them
+        result: List[Tuple[int, int]] = []
+        start = -1
+
+        for (index, byte) in enumerate(self.bitmap):
+            if byte == 0xFF and start >= 0:
+                continue
+            if byte == 0 and start < 0:
+                continue
+
+            for bit in range(8):
+                chunk = index * 8 + bit
+                if byte >> bit & 1:
+                    if start < 0:
+                        start = chunk
+                elif start >= 0:
+                    result.append((start, chunk))
+                    start = -1
+                    if len(result) == limit:
+                        return result
+
+        if start >= 0:
+            result.append((start, -(-self.file_size // self.chunk_size)))
+
+        return result[:limit]
@@ -0,0 +1,370 @@
+import bisect
+import logging
+import math
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .constants import PAYLOAD_SIZE
+from .file import FileBuilder, FilePayload, MappedFile, FSYNC_NONE, create_file, file_identity, pwrite_all, sync_file
+from .delta import SignaturePayload
+from .segment import Segment
+
+# first field of the metadata segment, where a single file has the length of its name
+MANIFEST_MARKER = 0xFFFFFFFF
+# marker, manifest bytes, file bytes, entry count, root name length
+MANIFEST_HEADER_STRUCT = struct.Struct("<IQQIH")
+# kind, offset of the file in the data part, size, path length
+MANIFEST_ENTRY_STRUCT = struct.Struct("<BQQH")
+ENTRY_FILE = 0
+ENTRY_DIRECTORY = 1
+# descriptors the receiver keeps open while files are being filled
+MAX_OPEN_FILES = 64
+
+class ManifestEntry:
+    __slots__ = ("kind", "offset", "size", "path")
+
+    kind: int
+    offset: int
+    size: int
+    # relative to the root, "/" separated
+    path: str
+
+    def __init__(self, kind: int, offset: int, size: int, path: str) -> None:
+        self.kind = kind
+        self.offset = offset
+        self.size = size
+        self.path = path
+
+class Manifest:
+    # a directory tree sent as one stream: the encoded entries, then the content of every
+    # file back to back in entry order. The metadata segment carries only the header, the
+    # entries travel in the data segments like file content
+    root: str
+    entries: List[ManifestEntry]
+    manifest_size: int
+    data_size: int
+    entry_count: int
+
+    def __init__(self, root: str, entries: Optional[List[ManifestEntry]] = None) -> None:
+        self.root = root
+        self.entries = entries if entries is not None else []
+        self.manifest_size = len(self.entries_to_bytes())
+        self.data_size = sum(entry.size for entry in self.entries if entry.kind == ENTRY_FILE)
+        self.entry_count = len(self.entries)
+
+    @property
+    def stream_size(self) -> int:
+        return self.manifest_size + self.data_size
+
+    @staticmethod
+    def from_directory(directory: str) -> 'Manifest':
+        entries: List[ManifestEntry] = []
+        offset = 0
+
+        for (current, directories, files) in os.walk(directory):
+            directories.sort()
+            relative = os.path.relpath(current, directory)
+            prefix = "" if relative == "." else relative.replace(os.sep, "/") + "/"
+
+            if prefix:
+                entries.append(ManifestEntry(ENTRY_DIRECTORY, offset, 0, prefix.rstrip("/")))
+
+            for name in sorted(files):
+                full_path = os.path.join(current, name)
+                if not os.path.isfile(full_path):
+                    continue
+                size = os.path.getsize(full_path)
+                entries.append(ManifestEntry(ENTRY_FILE, offset, size, prefix + name))
+                offset += size
+
+        return Manifest(os.path.basename(os.path.normpath(directory)), entries)
+
+    def header_to_bytes(self) -> bytes:
+        root = self.root.encode("utf-8")
+
+        return MANIFEST_HEADER_STRUCT.pack(MANIFEST_MARKER, self.manifest_size, self.data_size, self.entry_count, len(root)) + root
+
+    def entries_to_bytes(self) -> bytes:
+        result = bytearray()
+        for entry in self.entries:
+            path = entry.path.encode("utf-8")
+            result += MANIFEST_ENTRY_STRUCT.pack(entry.kind, entry.offset, entry.size, len(path))
+            result += path
+
+        return bytes(result)
+
+    @staticmethod
+    def is_manifest(src: Union[bytes, memoryview]) -> bool:
+        return len(src) >= MANIFEST_HEADER_STRUCT.size and struct.unpack_from("<I", src)[0] == MANIFEST_MARKER
+
+    @staticmethod
+    def from_header(src: Union[bytes, memoryview]) -> 'Manifest':
+        src = bytes(src)
+        (_, manifest_size, data_size, entry_count, root_length) = MANIFEST_HEADER_STRUCT.unpack_from(src)
+        root = src[MANIFEST_HEADER_STRUCT.size:MANIFEST_HEADER_STRUCT.size + root_length].decode("utf-8")
+        if not root or root in (".", "..") or "/" in root or os.sep in root:
+            raise NameError(f"Invalid directory name {root!r}")
+
+        manifest = Manifest(root)
+        manifest.manifest_size = manifest_size
+        manifest.data_size = data_size
+        manifest.entry_count = entry_count
+
+        return manifest
+
+    def read_entries(self, src: Union[bytes, bytearray]) -> None:
+        entries = []
+        offset = 0
+        expected = 0
+
+        for _ in range(self.entry_count):
+            (kind, file_offset, size, length) = MANIFEST_ENTRY_STRUCT.unpack_from(src, offset)
+            offset += MANIFEST_ENTRY_STRUCT.size
+            path = bytes(src[offset:offset + length]).decode("utf-8")
+            offset += length
+
+            # nothing may be written outside the root
+            parts = path.split("/")
+            if not path or path.startswith("/") or any(part in ("", ".", "..") for part in parts) or "\\" in path:
+                raise NameError(f"Invalid path {path!r} in manifest")
+            if kind == ENTRY_FILE:
+                if file_offset != expected:
+                    raise Exception(f"Manifest entry {path} at offset {file_offset}, expected {expected}")
+                expected += size
+
+            entries.append(ManifestEntry(kind, file_offset, size, path))
+
+        if expected != self.data_size:
+            raise Exception(f"Manifest files add up to {expected} bytes, header says {self.data_size}")
+        self.entries = entries
+
+class TreePayload:
+    # FilePayload for a directory, chunk n is a slice of the stream of manifest then files
+    path: str
+    chunk_size: int
+    filesize: int
+    total_chunk: int
+    key: Tuple[str, int, int, int, int]
+    manifest: Manifest
+    entries_bytes: bytes
+    files: List[ManifestEntry]
+    # data offset of every file in files, for bisect
+    starts: List[int]
+    mapped: Dict[int, Optional[MappedFile]]
+
+    def __init__(self, path: str, chunk_size: int = PAYLOAD_SIZE) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.manifest = Manifest.from_directory(path)
+        self.entries_bytes = self.manifest.entries_to_bytes()
+        self.filesize = self.manifest.stream_size
+        self.total_chunk = math.ceil(self.filesize / self.chunk_size)
+        self.files = [entry for entry in self.manifest.entries if entry.kind == ENTRY_FILE and entry.size > 0]
+        self.starts = [entry.offset for entry in self.files]
+        self.mapped = {}
+
+        stats = os.stat(path)
+        # a changed file changes its size or mtime, and with them the manifest checksum
+        content = zlib.crc32(self.entries_bytes)
+        for entry in self.files:
+            content = zlib.crc32(str(os.stat(self._full_path(entry)).st_mtime_ns).encode(), content)
+        self.key = (os.path.realpath(path), stats.st_dev, stats.st_ino, self.filesize, content)
+
+        logging.info(f"Sending {path} as a manifest of {self.manifest.entry_count} entries, {self.filesize} bytes")
+
+    def _full_path(self, entry: ManifestEntry) -> str:
+        return os.path.join(self.path, *entry.path.split("/"))
+
+    def get_chunk(self, chunk_number: int) -> Union[bytes, memoryview]:
+        if chunk_number < 1:
+            return self.manifest.header_to_bytes()
+
+        if chunk_number > self.total_chunk:
+            raise Exception("Invalid chunk number")
+
+        start = (chunk_number - 1) * self.chunk_size
+        end = min(start + self.chunk_size, self.filesize)
+        pieces: List[Union[bytes, memoryview]] = []
+
+        if start < self.manifest.manifest_size:
+            pieces.append(self.entries_bytes[start:min(end, self.manifest.manifest_size)])
+            start = self.manifest.manifest_size
+
+        if start < end:
+            data_start = start - self.manifest.manifest_size
+            data_end = end - self.manifest.manifest_size
+            index = bisect.bisect_right(self.starts, data_start) - 1
+
+            while data_start < data_end:
+                entry = self.files[index]
+                length = min(data_end, entry.offset + entry.size) - data_start
+                pieces.append(self._read(index, data_start - entry.offset, length))
+                data_start += length
+                index += 1
+
+        # a chunk inside one file stays a view of its mapping
+        return pieces[0] if len(pieces) == 1 else b"".join(pieces)
+
+    def _read(self, index: int, offset: int, length: int) -> Union[bytes, memoryview]:
+        if index not in self.mapped:
+            try:
+                self.mapped[index] = MappedFile.acquire(self._full_path(self.files[index]))
+            except (OSError, ValueError):
+                self.mapped[index] = None
+
+        mapped = self.mapped[index]
+        if mapped is not None:
+            return mapped.view[offset:offset + length]
+
+        with open(self._full_path(self.files[index]), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get_segment(self, segment_number: int) -> Segment:
+        return Segment.data_segment(self.get_chunk(segment_number))
+
+    def close(self):
+        for mapped in self.mapped.values():
+            if mapped is not None:
+                mapped.release()
+        self.mapped = {}
+
+class TreeBuilder(FileBuilder):
+    # FileBuilder over the stream of a Manifest, the write-behind queue, coalescing and
+    # completion bitmap work on stream offsets and every write is split across the files
+    manifest: Manifest
+    entries_buffer: bytearray
+    entries_received: int
+    files: List[ManifestEntry]
+    starts: List[int]
+    remaining: List[int]
+    # data that arrived before the manifest was complete, (data offset, bytes)
+    parked: List[Tuple[int, bytes]]
+    # index in files to descriptor, least recently used first
+    open_files: 'OrderedDict[int, int]'
+    tree_ready: bool
+
+    def __init__(self, path: str, manifest: Manifest, on_written: Optional[Callable[[], None]] = None, chunk_size: int = PAYLOAD_SIZE, fsync_policy: str = FSYNC_NONE):
+        self.manifest = manifest
+        self.entries_buffer = bytearray(manifest.manifest_size)
+        self.entries_received = 0
+        self.files = []
+        self.starts = []
+        self.remaining = []
+        self.parked = []
+        self.open_files = OrderedDict()
+        self.tree_ready = False
+
+        super().__init__(path, manifest.stream_size, on_written, chunk_size, fsync_policy)
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        if self.manifest.manifest_size == 0:
+            self._create_tree()
+
+    def _pwritev(self, buffers: List[Union[bytes, memoryview]], offset: int, length: int):
+        data = memoryview(buffers[0] if len(buffers) == 1 else b"".join(buffers))
+        manifest_size = self.manifest.manifest_size
+
+        if offset < manifest_size:
+            count = min(len(data), manifest_size - offset)
+            self.entries_buffer[offset:offset + count] = data[:count]
+            self.entries_received += count
+            (data, offset) = (data[count:], offset + count)
+
+            if self.entries_received == manifest_size:
+                self._create_tree()
+
+        if not data:
+            return
+
+        if self.tree_ready:
+            self._scatter(data, offset - manifest_size)
+        else:
+            self.parked.append((offset - manifest_size, bytes(data)))
+
+    def _create_tree(self):
+        self.manifest.read_entries(self.entries_buffer)
+
+        for entry in self.manifest.entries:
+            full_path = os.path.join(self.path, *entry.path.split("/"))
+            if entry.kind == ENTRY_DIRECTORY:
+                os.makedirs(full_path, exist_ok=True)
+                continue
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.close(create_file(full_path, entry.size))
+            if entry.size > 0:
+                self.files.append(entry)
+
+        self.starts = [entry.offset for entry in self.files]
+        self.remaining = [entry.size for entry in self.files]
+        self.tree_ready = True
+        logging.info(f"Created {len(self.files)} files under {self.path}")
+
+        for (offset, data) in self.parked:
+            self._scatter(memoryview(data), offset)
+        self.parked = []
+
+    def _scatter(self, data: memoryview, offset: int):
+        index = bisect.bisect_right(self.starts, offset) - 1
+
+        while data:
+            entry = self.files[index]
+            count = min(len(data), entry.offset + entry.size - offset)
+            fd = self._file(index)
+            self.writes += pwrite_all(fd, data[:count], offset - entry.offset)
+
+            self.remaining[index] -= count
+            if self.remaining[index] <= 0:
+                self._close_file(index)
+
+            (data, offset) = (data[count:], offset + count)
+            index += 1
+
+    def _file(self, index: int) -> int:
+        fd = self.open_files.get(index)
+        if fd is not None:
+            self.open_files.move_to_end(index)
+            return fd
+
+        if len(self.open_files) >= MAX_OPEN_FILES:
+            self._close_file(next(iter(self.open_files)), sync=False)
+
+        fd = os.open(os.path.join(self.path, *self.files[index].path.split("/")), os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        self.open_files[index] = fd
+
+        return fd
+
+    def _close_file(self, index: int, sync: bool = True):
+        fd = self.open_files.pop(index, None)
+        if fd is None:
+            return
+
+        # a finished file is synced here, the whole tree is never open at once
+        if sync and self.fsync_policy != FSYNC_NONE:
+            sync_file(fd)
+        os.close(fd)
+
+    def _sync(self):
+        for fd in self.open_files.values():
+            sync_file(fd)
+        self.unsynced_bytes = 0
+
+    def close(self):
+        for index in list(self.open_files):
+            self._close_file(index, sync=False)
+
+def open_payload(path: str, chunk_size: int = PAYLOAD_SIZE, signatures: bool = False) -> Union[FilePayload, TreePayload, SignaturePayload]:
+    if os.path.isdir(path):
+        return TreePayload(path, chunk_size)
+
+    identity = file_identity(path) if signatures else None
+    if identity is not None:
+        return SignaturePayload(path, identity, chunk_size)
+
+    return FilePayload(path, chunk_size)
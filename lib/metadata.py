@@ -1,6 +1,6 @@
 from pathlib import Path
 import struct
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 class Metadata:
     filename_bytes_length: int
@@ -35,7 +35,9 @@ class Metadata:
         return result
 
     @staticmethod
-    def get_metadata(src: bytes) -> Tuple[str, str, int]:
+    def get_metadata(src: Union[bytes, memoryview]) -> Tuple[str, str, int]:
+        # segment payloads may arrive as a memoryview, the metadata segment is tiny so copy it
+        src = bytes(src)
         filename_bytes_length = struct.unpack("<I", src[0:4])[0]
         extension_bytes_length = struct.unpack("<I", src[4:8])[0]
         file_bytes_length = struct.unpack("<Q", src[8:16])[0]
@@ -0,0 +1,329 @@
+import ipaddress
+import logging
+from collections import OrderedDict
+from math import ceil, inf
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from .codec import Codec
+from .connection import Connection, MessageInfo
+from .constants import FlagEnum, HEADER_SIZE, MAX_NAK_RANGES, MAX_RETRY, MULTICAST_BURST, MULTICAST_MIN_RATE_FRACTION, MULTICAST_NAK_DELAY, MULTICAST_NAK_INTERVAL, MULTICAST_REPAIR_DELAY, MULTICAST_REPAIR_HOLDOFF, TIMEOUT
+from .file import FilePayload
+from .handler import FileReceiver
+from .handshake import HandshakeOptions
+from .manifest import TreePayload, open_payload
+from .scheduler import AnyScheduler, Timer
+from .segment import Segment
+from .segment_cache import SegmentCache
+from .segment_sender import encode_segments
+from .tcp import TCPServer, TCPStatusEnum
+
+# seconds without a word from a member before the group stops waiting for it
+MEMBER_TIMEOUT = TIMEOUT * MAX_RETRY
+
+def parse_group(value: str) -> Tuple[str, int]:
+    # "239.1.2.3:9000" from the command line
+    (address, _, port) = value.rpartition(":")
+    if not ipaddress.IPv4Address(address).is_multicast:
+        raise ValueError(f"{address} is not a multicast address")
+
+    return (address, int(port))
+
+def interface_for(ip: str) -> str:
+    # a peer on loopback is reached through lo, anything else through the default interface
+    return "127.0.0.1" if ipaddress.IPv4Address(ip).is_loopback else "0.0.0.0"
+
+class MulticastReceiver(FileReceiver):
+    # FileReceiver that joins the multicast group the server answers with. Data then comes
+    # to every member at once, so instead of acking every segment the client only reports
+    # what it misses with a NAK: an ACK whose blocks are the missing ranges. Without a group
+    # in the answer it behaves like FileReceiver
+    group: Optional[Tuple[str, int]]
+    nak_timer: Optional[Timer]
+    # a gap is reported shortly after it shows up, every member sees it at about the same
+    # time and the server repairs it for all of them at once
+    gap_timer: Optional[Timer]
+    # segments_received at the previous NAK check
+    checked_segments: int
+    naks_sent: int
+    # time of the last report, a member without loss still reports now and then so the
+    # server does not give up on it
+    reported_at: float
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.handshake_options.multicast = True
+        self.group = None
+        self.nak_timer = None
+        self.gap_timer = None
+        self.checked_segments = 0
+        self.naks_sent = 0
+        self.reported_at = monotonic()
+
+    def _apply_handshake_options(self, segment: Segment) -> HandshakeOptions:
+        options = super()._apply_handshake_options(segment)
+
+        if options.multicast_group is not None and self.group is None:
+            self.group = options.multicast_group
+            self.connection.join_group(self.group, interface_for(self.ip))
+            self.nak_timer = self.scheduler.schedule(MULTICAST_NAK_INTERVAL, self._on_nak_timer)
+        elif options.multicast_group is None:
+            logging.info("Server did not answer with a multicast group, receiving over unicast")
+
+        return options
+
+    def handle_data(self, segment: Segment):
+        super().handle_data(segment)
+
+        with self.ack_lock:
+            if self.group is not None and self.out_of_order and self.gap_timer is None and not self.is_file_received:
+                self.gap_timer = self.scheduler.schedule(MULTICAST_NAK_DELAY, self._on_gap_timer)
+
+    @property
+    def completed(self) -> bool:
+        return self.is_metadata_received and self.delivered_bytes >= self.file_size_bytes
+
+    def _send_ack(self):
+        if self.group is None or self.completed:
+            # the last ACK tells the server this member is done
+            super()._send_ack()
+            return
+
+        # in the group the server learns about gaps from the NAKs only
+        if self.ack_timer is not None:
+            self.scheduler.cancel(self.ack_timer)
+            self.ack_timer = None
+        self.unacked = 0
+
+    def _on_gap_timer(self) -> None:
+        with self.ack_lock:
+            self.gap_timer = None
+            if not self.is_file_received:
+                self._send_nak(self._missing(tail=False))
+
+    def _on_nak_timer(self) -> Optional[float]:
+        with self.ack_lock:
+            if self.is_file_received or self.closed:
+                self.nak_timer = None
+                return None
+
+            missing = self._missing(tail=True)
+            if missing or monotonic() - self.reported_at >= TIMEOUT:
+                self._send_nak(missing)
+
+        return MULTICAST_NAK_INTERVAL
+
+    def _send_nak(self, missing: List[Tuple[int, int]]):
+        self.naks_sent += bool(missing)
+        self.reported_at = monotonic()
+        nak = Segment.ack_segment(0, self.server_sequence_number, missing, self._window())
+        self.connection.send(MessageInfo(self.ip, self.port, nak))
+
+    def _missing(self, tail: bool) -> List[Tuple[int, int]]:
+        # gaps below the highest segment received. With tail also everything after it when
+        # nothing arrived since the last check: the end of the file may have been lost
+        ranges: List[Tuple[int, int]] = []
+        expected = self.server_sequence_number
+
+        for sequence_number in sorted(self.out_of_order):
+            if sequence_number > expected:
+                ranges.append((expected, sequence_number))
+            expected = max(expected, sequence_number + 1)
+
+        if tail and self.segments_received == self.checked_segments:
+            end = self.data_sequence_number + ceil(self.file_size_bytes / self.chunk_size) if self.is_metadata_received else expected + 1
+            if expected < end:
+                ranges.append((expected, end))
+        if tail:
+            self.checked_segments = self.segments_received
+
+        return ranges[:MAX_NAK_RANGES]
+
+    def close(self):
+        self.connection.leave_group()
+        if self.group is not None:
+            logging.info(f"{self.naks_sent} NAKs sent")
+        super().close()
+
+class MulticastMember(TCPServer):
+    # server side of a client in the group: its progress and its teardown, the data
+    # itself comes from the MulticastSender
+    acked: int
+    last_heard: float
+
+    def __init__(self, connection: Connection, ip: str, port: int, acked: int, scheduler: Optional[AnyScheduler] = None) -> None:
+        super().__init__(connection, ip, port, scheduler)
+        self.acked = acked
+        self.last_heard = monotonic()
+
+class MulticastSender:
+    # sends every segment of the file once to the group, paced, and repairs what members
+    # report missing: unicast to a single member, to the group again when several miss it
+    connection: Connection
+    group: Tuple[str, int]
+    members: Dict[Tuple[str, int], MulticastMember]
+    file_payload: Union[FilePayload, TreePayload]
+    codec: Codec
+    segment_cache: Optional[SegmentCache]
+    # the first sequence number is the metadata, end is one past the last segment
+    init_sequence_number: int
+    end: int
+    # next segment never sent, NAKs beyond it are ignored
+    next_sequence_number: int
+    # segments to resend, the members missing them and when the repair is due, by sequence number
+    repairs: 'OrderedDict[int, Tuple[float, Set[Tuple[str, int]]]]'
+    repaired_at: Dict[int, float]
+    # bytes per second: backs off while NAKs report new loss, creeps back to max_rate otherwise
+    rate: float
+    max_rate: float
+    allowance: float
+    refilled_at: float
+    decreased_at: float
+    increased_at: float
+    naks_received: int
+    multicast_repairs: int
+    unicast_repairs: int
+
+    def __init__(self,
+                 path: str,
+                 connection: Connection,
+                 group: Tuple[str, int],
+                 members: Dict[Tuple[str, int], MulticastMember],
+                 init_sequence_number: int,
+                 chunk_size: int,
+                 codec: Codec,
+                 rate: float,
+                 segment_cache: Optional[SegmentCache] = None) -> None:
+        self.connection = connection
+        self.group = group
+        self.members = members
+        self.file_payload = open_payload(path, chunk_size)
+        self.codec = codec
+        self.segment_cache = segment_cache
+        self.init_sequence_number = init_sequence_number
+        self.end = init_sequence_number + self.file_payload.total_chunk + 1
+        self.next_sequence_number = init_sequence_number
+        self.repairs = OrderedDict()
+        self.repaired_at = {}
+        self.max_rate = rate
+        self.rate = rate
+        self.allowance = MULTICAST_BURST * (chunk_size + HEADER_SIZE)
+        self.refilled_at = monotonic()
+        self.decreased_at = 0
+        self.increased_at = 0
+        self.naks_received = 0
+        self.multicast_repairs = 0
+        self.unicast_repairs = 0
+
+        (address, port) = group
+        connection.set_codec(address, port, codec.codec_id)
+        logging.info(f"Sending {path} to {len(members)} clients through {address}:{port} at up to {rate / 1e6:.1f} MB/s")
+
+    @property
+    def done(self) -> bool:
+        return all(member.closed for member in self.members.values())
+
+    def send_due(self) -> float:
+        # sends what the rate allows, repairs first. Returns the seconds until more can go out
+        now = monotonic()
+        segment_size = self.file_payload.chunk_size + HEADER_SIZE
+        self.allowance = min(self.allowance + (now - self.refilled_at) * self.rate, MULTICAST_BURST * segment_size)
+        self.refilled_at = now
+        if now - max(self.decreased_at, self.increased_at) >= MULTICAST_NAK_INTERVAL and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * MULTICAST_MIN_RATE_FRACTION)
+            self.increased_at = now
+        self._expire_members(now)
+
+        batch: List[Tuple[int, List[Tuple[str, int]]]] = []
+        while self.allowance >= segment_size:
+            if self.repairs and self._first_repair_due() <= now:
+                (sequence_number, (_, requesters)) = self.repairs.popitem(last=False)
+                requesters = {address for address in requesters if address in self.members and not self.members[address].closed}
+                if not requesters:
+                    continue
+                self.repaired_at[sequence_number] = now
+                if len(requesters) > 1:
+                    self.multicast_repairs += 1
+                    batch.append((sequence_number, [self.group]))
+                else:
+                    self.unicast_repairs += 1
+                    batch.append((sequence_number, list(requesters)))
+            elif self.next_sequence_number < self.end:
+                batch.append((self.next_sequence_number, [self.group]))
+                self.next_sequence_number += 1
+            else:
+                break
+            self.allowance -= segment_size
+
+        if batch:
+            self._send(batch)
+
+        wait = MULTICAST_NAK_INTERVAL
+        if self.next_sequence_number < self.end or (self.repairs and self._first_repair_due() <= now):
+            wait = (segment_size - self.allowance) / self.rate
+        elif self.repairs:
+            wait = self._first_repair_due() - now
+
+        return max(wait, 0.001)
+
+    def _first_repair_due(self) -> float:
+        return next(iter(self.repairs.values()))[0]
+
+    def _send(self, batch: List[Tuple[int, List[Tuple[str, int]]]]) -> None:
+        segments = []
+        for (sequence_number, _) in batch:
+            segment = self.file_payload.get_segment(sequence_number - self.init_sequence_number)
+            segment.sequence_number = sequence_number
+            segments.append(segment)
+
+        encoded_segments = encode_segments(segments, self.file_payload, self.init_sequence_number, self.codec, self.segment_cache)
+        for (segment, encoded, (_, destinations)) in zip(segments, encoded_segments, batch):
+            for (ip, port) in destinations:
+                self.connection.send(MessageInfo(ip, port, segment), encoded)
+
+    def handle_message(self, message: MessageInfo) -> None:
+        member = self.members[(message.ip, message.port)]
+        member.last_heard = monotonic()
+        segment = message.segment
+
+        if segment.is_handshake_ack():
+            # repeated by the member until the group sends, no NAK ranges in it
+            return
+        if segment.flag != FlagEnum.ACK_FLAG or member.status != TCPStatusEnum.ESTABLISHED:
+            # the member is done and tears its connection down
+            member.handle_message(message)
+            return
+
+        member.acked = max(member.acked, segment.ack)
+        ranges = segment.sack_blocks()
+        if not ranges:
+            return
+
+        self.naks_received += 1
+        now = monotonic()
+        new_loss = False
+        for (start, end) in ranges[:MAX_NAK_RANGES]:
+            for sequence_number in range(max(start, member.acked), min(end, self.next_sequence_number)):
+                if now - self.repaired_at.get(sequence_number, -inf) < MULTICAST_REPAIR_HOLDOFF:
+                    continue
+                if sequence_number not in self.repairs:
+                    self.repairs[sequence_number] = (now + MULTICAST_REPAIR_DELAY, set())
+                    new_loss = True
+                self.repairs[sequence_number][1].add((message.ip, message.port))
+
+        if new_loss and now - self.decreased_at >= MULTICAST_NAK_INTERVAL:
+            self.rate = max(self.rate * 0.75, self.max_rate * MULTICAST_MIN_RATE_FRACTION)
+            self.decreased_at = now
+
+    def _expire_members(self, now: float) -> None:
+        for member in self.members.values():
+            if not member.closed and now - member.last_heard > MEMBER_TIMEOUT:
+                logging.info(f"[Client {member.ip}:{member.port}] no word for {MEMBER_TIMEOUT} seconds, leaving it out of the group")
+                member.status = TCPStatusEnum.CLOSED
+
+    def close(self):
+        self.file_payload.close()
+
+    def __str__(self) -> str:
+        return (f"{self.file_payload.total_chunk + 1} segments sent to the group once, {self.naks_received} NAKs, "
+                f"{self.multicast_repairs} repairs to the group and {self.unicast_repairs} to a single client, rate {self.rate / 1e6:.1f} MB/s")
@@ -0,0 +1,49 @@
+from .constants import INITIAL_RTO, MIN_RTO, MAX_RTO
+
+# RFC 6298 smoothing factors
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+CLOCK_GRANULARITY = 0.001
+
+class RTTEstimator:
+    # smoothed round trip time and the retransmission timeout derived from it
+    srtt: float
+    rttvar: float
+    rto: float
+    min_rto: float
+    max_rto: float
+    samples: int
+    last_sample: float
+
+    def __init__(self, min_rto: float = MIN_RTO, max_rto: float = MAX_RTO, initial_rto: float = INITIAL_RTO) -> None:
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = 0
+        self.rttvar = 0
+        self.rto = self._clamp(initial_rto)
+        self.samples = 0
+        self.last_sample = 0
+
+    def sample(self, rtt: float) -> None:
+        # only feed samples from segments that were never retransmitted (Karn's rule)
+        if self.samples == 0:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+
+        self.samples += 1
+        self.last_sample = rtt
+        self.rto = self._clamp(self.srtt + max(CLOCK_GRANULARITY, K * self.rttvar))
+
+    def backoff(self, retry: int) -> float:
+        # timeout before the next attempt of a segment that was already sent retry times
+        return self._clamp(self.rto * (2 ** retry))
+
+    def _clamp(self, rto: float) -> float:
+        return min(max(rto, self.min_rto), self.max_rto)
+
+    def __str__(self) -> str:
+        return f"rto {self.rto * 1000:.1f}ms srtt {self.srtt * 1000:.1f}ms rttvar {self.rttvar * 1000:.1f}ms"
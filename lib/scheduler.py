@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Tuple, Union
+
+# a callback returns the delay until it should run again, or None when done
+TimerCallback = Callable[[], Optional[float]]
+
+class Timer:
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    deadline: float
+    callback: TimerCallback
+    cancelled: bool
+
+    def __init__(self, deadline: float, callback: TimerCallback) -> None:
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        # O(1), the heap entry is dropped lazily when it reaches the top
+        self.cancelled = True
+
+class Scheduler:
+    # one thread serving the deadlines of every timer in the process
+    heap: List[Tuple[float, int, Timer]]
+    condition: threading.Condition
+    thread: Optional[threading.Thread]
+
+    def __init__(self) -> None:
+        self.heap = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self._counter = itertools.count()
+        self._cancelled = 0
+
+    def schedule(self, delay: float, callback: TimerCallback) -> Timer:
+        timer = Timer(time.monotonic() + delay, callback)
+
+        with self.condition:
+            self._push(timer)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        if timer.cancelled:
+            return
+        timer.cancel()
+
+        with self.condition:
+            self._cancelled += 1
+            # rebuild once cancelled entries dominate so memory stays bounded
+            if self._cancelled > 1024 and self._cancelled > len(self.heap) // 2:
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self._cancelled = 0
+
+    def pending(self) -> int:
+        with self.condition:
+            return sum(1 for (_, _, timer) in self.heap if not timer.cancelled)
+
+    def _push(self, timer: Timer) -> None:
+        heapq.heappush(self.heap, (timer.deadline, next(self._counter), timer))
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while True:
+                    while self.heap and self.heap[0][2].cancelled:
+                        heapq.heappop(self.heap)
+                        self._cancelled = max(0, self._cancelled - 1)
+
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+
+                    timeout = self.heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+
+                (_, _, timer) = heapq.heappop(self.heap)
+
+            try:
+                delay = timer.callback()
+            except Exception as e:
+                logging.info(f"Timer callback failed: {e}")
+                delay = None
+
+            if delay is not None and not timer.cancelled:
+                with self.condition:
+                    timer.deadline = time.monotonic() + delay
+                    self._push(timer)
+
+class LoopTimer(Timer):
+    __slots__ = ("handle",)
+
+    handle: Optional[asyncio.TimerHandle]
+
+    def __init__(self, deadline: float, callback: TimerCallback) -> None:
+        super().__init__(deadline, callback)
+        self.handle = None
+
+class LoopScheduler:
+    # same interface as Scheduler, the timers run as call_later on an asyncio event loop
+    loop: asyncio.AbstractEventLoop
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    def schedule(self, delay: float, callback: TimerCallback) -> Timer:
+        timer = LoopTimer(self.loop.time() + delay, callback)
+
+        if self._in_loop():
+            self._arm(timer)
+        else:
+            # e.g. the file writer thread of a receiver, call_later is not thread safe
+            self.loop.call_soon_threadsafe(self._arm, timer)
+
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        timer.cancel()
+
+        # off the loop thread the handle is left alone, _fire skips cancelled timers
+        if isinstance(timer, LoopTimer) and timer.handle is not None and self._in_loop():
+            timer.handle.cancel()
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _arm(self, timer: LoopTimer) -> None:
+        if not timer.cancelled:
+            timer.handle = self.loop.call_at(timer.deadline, self._fire, timer)
+
+    def _fire(self, timer: LoopTimer) -> None:
+        if timer.cancelled:
+            return
+
+        try:
+            delay = timer.callback()
+        except Exception as e:
+            logging.info(f"Timer callback failed: {e}")
+            delay = None
+
+        if delay is not None and not timer.cancelled:
+            timer.deadline = self.loop.time() + delay
+            self._arm(timer)
+
+# anything SenderBuffer and the handlers can arm their timers on
+AnyScheduler = Union[Scheduler, LoopScheduler]
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+
+    return _scheduler
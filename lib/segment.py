@@ -1,10 +1,21 @@
 import struct
 
-from .constants import FlagEnum
-from .checksum import calculate_checksum
+from .constants import FlagEnum, HEADER_SIZE
+from .checksum import Checksum, crc16_combine
 from .hamming import Hamming
 
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# seqnum, acknum, flag, padding, window, checksum
+HEADER_STRUCT = struct.Struct("<IIBxHH")
+# the fields covered by the checksum, everything before it
+CHECKSUM_HEADER_STRUCT = struct.Struct("<IIBxH")
+CHECKSUM_FIELD_STRUCT = struct.Struct("<H")
+CHECKSUM_OFFSET = 12
+# selective ack block carried in the ACK payload: first sequence number, one past the last
+SACK_BLOCK_STRUCT = struct.Struct("<II")
+
+FLAG_MASK = int(FlagEnum.SYN_FLAG) | int(FlagEnum.ACK_FLAG) | int(FlagEnum.FIN_FLAG)
 
 
 class InvalidChecksumException(Exception):
@@ -12,19 +23,31 @@ class InvalidChecksumException(Exception):
 
 
 class SegmentFlag:
+    # flags are immutable, every combination is a shared singleton
+    __slots__ = ("syn", "ack", "fin", "flag")
+    _instances: Dict[int, 'SegmentFlag'] = {}
+
     syn: int
     ack: int
     fin: int
     flag: int
 
-    def __init__(self, flag: int) -> None:
-        self.syn = flag & int(FlagEnum.SYN_FLAG)
-        self.ack = flag & int(FlagEnum.ACK_FLAG)
-        self.fin = flag & int(FlagEnum.FIN_FLAG)
-        self.flag = self.syn | self.ack | self.fin
+    def __new__(cls, flag: int) -> 'SegmentFlag':
+        flag &= FLAG_MASK
+        instance = cls._instances.get(flag)
+
+        if instance is None:
+            instance = super().__new__(cls)
+            instance.syn = flag & int(FlagEnum.SYN_FLAG)
+            instance.ack = flag & int(FlagEnum.ACK_FLAG)
+            instance.fin = flag & int(FlagEnum.FIN_FLAG)
+            instance.flag = flag
+            cls._instances[flag] = instance
+
+        return instance
 
     def to_bytes(self) -> bytes:
-        return struct.pack("<B", self.syn | self.ack | self.fin)
+        return struct.pack("<B", self.flag)
 
     def __str__(self) -> str:
         if self.syn and self.ack:
@@ -50,23 +73,33 @@ class SegmentFlag:
 
         return False
 
+    def __hash__(self) -> int:
+        return hash(self.flag)
+
 
 class Segment:
+    __slots__ = ("sequence_number", "ack", "flag", "window", "checksum", "data")
+
     sequence_number: int
     ack: int
     flag: SegmentFlag
+    # segments the receiver can take starting at ack, only meaningful on ACKs
+    window: int
     checksum: int
-    data: bytes
+    # decoded segments keep a view into the received datagram instead of a copy
+    data: Union[bytes, memoryview]
 
     def __init__(self,
                  sequence_number: int = 0,
                  ack: int = 0,
                  flag: SegmentFlag = SegmentFlag(0b0),
                  checksum: int = 0,
-                 data: bytes = b"") -> None:
+                 data: Union[bytes, memoryview] = b"",
+                 window: int = 0) -> None:
         self.sequence_number = sequence_number
         self.ack = ack
         self.flag = flag
+        self.window = window
         self.checksum = checksum
         self.data = data
 
@@ -76,6 +109,7 @@ class Segment:
         result += f"{'flag-syn':12}\t\t| {self.flag.syn >> 1}\n"
         result += f"{'flag-ack':12}\t\t| {self.flag.ack >> 4}\n"
         result += f"{'flag-fin':12}\t\t| {self.flag.fin}\n"
+        result += f"{'window':12}\t\t| {self.window}\n"
         result += f"{'checksum':24}| {self.checksum}\n"
         result += f"{'data-size':24}| {len(self.data)}\n"
 
@@ -90,77 +124,126 @@ class Segment:
         self.flag = SegmentFlag(flag)
 
     def to_bytes(self) -> bytes:
-        checksum = calculate_checksum(self._get_bytes_for_checksum())
-
-        result = b""
-        result += struct.pack("<I", self.sequence_number)
-        result += struct.pack("<I", self.ack)
-        result += self.flag.to_bytes()
-        result += struct.pack("<x")
-        result += struct.pack("<H", checksum)
-        result += self.data
         hamming = Hamming()
-        result = hamming.encode(result)
+
+        return hamming.encode(self.to_raw_bytes())
+
+    def to_raw_bytes(self) -> bytearray:
+        # header and payload before error correction coding
+        result = bytearray(HEADER_SIZE + len(self.data))
+        self.pack_into(result)
 
         return result
 
+    def pack_into(self, buffer: Union[bytearray, memoryview], offset: int = 0) -> int:
+        # serialize into a preallocated buffer, returns the number of bytes written
+        view = memoryview(buffer)[offset:offset + HEADER_SIZE + len(self.data)]
+        HEADER_STRUCT.pack_into(view, 0, self.sequence_number, self.ack, self.flag.flag, self.window, 0)
+        view[HEADER_SIZE:] = self.data
+
+        self.checksum = Checksum(view[:CHECKSUM_HEADER_STRUCT.size]).update(view[HEADER_SIZE:]).digest()
+        CHECKSUM_FIELD_STRUCT.pack_into(view, CHECKSUM_OFFSET, self.checksum)
+
+        return len(view)
+
+    def pack_header(self, data_crc16: Optional[int] = None) -> bytes:
+        # header with the checksum over header and payload, for sending both without a copy.
+        # data_crc16 is the CRC of the payload started from 0 when it is already known
+        header = bytearray(HEADER_SIZE)
+        HEADER_STRUCT.pack_into(header, 0, self.sequence_number, self.ack, self.flag.flag, self.window, 0)
+        if data_crc16 is None:
+            self.checksum = Checksum(memoryview(header)[:CHECKSUM_HEADER_STRUCT.size]).update(self.data).digest()
+        else:
+            self.checksum = crc16_combine(Checksum(memoryview(header)[:CHECKSUM_HEADER_STRUCT.size]).digest(), data_crc16, len(self.data))
+        CHECKSUM_FIELD_STRUCT.pack_into(header, CHECKSUM_OFFSET, self.checksum)
+
+        return bytes(header)
+
     def is_valid(self) -> bool:
-        return calculate_checksum(self._get_bytes_for_checksum()) == self.checksum
+        return self._calculate_checksum() == self.checksum
 
-    def _get_bytes_for_checksum(self) -> bytes:
-        result = b""
-        result += struct.pack("<I", self.sequence_number)
-        result += struct.pack("<I", self.ack)
-        result += self.flag.to_bytes()
-        result += self.data
+    def _calculate_checksum(self) -> int:
+        # feed header and payload separately, no need to copy the payload
+        header = CHECKSUM_HEADER_STRUCT.pack(self.sequence_number, self.ack, self.flag.flag, self.window)
 
-        return result
+        return Checksum(header).update(self.data).digest()
 
     @staticmethod
     def from_bytes(src: bytes) -> 'Segment':
         hamming = Hamming()
-        src = hamming.decode(src)
 
-        sequence_number = struct.unpack("<I", src[0:4])[0]
-        ack = struct.unpack("<I", src[4:8])[0]
-        flag = SegmentFlag(struct.unpack("<B", src[8:9])[0])
-        checksum = struct.unpack("<H", src[10:12])[0]
-        data = b"" if len(src) == 12 else src[12:]
+        return Segment.from_raw_bytes(hamming.decode(src))
 
-        segment = Segment(
+    @staticmethod
+    def from_raw_bytes(src: Union[bytes, bytearray, memoryview]) -> 'Segment':
+        view = memoryview(src)
+        if len(view) < HEADER_SIZE:
+            raise InvalidChecksumException()
+
+        (sequence_number, ack, flag, window, checksum) = HEADER_STRUCT.unpack_from(view)
+        data = view[HEADER_SIZE:]
+
+        # verify straight from the received buffer, header and payload are never copied
+        if Checksum(view[:CHECKSUM_HEADER_STRUCT.size]).update(data).digest() != checksum:
+            raise InvalidChecksumException()
+
+        return Segment(
             sequence_number,
             ack,
-            flag,
+            SegmentFlag(flag),
             checksum,
-            data
+            data if len(data) else b"",
+            window
         )
 
-        if not segment.is_valid():
-            raise InvalidChecksumException()
-
-        return segment
+    @staticmethod
+    def syn_segment(sequence_number: int, data: bytes = b"") -> 'Segment':
+        # data carries the handshake options offered by the client
+        return Segment(
+            sequence_number=sequence_number,
+            flag=SegmentFlag(int(FlagEnum.SYN_FLAG)),
+            data=data
+        )
 
     @staticmethod
-    def syn_segment(sequence_number: int) -> 'Segment':
+    def handshake_ack_segment(sequence_number: int, ack: int, data: bytes = b"") -> 'Segment':
+        # last segment of the handshake, data repeats the options the client offered so a
+        # server that kept nothing from the SYN can still negotiate
         return Segment(
             sequence_number=sequence_number,
-            flag=SegmentFlag(int(FlagEnum.SYN_FLAG))
+            ack=ack,
+            flag=SegmentFlag(int(FlagEnum.ACK_FLAG)),
+            data=data
         )
 
+    def is_handshake_ack(self) -> bool:
+        # ACKs of received data always carry sequence number 0, the client sends no data
+        return self.flag == FlagEnum.ACK_FLAG and self.sequence_number != 0
+
+    def sack_blocks(self) -> List[Tuple[int, int]]:
+        # a trailing partial block is ignored
+        usable = len(self.data) - len(self.data) % SACK_BLOCK_STRUCT.size
+        return list(SACK_BLOCK_STRUCT.iter_unpack(self.data[:usable]))
+
     @staticmethod
-    def ack_segment(sequence_number: int, ack: int) -> 'Segment':
+    def ack_segment(sequence_number: int, ack: int, sack_blocks: Iterable[Tuple[int, int]] = (), window: int = 0) -> 'Segment':
+        # sack_blocks are ranges received above ack, reported so only the gaps get resent
         return Segment(
             sequence_number=sequence_number,
             ack=ack,
-            flag=SegmentFlag(int(FlagEnum.ACK_FLAG))
+            flag=SegmentFlag(int(FlagEnum.ACK_FLAG)),
+            data=b"".join(SACK_BLOCK_STRUCT.pack(start, end) for (start, end) in sack_blocks),
+            window=window
         )
 
     @staticmethod
-    def syn_ack_segment(sequence_number: int, ack: int) -> 'Segment':
+    def syn_ack_segment(sequence_number: int, ack: int, data: bytes = b"") -> 'Segment':
+        # data carries the handshake options chosen by the server
         return Segment(
             sequence_number=sequence_number,
             ack=ack,
-            flag=SegmentFlag(int(FlagEnum.SYN_ACK_FLAG))
+            flag=SegmentFlag(int(FlagEnum.SYN_ACK_FLAG)),
+            data=data
         )
 
     @staticmethod
@@ -179,7 +262,7 @@ class Segment:
         )
 
     @staticmethod
-    def data_segment(data: bytes) -> 'Segment':
+    def data_segment(data: Union[bytes, memoryview]) -> 'Segment':
         return Segment(
             data=data,
             flag=SegmentFlag(0)
@@ -0,0 +1,136 @@
+import binascii
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple, Union
+
+from .codec import Codec
+from .constants import CodecEnum, SEGMENT_CACHE_SIZE
+from .file import FilePayload
+from .manifest import TreePayload
+from .delta import SignaturePayload
+from .compression import CompressedPayload
+from .hamming import Buffer
+
+# (file key, chunk size, chunk number, codec)
+ChunkKey = Tuple[Tuple[str, int, int, int, int], int, int, CodecEnum]
+
+# bookkeeping charged per entry on top of the encoded bytes
+ENTRY_OVERHEAD = 200
+
+class EncodedChunk:
+    __slots__ = ("encoded", "crc16", "length", "size")
+
+    # None when the codec leaves the payload as it is
+    encoded: Optional[bytes]
+    # CRC of the raw payload started from 0, combined with each header CRC
+    crc16: int
+    # length of the raw payload
+    length: int
+    size: int
+
+    def __init__(self, encoded: Optional[bytes], crc16: int, length: int) -> None:
+        self.encoded = encoded
+        self.crc16 = crc16
+        self.length = length
+        self.size = (len(encoded) if encoded is not None else 0) + ENTRY_OVERHEAD
+
+class SegmentCache:
+    # encoded payloads shared by every sender in the process, least recently used first out.
+    # A byte-wise codec encodes header and payload independently, so only the small
+    # header is encoded per connection and per transmission
+    capacity: int
+    size: int
+    entries: 'OrderedDict[ChunkKey, EncodedChunk]'
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, capacity: int = SEGMENT_CACHE_SIZE) -> None:
+        self.capacity = capacity
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def caches(payload: Union[FilePayload, TreePayload, SignaturePayload, CompressedPayload]) -> bool:
+        # only payloads whose key and chunk number always name the same bytes. A compressed
+        # chunk differs between connections, each one compresses it on its own
+        return isinstance(payload, (FilePayload, TreePayload, SignaturePayload))
+
+    def get_chunks(self, payload: Union[FilePayload, TreePayload, SignaturePayload, CompressedPayload], chunk_numbers: Sequence[int], codec: Codec) -> List[EncodedChunk]:
+        if not self.caches(payload):
+            raise ValueError(f"chunks of {type(payload).__name__} cannot be cached")
+
+        keys = [(payload.key, payload.chunk_size, number, codec.codec_id) for number in chunk_numbers]
+        chunks: List[Optional[EncodedChunk]] = []
+
+        with self.lock:
+            for key in keys:
+                chunk = self.entries.get(key)
+                if chunk is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                chunks.append(chunk)
+
+        missing = [index for (index, chunk) in enumerate(chunks) if chunk is None]
+        if missing:
+            # misses of one window are encoded together, outside the lock
+            data = [payload.get_chunk(chunk_numbers[index]) for index in missing]
+            encoded: Sequence[Optional[Buffer]] = [None] * len(data) if codec.identity else codec.encode_batch(data)
+
+            for (index, raw, coded) in zip(missing, data, encoded):
+                chunk = EncodedChunk(bytes(coded) if coded is not None else None, binascii.crc_hqx(raw, 0), len(raw))
+                chunks[index] = chunk
+                self._put(keys[index], chunk)
+
+        return chunks  # type: ignore[return-value]
+
+    def _put(self, key: ChunkKey, chunk: EncodedChunk) -> None:
+        if chunk.size > self.capacity:
+            return
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+
+            self.entries[key] = chunk
+            self.size += chunk.size
+
+            while self.size > self.capacity:
+                (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions += 1
+
+    def resize(self, capacity: int) -> None:
+        with self.lock:
+            self.capacity = capacity
+            while self.entries and self.size > self.capacity:
+                (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __str__(self) -> str:
+        return f"segment cache {self.hits} hits, {self.misses} misses, {self.evictions} evictions, {len(self.entries)} chunks in {self.size / 1e6:.1f}/{self.capacity / 1e6:.0f} MB"
+
+_segment_cache: Optional[SegmentCache] = None
+_segment_cache_lock = threading.Lock()
+
+def get_segment_cache() -> SegmentCache:
+    global _segment_cache
+
+    with _segment_cache_lock:
+        if _segment_cache is None:
+            _segment_cache = SegmentCache()
+
+    return _segment_cache
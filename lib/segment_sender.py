@@ -1,22 +1,103 @@
+import bisect
 import logging
-from threading import Thread, Event
-from time import sleep
+from threading import Lock
+from time import monotonic
 from .segment import Segment
 from .connection import Connection
 from .file import FilePayload
+from .manifest import TreePayload, open_payload
+from .delta import SignaturePayload
+from .compression import CompressedPayload, Compressor
+from .segment_cache import SegmentCache
+from .codec import Codec
+from .hamming import Buffer
 from .connection import MessageInfo
-from .constants import TIMEOUT
+from .constants import CompressionEnum, PAYLOAD_SIZE, MAX_RETRY, MIN_RTO, RECEIVE_WINDOW, DUPLICATE_ACK_THRESHOLD, MIN_PROBE_TIMEOUT, ACK_DELAY
+from .scheduler import AnyScheduler, Timer, get_scheduler
+from .rtt import RTTEstimator
+from .congestion import CongestionControl, DEFAULT_CONGESTION_CONTROL, create_congestion_control
 
-from collections import deque
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+class InFlightSegment:
+    __slots__ = ("segment", "encoded", "timer", "retry", "sent_at")
+
+    segment: Segment
+    # None when the codec leaves the segment as it is, a list when header and payload
+    # were encoded apart
+    encoded: Optional[Union[bytes, List[Buffer]]]
+    timer: Optional[Timer]
+    retry: int
+    sent_at: float
+
+    def __init__(self, segment: Segment, encoded: Optional[Union[bytes, List[Buffer]]]) -> None:
+        self.segment = segment
+        self.encoded = encoded
+        self.timer = None
+        self.retry = 0
+        self.sent_at = 0
+
+def encode_segments(segments: Sequence[Segment],
+                    payload: Union[FilePayload, TreePayload, SignaturePayload, CompressedPayload],
+                    init_sequence_number: int,
+                    codec: Codec,
+                    segment_cache: Optional[SegmentCache]) -> List[Optional[Union[bytes, List[Buffer]]]]:
+    # data segments of payload ready for Connection.send. Without a codec the connection
+    # sends header and payload as they are
+    if segment_cache is not None and codec.bytewise and segment_cache.caches(payload):
+        # the payloads come encoded from the cache shared with the other senders, only
+        # the header of this connection is encoded here. A cached chunk not of the length
+        # of the segment is of other bytes, the segment is then encoded whole
+        chunks = segment_cache.get_chunks(payload, [segment.sequence_number - init_sequence_number for segment in segments], codec)
+        return [
+            [codec.encode(segment.pack_header(chunk.crc16)), chunk.encoded if chunk.encoded is not None else segment.data]
+            if chunk.length == len(segment.data) else codec.encode(segment.to_raw_bytes())
+            for (segment, chunk) in zip(segments, chunks)
+        ]
+    elif codec.identity:
+        return [None] * len(segments)
+
+    return list(codec.encode_batch([segment.to_raw_bytes() for segment in segments]))
 
 class SenderBuffer:
     ip_dest: str
     port_dest: int
     connection: Connection
-    file_payload: FilePayload
-    event_buffer: deque[Event]
-    thread_buffer: deque[Thread]
-    window_size: int = 4
+    file_payload: Union[FilePayload, TreePayload, SignaturePayload, CompressedPayload]
+    # segments sent but not acknowledged yet, ordered by sequence number
+    in_flight: Dict[int, InFlightSegment]
+    # in flight segments presumed lost and waiting for room in the window to be resent
+    lost: Dict[int, None]
+    # in flight segments the receiver reported in a sack block, never resent
+    sacked: Set[int]
+    scheduler: AnyScheduler
+    rtt: RTTEstimator
+    congestion: CongestionControl
+    retransmissions: int
+    fast_retransmits: int
+    probes: int
+    # retransmission timeouts below this sequence number belong to a loss already reacted to
+    recovery_point: int
+    # fast recovery lasts until everything sent before the loss was detected is acked
+    in_recovery: bool
+    duplicate_acks: int
+    # send time of the most recently sent segment known to be delivered
+    delivered_sent_at: float
+    # tail loss probe, rearmed on every ack
+    probe: Optional[Timer]
+    # segments the receiver can take beyond the cumulative ack, as advertised in its last ACK
+    receive_window: int
+    # zero window probe, fires while the receiver advertises no room and nothing is in flight
+    persist: Optional[Timer]
+    persist_retry: int
+    window_probes: int
+    aborted: bool
+    # [start, end) sequence numbers the receiver kept from an earlier transfer, never sent
+    resumed: List[Tuple[int, int]]
+    resumed_starts: List[int]
+    skipped_segments: int
+    skipped_bytes: int
     last_byte_acked: int
     init_sequence_number: int
 
@@ -26,65 +107,424 @@ class SenderBuffer:
                  port_dest: int,
                  path: str,
                  init_sequence_number: int,
+                 chunk_size: int = PAYLOAD_SIZE,
+                 scheduler: Optional[AnyScheduler] = None,
+                 min_rto: float = MIN_RTO,
+                 congestion_control: str = DEFAULT_CONGESTION_CONTROL,
+                 segment_cache: Optional[SegmentCache] = None,
+                 resumed: Sequence[Tuple[int, int]] = (),
+                 signatures: bool = False,
+                 compression: CompressionEnum = CompressionEnum.NONE,
                  ) -> None:
         self.connection = connection
         self.ip_dest = ip_dest
         self.port_dest = port_dest
-        self.file_payload = FilePayload(path)
+        self.file_payload = open_payload(path, chunk_size, signatures)
+        if compression != CompressionEnum.NONE:
+            self.file_payload = CompressedPayload(self.file_payload, Compressor(compression, self.link_rate))
+        self.segment_cache = segment_cache
         self.last_byte_acked = init_sequence_number - 1
         self.last_byte_send = init_sequence_number - 1
         self.init_sequence_number = init_sequence_number
-        self.event_buffer = deque()
-        self.thread_buffer = deque()
+        self.in_flight = OrderedDict()
+        self.lost = {}
+        self.sacked = set()
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        self.rtt = RTTEstimator(min_rto=min_rto)
+        self.congestion = create_congestion_control(congestion_control)
+        self.retransmissions = 0
+        self.fast_retransmits = 0
+        self.probes = 0
+        self.recovery_point = init_sequence_number
+        self.in_recovery = False
+        self.duplicate_acks = 0
+        self.delivered_sent_at = 0
+        self.probe = None
+        self.receive_window = RECEIVE_WINDOW
+        self.persist = None
+        self.persist_retry = 0
+        self.window_probes = 0
+        self.aborted = False
+        # chunk n of the file is sent with sequence number init_sequence_number + 1 + n
+        self.resumed = sorted((init_sequence_number + 1 + start, init_sequence_number + 1 + end) for (start, end) in resumed)
+        self.resumed_starts = [start for (start, _) in self.resumed]
+        self.skipped_segments = 0
+        self.skipped_bytes = 0
+        # acks arrive on the receive loop while retransmissions fire on the scheduler thread
+        self.lock = Lock()
+
+    def send(self, ack_number: int, sack_blocks: Iterable[Tuple[int, int]] = (), window: Optional[int] = None) -> None:
+        with self.lock:
+            if ack_number <= self.last_byte_acked or self.aborted:
+                return
+            try:
+                acked = self._end_task(ack_number)
+                self.last_byte_acked = ack_number - 1
+                self._mark_sacked(sack_blocks)
+
+                if acked:
+                    self.duplicate_acks = 0
+                elif self.in_flight and (window is None or window == self.receive_window):
+                    # a window update is not a duplicate
+                    self.duplicate_acks += 1
+
+                if window is not None:
+                    self._update_window(window)
+
+                if self.in_recovery and ack_number >= self.recovery_point:
+                    self.in_recovery = False
+
+                # the window stays at ssthresh for the whole recovery
+                if not self.in_recovery:
+                    self.congestion.on_ack(acked, self.rtt.srtt)
+
+                in_flight = len(self.in_flight)
+                if self._detect_losses() and not self.in_recovery:
+                    self.in_recovery = True
+                    self.recovery_point = self.last_byte_send + 1
+                    self.congestion.on_fast_loss(in_flight)
+                    # fast retransmit, the first hole goes out even if the reduced window is full
+                    self._retransmit_lost()
+
+                self._fill_window()
+                self._arm_probe()
+            except Exception as e:
+                logging.info(f"ERROR {e}")
+
+    def link_rate(self) -> Optional[float]:
+        # bytes per second a full window takes per round trip, what compression has to keep up with
+        if self.rtt.samples == 0:
+            return None
+
+        return min(self.congestion.window, self.receive_window) * self.file_payload.chunk_size / max(self.rtt.srtt, 1e-6)
+
+    @property
+    def pipe(self) -> int:
+        # segments presumed to still be in the network
+        return len(self.in_flight) - len(self.lost) - len(self.sacked)
+
+    def _fill_window(self) -> None:
+        # resend what is presumed lost first, oldest first, then open new segments
+        while self.lost and self.pipe < self.congestion.window:
+            self._retransmit_lost()
+
+        # new segments must fit in both the congestion window and the receiver's window
+        usable = min(
+            self.congestion.window - self.pipe,
+            self.last_byte_acked + 1 + self.receive_window - (self.last_byte_send + 1),
+        )
+        if usable > 0:
+            self._start_task(usable)
+        elif self.receive_window == 0 and not self.in_flight and self._has_unsent():
+            self._arm_persist()
+
+    def _has_unsent(self) -> bool:
+        return self.last_byte_send + 1 - self.init_sequence_number <= self.file_payload.total_chunk
+
+    def _update_window(self, window: int) -> None:
+        if window > 0 and self.persist is not None:
+            self.scheduler.cancel(self.persist)
+            self.persist = None
+
+        if window > 0 and self.receive_window == 0:
+            # whatever went out into the zero window was dropped, resend it right away
+            self.persist_retry = 0
+            for (sequence_number, entry) in self.in_flight.items():
+                if sequence_number in self.sacked:
+                    continue
+                if entry.timer is not None:
+                    self.scheduler.cancel(entry.timer)
+                    entry.timer = None
+                self.lost[sequence_number] = None
+
+        self.receive_window = window
+
+    def _arm_persist(self) -> None:
+        if self.persist is None:
+            self.persist = self.scheduler.schedule(self.rtt.backoff(self.persist_retry), self._on_persist)
+
+    def _on_persist(self) -> None:
+        # the window update may have been lost, send one segment past the window to get a fresh ACK
+        with self.lock:
+            self.persist = None
+            if self.aborted or self.receive_window > 0 or self.in_flight:
+                return None
+
+            logging.info(f"[Client {self.ip_dest}:{self.port_dest}] zero window probe ({self.rtt})")
+            self.persist_retry += 1
+            self.window_probes += 1
+            self._start_task(1)
+
+        return None
+
+    def _retransmit_lost(self) -> None:
+        sequence_number = min(self.lost)
+        del self.lost[sequence_number]
+
+        self._retransmit(self.in_flight[sequence_number])
+
+    def _retransmit(self, entry: InFlightSegment) -> None:
+        entry.retry += 1
+        self.retransmissions += 1
+        self._transmit(entry)
+        self._arm(entry)
+
+    def _detect_losses(self) -> int:
+        # a hole is lost once enough segments above it were sacked (RFC 6675), once a
+        # segment sent a quarter rtt after it was delivered (RFC 8985), or on three
+        # duplicate acks for the first unacked segment
+        if not self.sacked and self.duplicate_acks < DUPLICATE_ACK_THRESHOLD:
+            return 0
+
+        reordering_window = self.rtt.srtt / 4
+        sacked_above = 0
+        detected = 0
+
+        for sequence_number in reversed(self.in_flight):
+            if sequence_number in self.sacked:
+                sacked_above += 1
+                continue
+            if sequence_number in self.lost:
+                continue
+
+            entry = self.in_flight[sequence_number]
+            if entry.sent_at < self.delivered_sent_at:
+                is_lost = sacked_above >= DUPLICATE_ACK_THRESHOLD or self.delivered_sent_at - entry.sent_at > reordering_window
+            else:
+                # already resent since the newest delivered segment went out
+                is_lost = False
+
+            if sequence_number == self.last_byte_acked + 1 and self.duplicate_acks >= DUPLICATE_ACK_THRESHOLD and not self.in_recovery:
+                self.duplicate_acks = 0
+                is_lost = True
+
+            if is_lost:
+                if entry.timer is not None:
+                    self.scheduler.cancel(entry.timer)
+                    entry.timer = None
+                self.lost[sequence_number] = None
+                self.fast_retransmits += 1
+                detected += 1
+
+        return detected
+
+    def _arm_probe(self) -> None:
+        if self.probe is not None:
+            self.scheduler.cancel(self.probe)
+            self.probe = None
 
-    def send(self, ack_number: int) -> None:
-        if ack_number <= self.last_byte_acked:
+        if not self.in_flight or self.in_recovery or self.rtt.samples == 0:
             return
-        try:
-            # print(f"ack_number {ack_number} last_byte_acked {self.last_byte_acked} last_byte_send {self.last_byte_send}")
-            self._end_task(ack_number - self.last_byte_acked - 1)
-            self._start_task(self.window_size - (self.last_byte_send - self.last_byte_acked))
-            self.last_byte_acked = ack_number - 1
-        except IndexError:
-            logging.info("INDEX ERROR PLIS HAJDLE")
-            # todo index error
-        except Exception as e:
-            logging.info(f"ERROR {e}")
-    
-    def _send_segment_with_backoff_timeout(self, event: Event, segment: Segment, timeout = TIMEOUT, max_retry: int = 10) -> None:
-        retry = 0
-
-        while not event.is_set() and retry < max_retry:
-            self.connection.send(
-                MessageInfo(
-                    self.ip_dest,
-                    self.port_dest,
-                    segment,
-                )
-            )
-            sleep(timeout)
-            retry += 1
 
+        timeout = max(2 * self.rtt.srtt, MIN_PROBE_TIMEOUT)
+        if self.pipe == 1:
+            # a lone segment may be waiting on the receiver's delayed ack
+            timeout += ACK_DELAY
+        if timeout < self.rtt.rto:
+            self.probe = self.scheduler.schedule(timeout, self._on_probe)
+
+    def _on_probe(self) -> None:
+        # nothing was acked for two srtt, the tail of the window may be gone without
+        # anything left to trigger duplicate acks. Resending the newest segment makes
+        # the receiver sack it and reveal the holes before it
+        with self.lock:
+            self.probe = None
+            if self.aborted or self.in_recovery:
+                return None
+
+            for sequence_number in reversed(self.in_flight):
+                if sequence_number not in self.sacked and sequence_number not in self.lost:
+                    logging.info(f"[Client {self.ip_dest}:{self.port_dest}] tail loss probe with segment {sequence_number} ({self.rtt})")
+                    self.probes += 1
+                    self._retransmit(self.in_flight[sequence_number])
+                    break
+
+        return None
+
+    def _arm(self, entry: InFlightSegment) -> None:
+        if entry.timer is not None:
+            self.scheduler.cancel(entry.timer)
+
+        entry.timer = self.scheduler.schedule(
+            self.rtt.backoff(entry.retry),
+            lambda sequence_number=entry.segment.sequence_number: self._on_timeout(sequence_number)
+        )
+
+    def _on_timeout(self, sequence_number: int, max_retry: int = MAX_RETRY) -> None:
+        with self.lock:
+            entry = self.in_flight.get(sequence_number)
+            if entry is None or sequence_number in self.lost or sequence_number in self.sacked or self.aborted:
+                return None
+
+            if entry.retry >= max_retry:
+                logging.info(f"[Client {self.ip_dest}:{self.port_dest}] giving up on segment {sequence_number} after {entry.retry} retries, aborting transfer")
+                self._abort()
+                return None
+
+            if sequence_number >= self.last_byte_acked + 1 + self.receive_window:
+                # a zero window probe, keep probing with backoff without touching the congestion state
+                self.window_probes += 1
+                self._retransmit(entry)
+                return None
+
+            logging.info(f"[Client {self.ip_dest}:{self.port_dest}] timeout for segment {sequence_number} (retry {entry.retry}, {self.rtt})")
+
+            if sequence_number >= self.recovery_point or self.in_recovery:
+                self.congestion.on_timeout(self.pipe)
+                self.recovery_point = self.last_byte_send + 1
+                self.in_recovery = False
+
+                # every hole in the window is presumed lost, resent as the window reopens
+                for (outstanding, other) in self.in_flight.items():
+                    if outstanding in self.sacked:
+                        continue
+                    if other.timer is not None:
+                        self.scheduler.cancel(other.timer)
+                        other.timer = None
+                    self.lost[outstanding] = None
+            else:
+                # a retransmission was lost as well
+                self.lost[sequence_number] = None
+
+            self._fill_window()
+
+        return None
+
+    def _transmit(self, entry: InFlightSegment) -> None:
+        entry.sent_at = monotonic()
+        self.connection.send(
+            MessageInfo(
+                self.ip_dest,
+                self.port_dest,
+                entry.segment,
+            ),
+            entry.encoded,
+        )
+
+    def _resumed_end(self, sequence_number: int) -> Optional[int]:
+        index = bisect.bisect_right(self.resumed_starts, sequence_number) - 1
+        if index >= 0 and sequence_number < self.resumed[index][1]:
+            return self.resumed[index][1]
+
+        return None
+
+    def _skip(self, last_byte_send: int) -> None:
+        chunk_size = self.file_payload.chunk_size
+        # sequence number init_sequence_number + 1 + n carries the bytes from n * chunk_size
+        start = (self.last_byte_send - self.init_sequence_number) * chunk_size
+        end = min((last_byte_send - self.init_sequence_number) * chunk_size, self.file_payload.filesize)
+        self.skipped_segments += last_byte_send - self.last_byte_send
+        self.skipped_bytes += end - start
+        self.last_byte_send = last_byte_send
 
     def _start_task(self, count: int) -> None:
-        for _ in range(count):
+        segments: List[Segment] = []
+        while len(segments) < count:
+            if self.last_byte_send + 1 - self.init_sequence_number > self.file_payload.total_chunk:
+                break
+
+            end = self._resumed_end(self.last_byte_send + 1) if self.resumed else None
+            if end is not None:
+                # the receiver acks these on its own once it reaches them, only skip as far as
+                # its window so what follows is not sent beyond it
+                window_end = self.last_byte_acked + 1 + self.receive_window
+                if window_end <= self.last_byte_send + 1:
+                    window_end = end
+                self._skip(min(end, window_end) - 1)
+                if end > window_end:
+                    break
+                continue
+
             segment = self.file_payload.get_segment(self.last_byte_send + 1 - (self.init_sequence_number))
             segment.sequence_number = self.last_byte_send + 1
-            event = Event()
-            thread = Thread(target=self._send_segment_with_backoff_timeout, args=(event, segment,))
-            thread.start()
-            self.event_buffer.append(event)
-            self.thread_buffer.append(thread)
+            segments.append(segment)
             self.last_byte_send += 1
-            
-
-    def _end_task(self, count: int) -> None:
-        for _ in range(count):
-            event = self.event_buffer.popleft()
-            thread = self.thread_buffer.popleft()
-            event.set()
-            self.last_byte_acked += 1
-
-    def set_all_thread(self):
-        for ev in self.event_buffer:
-            ev.set()
+
+        if not segments:
+            return
+
+        # encode the whole window in one call, retransmissions reuse the encoded bytes
+        codec = self.connection.get_codec(self.ip_dest, self.port_dest)
+        encoded_segments = encode_segments(segments, self.file_payload, self.init_sequence_number, codec, self.segment_cache)
+
+        for (segment, encoded) in zip(segments, encoded_segments):
+            entry = InFlightSegment(segment, encoded)
+            self.in_flight[segment.sequence_number] = entry
+            self._transmit(entry)
+            self._arm(entry)
+
+    def _end_task(self, ack_number: int) -> int:
+        # cumulative ack, everything below ack_number has been received
+        newest: Optional[InFlightSegment] = None
+        acked = 0
+
+        while self.in_flight:
+            sequence_number = next(iter(self.in_flight))
+            if sequence_number >= ack_number:
+                break
+
+            entry = self.in_flight.pop(sequence_number)
+            self.lost.pop(sequence_number, None)
+            if entry.timer is not None:
+                self.scheduler.cancel(entry.timer)
+            # segments sacked earlier were already timed when their sack arrived
+            if sequence_number in self.sacked:
+                self.sacked.discard(sequence_number)
+            else:
+                newest = entry
+                self.delivered_sent_at = max(self.delivered_sent_at, entry.sent_at)
+            acked += 1
+
+        self._sample(newest)
+
+        return acked
+
+    def _mark_sacked(self, sack_blocks: Iterable[Tuple[int, int]]) -> int:
+        # segments held by the receiver above the cumulative ack
+        newest: Optional[InFlightSegment] = None
+        sacked = 0
+
+        for (start, end) in sack_blocks:
+            for sequence_number in range(max(start, self.last_byte_acked + 1), min(end, self.last_byte_send + 1)):
+                entry = self.in_flight.get(sequence_number)
+                if entry is None or sequence_number in self.sacked:
+                    continue
+
+                self.sacked.add(sequence_number)
+                self.lost.pop(sequence_number, None)
+                if entry.timer is not None:
+                    self.scheduler.cancel(entry.timer)
+                    entry.timer = None
+                if newest is None or sequence_number > newest.segment.sequence_number:
+                    newest = entry
+                self.delivered_sent_at = max(self.delivered_sent_at, entry.sent_at)
+                sacked += 1
+
+        self._sample(newest)
+
+        return sacked
+
+    def _sample(self, newest: Optional[InFlightSegment]) -> None:
+        # Karn's rule, an ack for a retransmitted segment is ambiguous
+        if newest is not None and newest.retry == 0:
+            self.rtt.sample(monotonic() - newest.sent_at)
+
+    def _abort(self) -> None:
+        self.aborted = True
+        if self.probe is not None:
+            self.scheduler.cancel(self.probe)
+            self.probe = None
+        if self.persist is not None:
+            self.scheduler.cancel(self.persist)
+            self.persist = None
+        for entry in self.in_flight.values():
+            if entry.timer is not None:
+                self.scheduler.cancel(entry.timer)
+        self.in_flight.clear()
+        self.lost.clear()
+        self.sacked.clear()
+
+    def cancel_all(self):
+        with self.lock:
+            self._abort()
+            self.file_payload.close()
@@ -0,0 +1,92 @@
+from typing import Iterable, Optional
+
+from .codec import CodecState
+from .compression import CompressedPayload
+from .multicast import MulticastSender
+from .segment_sender import SenderBuffer
+
+class ServerStats:
+    # totals over every connection a server released, workers send theirs to the parent
+    connections: int
+    bytes_sent: int
+    segments_sent: int
+    retransmissions: int
+    fast_retransmits: int
+    probes: int
+    window_probes: int
+    packets_received: int
+    corrected_errors: int
+    checksum_failures: int
+    # file bytes that went through compression, what it made of them and the time it took
+    compression_input: int
+    compression_output: int
+    compression_time: float
+
+    def __init__(self) -> None:
+        self.connections = 0
+        self.bytes_sent = 0
+        self.segments_sent = 0
+        self.retransmissions = 0
+        self.fast_retransmits = 0
+        self.probes = 0
+        self.window_probes = 0
+        self.packets_received = 0
+        self.corrected_errors = 0
+        self.checksum_failures = 0
+        self.compression_input = 0
+        self.compression_output = 0
+        self.compression_time = 0
+
+    def record(self, sender_buffer: SenderBuffer, codec_state: Optional[CodecState]) -> None:
+        self.connections += 1
+        self.bytes_sent += sender_buffer.file_payload.filesize - sender_buffer.skipped_bytes
+        # metadata segment plus every chunk the client did not keep from an earlier transfer,
+        # retransmissions counted separately
+        self.segments_sent += sender_buffer.file_payload.total_chunk + 1 - sender_buffer.skipped_segments
+        self.retransmissions += sender_buffer.retransmissions
+        self.fast_retransmits += sender_buffer.fast_retransmits
+        self.probes += sender_buffer.probes
+        self.window_probes += sender_buffer.window_probes
+
+        payload = sender_buffer.file_payload
+        if isinstance(payload, CompressedPayload):
+            self.compression_input += payload.compressor.raw_bytes
+            self.compression_output += payload.compressor.compressed_bytes
+            self.compression_time += payload.compressor.compression_time
+
+        if codec_state is not None:
+            self.packets_received += codec_state.packets
+            self.corrected_errors += codec_state.corrected_errors
+            self.checksum_failures += codec_state.checksum_failures
+
+    def record_multicast(self, sender: MulticastSender) -> None:
+        # every member counts as a connection, the file itself was sent once
+        self.connections += len(sender.members)
+        self.bytes_sent += sender.file_payload.filesize
+        self.segments_sent += sender.file_payload.total_chunk + 1
+        self.retransmissions += sender.multicast_repairs + sender.unicast_repairs
+
+    def add(self, other: 'ServerStats') -> None:
+        for name in vars(other):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @staticmethod
+    def total(stats: Iterable['ServerStats']) -> 'ServerStats':
+        result = ServerStats()
+        for item in stats:
+            result.add(item)
+
+        return result
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.compression_output / self.compression_input if self.compression_input else 1.0
+
+    def __str__(self) -> str:
+        compression = ""
+        if self.compression_input:
+            compression = f", compressed {self.compression_input} bytes to {self.compression_output} ({self.compression_ratio:.1%}) in {self.compression_time:.2f}s"
+
+        return (f"{self.connections} connections, {self.bytes_sent} bytes in {self.segments_sent} segments, "
+                f"{self.retransmissions} retransmissions ({self.fast_retransmits} fast, {self.probes} probes, {self.window_probes} zero window probes), "
+                f"{self.packets_received} packets received, {self.corrected_errors} corrected bit errors, {self.checksum_failures} checksum failures{compression}")
@@ -0,0 +1,86 @@
+import logging
+from math import ceil
+from os import path
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from .connection import Connection
+from .file import FileBuilder
+from .handler import FileReceiver
+from .handshake import HandshakeOptions
+from .segment import Segment
+
+def stripe_range(index: int, count: int, chunks: int) -> Tuple[int, int]:
+    # [start, end) chunks of one stripe. Contiguous so every stripe is written to disk in
+    # long runs and the chunks of the others are skipped as two ranges
+    return (chunks * index // count, chunks * (index + 1) // count)
+
+def skipped_ranges(index: int, count: int, chunks: int) -> List[Tuple[int, int]]:
+    # what one sub-connection does not carry, handed to the resume machinery on both sides
+    (start, end) = stripe_range(index, count, chunks)
+
+    return [(first, last) for (first, last) in [(0, start), (end, chunks)] if first < last]
+
+class SharedFile:
+    # the one FileBuilder every stripe of a transfer writes into, at its own offsets
+    builder: Optional[FileBuilder]
+    receivers: List['StripeReceiver']
+
+    def __init__(self) -> None:
+        self.builder = None
+        self.receivers = []
+        self.lock = Lock()
+
+    def open(self, file_path: str, file_size_bytes: int, chunk_size: int, fsync_policy: str) -> FileBuilder:
+        with self.lock:
+            if self.builder is None:
+                self.builder = FileBuilder(file_path, file_size_bytes, self._on_written, chunk_size, fsync_policy)
+            elif (self.builder.path, self.builder.filesize, self.builder.chunk_size) != (file_path, file_size_bytes, chunk_size):
+                raise Exception(f"Stripe of {file_path} ({file_size_bytes} bytes, {chunk_size} byte chunks) does not match {self.builder.path} ({self.builder.filesize} bytes, {self.builder.chunk_size} byte chunks)")
+
+            return self.builder
+
+    def _on_written(self):
+        # the writer drains the chunks of every stripe, any of them may be waiting on its window
+        for receiver in self.receivers:
+            receiver._on_written()
+
+class StripeReceiver(FileReceiver):
+    # one of the --streams sub-connections of a client, each on its own port with its own
+    # window, receiving a contiguous stripe of the same file
+    stripe: Tuple[int, int]
+    shared: SharedFile
+    # the server answered with the stripe, otherwise it sends the whole file
+    striped: bool
+
+    def __init__(self, connection: Connection, ip: str, port: int, file_path: str, shared: SharedFile, index: int, count: int, **kwargs) -> None:
+        super().__init__(connection, ip, port, file_path, **kwargs)
+        self.stripe = (index, count)
+        self.shared = shared
+        self.striped = False
+        self.handshake_options.stripe = self.stripe
+        shared.receivers.append(self)
+
+    def _apply_handshake_options(self, segment: Segment) -> HandshakeOptions:
+        options = super()._apply_handshake_options(segment)
+        self.striped = options.stripe == self.stripe
+        if not self.striped:
+            (index, count) = self.stripe
+            logging.info(f"Server does not stripe, stream {index} of {count} {'takes the whole file' if index == 0 else 'is not used'}")
+
+        return options
+
+    def connect(self, init=True):
+        super().connect(init)
+        if init and not self.striped and self.stripe[0] > 0:
+            # the first stream takes the whole file on its own
+            self.is_file_received = True
+            self.close()
+
+    def _open_file(self, file_name: str, file_size_bytes: int) -> FileBuilder:
+        (index, count) = self.stripe
+        if self.striped:
+            self.resumed_ranges = skipped_ranges(index, count, ceil(file_size_bytes / self.chunk_size))
+        self.file_path = path.join(self.file_path, file_name)
+
+        return self.shared.open(self.file_path, file_size_bytes, self.chunk_size, self.fsync_policy)
@@ -0,0 +1,53 @@
+import hashlib
+import hmac
+import os
+import socket
+import struct
+from time import monotonic
+from typing import Optional, Union
+
+from .constants import SYN_COOKIE_SLOT, SYN_COOKIE_SLOTS
+
+# a cookie is 4 bits of time slot and 24 bits of keyed hash, well below 2^32 so the
+# sequence numbers of even a very large file never overflow the header field
+SLOT_BITS = 4
+HASH_BITS = 24
+COOKIE_INPUT_STRUCT = struct.Struct("<4sHIQ")
+
+class SynCookies:
+    # the server initial sequence number of a stateless handshake. It is checked when the
+    # final ACK comes back, which repeats the client sequence number and offer it was made of
+    secret: bytes
+
+    def __init__(self, secret: Optional[bytes] = None) -> None:
+        self.secret = secret if secret is not None else os.urandom(16)
+
+    def make(self, ip: str, port: int, client_sequence_number: int, offer: Union[bytes, memoryview], now: Optional[float] = None) -> int:
+        slot = self._slot(now)
+
+        return (slot % (1 << SLOT_BITS)) << HASH_BITS | self._hash(ip, port, client_sequence_number, offer, slot)
+
+    def check(self, ip: str, port: int, client_sequence_number: int, offer: Union[bytes, memoryview], cookie: int, now: Optional[float] = None) -> bool:
+        if cookie >> (SLOT_BITS + HASH_BITS):
+            return False
+
+        # the slot it was made in, at most SYN_COOKIE_SLOTS ago
+        current = self._slot(now)
+        age = (current - (cookie >> HASH_BITS)) % (1 << SLOT_BITS)
+        if age >= SYN_COOKIE_SLOTS or age > current:
+            return False
+
+        expected = self._hash(ip, port, client_sequence_number, offer, current - age)
+        received = cookie & ((1 << HASH_BITS) - 1)
+
+        return hmac.compare_digest(expected.to_bytes(HASH_BITS // 8, "little"), received.to_bytes(HASH_BITS // 8, "little"))
+
+    def _hash(self, ip: str, port: int, client_sequence_number: int, offer: Union[bytes, memoryview], slot: int) -> int:
+        message = COOKIE_INPUT_STRUCT.pack(socket.inet_aton(ip), port, client_sequence_number, slot) + bytes(offer)
+        digest = hmac.new(self.secret, message, hashlib.sha256).digest()
+
+        return int.from_bytes(digest[:HASH_BITS // 8], "little")
+
+    @staticmethod
+    def _slot(now: Optional[float]) -> int:
+        return int((monotonic() if now is None else now) / SYN_COOKIE_SLOT)
@@ -1,12 +1,14 @@
 import random
 import logging
-import threading
-import time
 from .connection import Connection, MessageInfo
 from .segment import Segment
-from .constants import FlagEnum, TIMEOUT
+from .constants import FlagEnum, CodecEnum, TIMEOUT, TIME_WAIT
+from .codec import DEFAULT_CODEC
+from .handshake import HandshakeOptions
+from .scheduler import AnyScheduler, get_scheduler
 from socket import timeout as socket_timeout
 from enum import Enum
+from typing import List, Optional
 
 class TCPStatusEnum(Enum):
     UNINITIALIZED = 0
@@ -45,10 +47,23 @@ class BaseTCP:
 class TCPClient(BaseTCP):
     handshake_sequence_number: int = 0
     server_sequence_number: int = 0
+    handshake_options: HandshakeOptions
 
-    def __init__(self, connection: Connection, ip: str, port: int) -> None:
+    def __init__(self, connection: Connection, ip: str, port: int, codecs: Optional[List[CodecEnum]] = None) -> None:
         super().__init__(connection, ip, port)
         self.handshake_sequence_number = random.randint(0, 50)
+        self.handshake_options = HandshakeOptions(codecs=codecs if codecs is not None else [DEFAULT_CODEC])
+
+    def _apply_handshake_options(self, segment: Segment) -> HandshakeOptions:
+        # switch codec only after the ACK went out, the server still expects it with the default one
+        options = HandshakeOptions.from_bytes(segment.data)
+        self.connection.set_codec(self.ip, self.port, options.codec if options.codec is not None else DEFAULT_CODEC)
+
+        return options
+
+    def _handshake_ack(self) -> Segment:
+        # repeats the offer, a server using SYN cookies negotiates again from it
+        return Segment.handshake_ack_segment(self.handshake_sequence_number + 1, self.server_sequence_number, self.handshake_options.to_bytes())
 
     def connect(self, init=True):
         if init:
@@ -58,7 +73,7 @@ class TCPClient(BaseTCP):
             try:
                 if self.status == TCPStatusEnum.UNINITIALIZED:
 
-                    self.connection.send(MessageInfo(self.ip, self.port, Segment.syn_segment(self.handshake_sequence_number)))
+                    self.connection.send(MessageInfo(self.ip, self.port, Segment.syn_segment(self.handshake_sequence_number, self.handshake_options.to_bytes())))
 
                     message = self.connection.receive(TIMEOUT)
 
@@ -67,7 +82,8 @@ class TCPClient(BaseTCP):
                     if message.segment.flag == FlagEnum.SYN_ACK_FLAG:
                         if message.segment.ack == self.handshake_sequence_number + 1:
                             self.server_sequence_number = message.segment.sequence_number + 1
-                            self.connection.send(MessageInfo(self.ip, self.port, Segment.ack_segment(0, self.server_sequence_number)))
+                            self.connection.send(MessageInfo(self.ip, self.port, self._handshake_ack()))
+                            self._apply_handshake_options(message.segment)
                             self.status = TCPStatusEnum.WAITING_FIRST_PACKET
                             break
                         else:
@@ -81,7 +97,8 @@ class TCPClient(BaseTCP):
                     if message.segment.flag == FlagEnum.SYN_ACK_FLAG:
                         if message.segment.ack == self.handshake_sequence_number + 1:
                             self.server_sequence_number = message.segment.sequence_number + 1
-                            self.connection.send(MessageInfo(self.ip, self.port, Segment.ack_segment(0, self.server_sequence_number)))
+                            self.connection.send(MessageInfo(self.ip, self.port, self._handshake_ack()))
+                            self._apply_handshake_options(message.segment)
                             self.status = TCPStatusEnum.WAITING_FIRST_PACKET
                             break
                         else:
@@ -90,7 +107,7 @@ class TCPClient(BaseTCP):
                         logging.info("Received packet with flag other than SYN-ACK. Dropping ...")
 
                 elif self.status == TCPStatusEnum.WAITING_FIRST_PACKET and not init:
-                    self.connection.send(MessageInfo(self.ip, self.port, Segment.ack_segment(0, self.server_sequence_number)))
+                    self.connection.send(MessageInfo(self.ip, self.port, self._handshake_ack()))
                     break
 
             except socket_timeout:
@@ -147,9 +164,9 @@ class TCPClient(BaseTCP):
                         logging.info("Received packet with flag other than FIN-ACK. Dropping ...")
 
                 elif self.status == TCPStatusEnum.CLOSE_TIME_WAIT:
-                    logging.info("Waiting 10 seconds before closing connection ...")
+                    logging.info(f"Waiting {TIME_WAIT} seconds before closing connection ...")
                     try:
-                        message = self.connection.receive(10)
+                        message = self.connection.receive(TIME_WAIT)
 
                         if message.segment.flag == FlagEnum.FIN_ACK_FLAG:
                             if message.segment.ack == self.handshake_sequence_number + 1:
@@ -170,11 +187,13 @@ class TCPClient(BaseTCP):
 
 class TCPServer(BaseTCP):
     server_seqnum: int
+    scheduler: AnyScheduler
 
-    def __init__(self, connection: Connection, ip: str, port: int) -> None:
+    def __init__(self, connection: Connection, ip: str, port: int, scheduler: Optional[AnyScheduler] = None) -> None:
         super().__init__(connection, ip, port)
         self.server_seqnum = 0
         self.status = TCPStatusEnum.ESTABLISHED
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
 
     def handle_message(self, message: MessageInfo):
         # first packet received
@@ -200,8 +219,7 @@ class TCPServer(BaseTCP):
                             Segment.fin_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1),
                     ))
 
-                    thread = threading.Thread(target=self. _resend_fin_ack, args=(message.ip, message.port, client_sequence_number, server_sequence_number))
-                    thread.start()
+                    self.scheduler.schedule(TIMEOUT, lambda: self._resend_fin_ack(message.ip, message.port, client_sequence_number, server_sequence_number))
                 elif message.segment.flag == FlagEnum.ACK_FLAG and self.status == TCPStatusEnum.WAITING_LAST_ACK:
                     if message.segment.ack == self.server_seqnum + 1:
                         logging.info(f"[Client {message.ip}:{message.port}] valid LAST ACK received. Connection closed")
@@ -216,16 +234,17 @@ class TCPServer(BaseTCP):
             except socket_timeout:
                 pass
 
-    def _resend_fin_ack(self, ip: str, port: int, client_sequence_number:int, server_sequence_number: int):
-        time.sleep(TIMEOUT)
-        
-        while self.status == TCPStatusEnum.WAITING_LAST_ACK and not self.closed:
-            self.connection.send(
-                MessageInfo(
-                    ip,
-                    port,
-                    Segment.fin_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1),
-                )
+    def _resend_fin_ack(self, ip: str, port: int, client_sequence_number:int, server_sequence_number: int) -> Optional[float]:
+        # scheduler callback, repeats every TIMEOUT until the last ACK arrives
+        if self.status != TCPStatusEnum.WAITING_LAST_ACK or self.closed:
+            return None
+
+        self.connection.send(
+            MessageInfo(
+                ip,
+                port,
+                Segment.fin_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1),
             )
+        )
 
-            time.sleep(TIMEOUT)
+        return TIMEOUT
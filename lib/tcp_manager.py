@@ -1,44 +1,85 @@
 import random
 from .connection import Connection, MessageInfo
 from .segment import Segment
-from .constants import FlagEnum, TIMEOUT
+from .constants import CodecEnum, CompressionEnum, FlagEnum, TIMEOUT, MAX_RESUME_RANGES, PENDING_TIMEOUT
 from .tcp_pending import TCPPending
+from .handshake import HandshakeOptions
+from .codec import DEFAULT_CODEC, choose_codec, chunk_size_for, get_codec
 from .handler import FileSender
 from .arg import ServerArg
+from .scheduler import AnyScheduler, get_scheduler
+from .stats import ServerStats
+from .segment_cache import SegmentCache, get_segment_cache
+from .file import file_identity
+from .multicast import MulticastMember, MulticastSender, interface_for
+from .compression import METHOD_SIZE, CompressedPayload, choose_compression
+from .stripe import skipped_ranges
+from .syn_cookie import SynCookies
+from .delta import SignaturePayload
+from math import ceil
 from socket import timeout as socket_timeout
+from time import monotonic
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
 import logging
-import time
-import threading
+import os
 
 class TCPManager:
     ip: str
     port: int
     tcp_connections: Dict[Tuple[str, int], FileSender]
-    pending_connections: TCPPending = TCPPending()
+    pending_connections: TCPPending
+    # --syn-cookies, or a full pending_connections: the handshake keeps no state until the ACK
+    syn_cookies: SynCookies
     connection: Connection
     args: ServerArg
+    # handshake retransmissions and every FileSender timer run here
+    scheduler: AnyScheduler
+    stats: ServerStats
+    # None when disabled with --segment-cache 0
+    segment_cache: Optional[SegmentCache]
+    # --multicast: clients that joined the group, every one shares the initial sequence number
+    multicast_members: Dict[Tuple[str, int], MulticastMember]
+    multicast_sequence_number: int
+    # delta clients whose signature transfer is done, until when their resume connection
+    # for the chunks the old copy lacks is still accepted
+    follow_ups: Dict[Tuple[str, int], float]
 
     def __init__(self, args: ServerArg, connection: Connection):
         self.tcp_connections = {}
         self.connection = connection
         self.connection.listen()
         self.args = args
+        self.scheduler = get_scheduler()
+        self.stats = ServerStats()
+        self.pending_connections = TCPPending()
+        self.syn_cookies = SynCookies()
+        self.multicast_members = {}
+        self.multicast_sequence_number = random.randint(0, 50)
+        self.follow_ups = {}
+        self.segment_cache = None
+        if args.segment_cache_size > 0:
+            self.segment_cache = get_segment_cache()
+            self.segment_cache.resize(args.segment_cache_size)
 
-    def listen_for_connection(self):
+    def listen_for_connection(self, expected_connections: int = 0):
+        # expected_connections > 0 stops listening once that many clients are established
         logging.info("Begin listening for connections. Use Ctrl+C to stop new incoming connection")
         accept_new = True
 
         try:
-            while accept_new or self.pending_connections.tcp_client.__len__() != 0:
+            while accept_new or len(self.pending_connections) != 0:
+                if expected_connections and len(self.tcp_connections) + len(self.multicast_members) >= expected_connections:
+                    break
+
                 try:
-                    message = self.connection.receive(TIMEOUT)
-                    self._handle_connection_message(message, accept_new)
+                    for message in self.connection.receive_batch(TIMEOUT):
+                        self._handle_connection_message(message, accept_new)
                 except socket_timeout:
                     # do not exit on timeout
                     pass
+                self.pending_connections.expire()
         except KeyboardInterrupt as e:
             if not accept_new:
                 raise e
@@ -54,50 +95,137 @@ class TCPManager:
             i += 1
 
     def sequential_handle(self):
-        for _, connection in self.tcp_connections.items():
+        while self.tcp_connections or self._awaits_follow_up():
+            if not self.tcp_connections:
+                try:
+                    for message in self.connection.receive_batch(TIMEOUT):
+                        if (message.ip, message.port) in self.follow_ups:
+                            self._handle_follow_up(message)
+                except socket_timeout:
+                    pass
+                continue
+
+            (address, connection) = next(iter(self.tcp_connections.items()))
             connection.begin_transfer()
 
             while not connection.closed:
                 try:
-                    message = self.connection.receive(TIMEOUT)
+                    for message in self.connection.receive_batch(TIMEOUT):
+                        if message.ip != connection.ip or message.port != connection.port:
+                            if (message.ip, message.port) in self.follow_ups:
+                                # served after the connections before it
+                                self._handle_follow_up(message)
+                                continue
+                            logging.info("Wrong packet destination. Dropping ...")
+                            continue
 
-                    if message.ip != connection.ip or message.port != connection.port:
-                        logging.info("Wrong packet destination. Dropping ...")
-                        continue
-                        
-                    connection.handle_message(message)
+                        connection.handle_message(message)
                 except socket_timeout:
                     # do not exit on timeout
                     pass
 
+            self.tcp_connections.pop(address)
+            self._release_connection(connection)
+
     def parallel_handle(self):
         for connection in self.tcp_connections.values():
             connection.begin_transfer()
 
-        all_completed = False
-            
-        while not all_completed:
+        while self.tcp_connections or self._awaits_follow_up():
             try:
-                message = self.connection.receive(TIMEOUT)
-                
-                if (message.ip, message.port) in self.tcp_connections:
-                    tcp_server = self.tcp_connections[(message.ip, message.port)]
+                for message in self.connection.receive_batch(TIMEOUT):
+                    self._handle_transfer_message(message)
+            except socket_timeout:
+                # do not exit on timeout
+                pass
 
-                    tcp_server.handle_message(message)
+    def multicast_handle(self):
+        # the file goes once to the group for every member, clients that did not join it
+        # are served alongside as in parallel_handle
+        for connection in self.tcp_connections.values():
+            connection.begin_transfer()
 
-                    if tcp_server.closed:
-                        self.tcp_connections.pop((message.ip, message.port))
+        sender = None
+        if self.multicast_members:
+            (codec, chunk_size) = self._multicast_codec()
+            self.connection.enable_multicast(interface_for(next(iter(self.multicast_members))[0]))
+            sender = MulticastSender(self.args.file_path, self.connection, self.args.multicast, self.multicast_members, self.multicast_sequence_number + 1, chunk_size, get_codec(codec), self.args.multicast_rate, self.segment_cache)
 
-                        if len(self.tcp_connections) == 0:
-                            all_completed = True
-                else:
-                    logging.info("Detected packet for unknown connection. Dropping ...")
+        while (sender is not None and not sender.done) or self.tcp_connections or self._awaits_follow_up():
+            timeout = sender.send_due() if sender is not None and not sender.done else TIMEOUT
+            try:
+                for message in self.connection.receive_batch(timeout):
+                    if sender is not None and (message.ip, message.port) in self.multicast_members:
+                        sender.handle_message(message)
+                    else:
+                        self._handle_transfer_message(message)
             except socket_timeout:
-                # do not exit on timeout
                 pass
 
-    def _handle_connection_message(self, message: MessageInfo, accept_new: bool):
+        if sender is not None:
+            logging.info(f"[Group {self.args.multicast[0]}:{self.args.multicast[1]}] {sender}")
+            self.stats.record_multicast(sender)
+            sender.close()
+            for (ip, port) in self.multicast_members:
+                self.connection.remove_codec(ip, port)
+            self.multicast_members.clear()
+
+    def _handle_transfer_message(self, message: MessageInfo):
         if (message.ip, message.port) in self.tcp_connections:
+            tcp_server = self.tcp_connections[(message.ip, message.port)]
+
+            tcp_server.handle_message(message)
+
+            if tcp_server.closed:
+                self.tcp_connections.pop((message.ip, message.port))
+                self._release_connection(tcp_server)
+        elif (message.ip, message.port) in self.follow_ups:
+            tcp_server = self._handle_follow_up(message)
+            if tcp_server is not None:
+                tcp_server.begin_transfer()
+        else:
+            logging.info("Detected packet for unknown connection. Dropping ...")
+
+    def _handle_follow_up(self, message: MessageInfo) -> Optional[FileSender]:
+        # the handshake of the resume connection a delta client opens from the same address
+        self._handle_connection_message(message, True)
+
+        return self.tcp_connections.get((message.ip, message.port))
+
+    def _awaits_follow_up(self) -> bool:
+        now = monotonic()
+        for (address, deadline) in list(self.follow_ups.items()):
+            if deadline < now and not self.pending_connections.is_pending(*address):
+                logging.info(f"[Client {address[0]}:{address[1]}] did not come back for the delta")
+                self.follow_ups.pop(address)
+
+        return bool(self.follow_ups)
+
+    def _release_connection(self, tcp_server: FileSender):
+        (ip, port) = (tcp_server.ip, tcp_server.port)
+        sender_buffer = tcp_server.sender_buffer
+        logging.info(f"[Client {ip}:{port}] {sender_buffer.retransmissions} retransmissions ({sender_buffer.fast_retransmits} fast, {sender_buffer.probes} probes, {sender_buffer.window_probes} zero window probes), {sender_buffer.rtt}, {sender_buffer.congestion}")
+
+        state = self.connection.codec_states.get((ip, port))
+        self.stats.record(sender_buffer, state)
+        if state is not None:
+            logging.info(f"[Client {ip}:{port}] codec {state.codec}, {state.packets} packets received, {state.corrected_errors} corrected bit errors, {state.checksum_failures} checksum failures")
+        self.connection.remove_codec(ip, port)
+
+        payload = sender_buffer.file_payload
+        if isinstance(payload, CompressedPayload):
+            payload = payload.payload
+        if isinstance(payload, SignaturePayload) and sender_buffer.last_byte_acked - sender_buffer.init_sequence_number >= payload.total_chunk:
+            # every signature arrived, the client applies them to its old copy and connects again for the rest
+            self.follow_ups[(ip, port)] = monotonic() + PENDING_TIMEOUT
+
+        if isinstance(sender_buffer.file_payload, CompressedPayload):
+            logging.info(f"[Client {ip}:{port}] compression {sender_buffer.file_payload.compressor}")
+        if self.segment_cache is not None:
+            logging.info(f"[Client {ip}:{port}] {self.segment_cache}")
+
+    def _handle_connection_message(self, message: MessageInfo, accept_new: bool):
+        if (message.ip, message.port) in self.tcp_connections or (message.ip, message.port) in self.multicast_members:
             logging.info("Packet for already established connection. Dropping ...")
             return
             
@@ -110,55 +238,83 @@ class TCPManager:
             else:
                 logging.info("Server not accepting new connection. Dropping ...")
 
-    def _resend_syn_ack(self, ip: str, port: int, client_sequence_number:int, server_sequence_number: int):
-        time.sleep(TIMEOUT)
-        
-        while self.pending_connections.is_pending(ip, port):
+    def _resend_syn_ack(self, ip: str, port: int, client_sequence_number:int, server_sequence_number: int) -> Optional[float]:
+        # scheduler callback, repeats every TIMEOUT while the handshake is pending. The main
+        # thread may drop the entry at any time, it is looked up once
+        current_sequence_number = self.pending_connections.tcp_client.get((ip, port))
 
-            current_sequence_number = self.pending_connections.get_init_sequence_number(ip, port)
+        if current_sequence_number != server_sequence_number:
+            return None
 
-            if current_sequence_number != server_sequence_number:
-                break
+        options = self.pending_connections.get_options(ip, port)
 
-            self.connection.send(
-                MessageInfo(
-                    ip,
-                    port,
-                    Segment.syn_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1),
-                )
+        self.connection.send(
+            MessageInfo(
+                ip,
+                port,
+                Segment.syn_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1, data=options.to_bytes()),
             )
+        )
 
-            time.sleep(TIMEOUT)
+        return TIMEOUT
 
     def _handle_three_way_handshake(self, message: MessageInfo) -> None:
 
         segment = message.segment
         if segment.flag == FlagEnum.SYN_FLAG:
+            if self.pending_connections.is_pending(message.ip, message.port):
+                # the SYN was sent again, a new initial sequence number would not match the
+                # SYN-ACK that may still be on its way, repeat the same one instead
+                self._resend_syn_ack(message.ip, message.port, segment.sequence_number, self.pending_connections.get_init_sequence_number(message.ip, message.port))
+                return
+
             logging.info(f"[Client {message.ip}:{message.port}] Initiating three way handshake...")
 
-            server_sequence_number = random.randint(0, 50)
-            self.pending_connections.add(message.ip, message.port, server_sequence_number)
+            options = self._negotiate(HandshakeOptions.from_bytes(segment.data))
             client_sequence_number = message.segment.sequence_number
 
-
             logging.info(f"[Client {message.ip}:{message.port}] SYN received with sequence number {client_sequence_number}")
 
+            if options.multicast_group is not None:
+                # the group sends the same segments to every member, its sequence number is kept
+                server_sequence_number = self.multicast_sequence_number
+            elif self.args.syn_cookies or self.pending_connections.full:
+                # nothing is kept, the final ACK brings back what the cookie was made of. A lost
+                # SYN-ACK is recovered by the client sending its SYN again
+                server_sequence_number = self.syn_cookies.make(message.ip, message.port, client_sequence_number, segment.data)
+                self.connection.send(MessageInfo(message.ip, message.port, Segment.syn_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1, data=options.to_bytes())))
+                return
+            else:
+                server_sequence_number = random.randint(0, 50)
+            self.pending_connections.add(message.ip, message.port, server_sequence_number, options)
+
             self.connection.send(
                 MessageInfo(
                     message.ip,
                     message.port,
-                    Segment.syn_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1),
+                    Segment.syn_ack_segment(sequence_number=server_sequence_number, ack=client_sequence_number + 1, data=options.to_bytes()),
                 )
             )
 
-            thread = threading.Thread(target=self. _resend_syn_ack, args=(message.ip, message.port, client_sequence_number, server_sequence_number))
-            thread.start()
+            self.scheduler.schedule(TIMEOUT, lambda: self._resend_syn_ack(message.ip, message.port, client_sequence_number, server_sequence_number))
 
             return
         elif segment.flag == FlagEnum.ACK_FLAG:
-            if segment.ack == self.pending_connections.get_init_sequence_number(message.ip, message.port) + 1:
+            if self.pending_connections.is_pending(message.ip, message.port):
+                server_sequence_number = self.pending_connections.get_init_sequence_number(message.ip, message.port)
+                options = self.pending_connections.get_options(message.ip, message.port)
+                valid = segment.ack == server_sequence_number + 1
+            else:
+                # the client sequence number and offer come back with the ACK, the cookie proves
+                # they are those of a SYN this server answered
+                server_sequence_number = segment.ack - 1
+                valid = segment.is_handshake_ack() and self.syn_cookies.check(message.ip, message.port, segment.sequence_number - 1, segment.data, server_sequence_number)
+                options = self._negotiate(HandshakeOptions.from_bytes(segment.data)) if valid else HandshakeOptions()
+
+            if valid:
                 logging.info(f"[Client {message.ip}:{message.port}] valid ACK received")
-                self._establish_connection(message.ip, message.port)
+                self.pending_connections.remove(message.ip, message.port)
+                self._establish_connection(message.ip, message.port, server_sequence_number, options)
             else:
                 logging.info(f"[Client {message.ip}:{message.port}] invalid acknowledgemet number={segment.ack} received")
                 return
@@ -166,9 +322,62 @@ class TCPManager:
             logging.info(f"[Server {message.ip}:{message.port}] getting invalid flag={segment.flag}")
             return
             
-    def _establish_connection(self, ip: str, port: int) -> None:
-        self.tcp_connections[(ip, port)] = FileSender(self.args.file_path, self.connection, ip, port, self.pending_connections.get_init_sequence_number(ip, port) + 1)
-        self.pending_connections.remove(ip, port)
+    def _negotiate(self, offered: HandshakeOptions) -> HandshakeOptions:
+        if offered.multicast and self.args.multicast is not None:
+            # every member decodes the same segments, only a client taking the codec of the
+            # group joins it. Resume, delta and compression are per client and not offered
+            (codec, chunk_size) = self._multicast_codec()
+            if codec in (offered.codecs or [DEFAULT_CODEC]):
+                return HandshakeOptions(codec=codec, chunk_size=chunk_size, file_id=file_identity(self.args.file_path), multicast_group=self.args.multicast)
+            logging.info(f"Client does not take the {codec.name.lower()} codec of the group, serving it over unicast")
+
+        # clients that send no options only understand the default codec
+        codec = choose_codec(offered.codecs or [DEFAULT_CODEC], self.args.codecs)
+        chunk_size = chunk_size_for(codec, self.args.adaptive_codec)
+        # a chunk that does not compress goes out as it is after the method byte
+        compression = choose_compression(offered.compression, self.args.compression)
+        if compression != CompressionEnum.NONE:
+            chunk_size -= METHOD_SIZE
+        options = HandshakeOptions(codec=codec, adaptive_codec=self.args.adaptive_codec, chunk_size=chunk_size, file_id=file_identity(self.args.file_path), compression=[compression] if compression != CompressionEnum.NONE else [])
+
+        # the client kept part of this very file from an earlier connection, chunked the same way
+        if offered.resume_id is not None and offered.resume_id == options.file_id and offered.chunk_size == chunk_size:
+            chunks = ceil(os.path.getsize(self.args.file_path) / chunk_size)
+            options.resume_id = offered.resume_id
+            options.resume_ranges = [(start, min(end, chunks)) for (start, end) in offered.resume_ranges[:MAX_RESUME_RANGES] if start < chunks]
+            logging.info(f"Resuming a transfer, skipping {sum(end - start for (start, end) in options.resume_ranges)} of {chunks} chunks")
+
+        # a delta client holds an older copy and first takes the chunk signatures of this file
+        options.signatures = offered.signatures and options.file_id is not None and not options.resume_ranges
+
+        # one sub-connection of a striped client, the chunks of the other stripes are skipped as if resumed
+        if offered.stripe is not None and os.path.isfile(self.args.file_path) and options.resume_id is None and not options.signatures:
+            (index, count) = offered.stripe
+            options.stripe = offered.stripe
+            options.resume_ranges = skipped_ranges(index, count, ceil(os.path.getsize(self.args.file_path) / chunk_size))
+            logging.info(f"Sending stripe {index} of {count}")
+
+        return options
+
+    def _multicast_codec(self) -> Tuple[CodecEnum, int]:
+        # the first codec the server allows, never switched mid-transfer
+        codec = self.args.codecs[0]
+
+        return (codec, chunk_size_for(codec, False))
+
+    def _establish_connection(self, ip: str, port: int, server_sequence_number: int, options: HandshakeOptions) -> None:
+        codec = options.codec if options.codec is not None else DEFAULT_CODEC
+        chunk_size = options.chunk_size if options.chunk_size is not None else chunk_size_for(codec, options.adaptive_codec)
+        compression = options.compression[0] if options.compression else CompressionEnum.NONE
+
+        self.connection.set_codec(ip, port, codec, options.adaptive_codec)
+        self.follow_ups.pop((ip, port), None)
+        if options.multicast_group is not None:
+            self.multicast_members[(ip, port)] = MulticastMember(self.connection, ip, port, server_sequence_number + 1, self.scheduler)
+            logging.info(f"[Client {ip}:{port}] Connection established, joins the multicast group")
+            return
+
+        self.tcp_connections[(ip, port)] = FileSender(self.args.file_path, self.connection, ip, port, server_sequence_number + 1, chunk_size, self.args.min_rto, self.args.congestion_control, self.scheduler, self.segment_cache, options.resume_ranges, options.signatures, compression)
         logging.info(f"[Client {ip}:{port}] Connection established")
 
         return
@@ -1,19 +1,57 @@
-from typing import  Dict, Tuple
+from time import monotonic
+from typing import  Dict, Optional, Tuple
+from .handshake import HandshakeOptions
+from .constants import MAX_PENDING, PENDING_TIMEOUT
 
 class TCPPending:
-    tcp_client: Dict[Tuple[str, int], int] = {}
+    # half-open handshakes by client address, oldest first. At most max_size are kept and
+    # each one only for timeout seconds, a client that never sends its ACK is forgotten
+    tcp_client: Dict[Tuple[str, int], int]
+    options: Dict[Tuple[str, int], HandshakeOptions]
+    added: Dict[Tuple[str, int], float]
+    max_size: int
+    timeout: float
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, max_size: int = MAX_PENDING, timeout: float = PENDING_TIMEOUT) -> None:
+        self.tcp_client = {}
+        self.options = {}
+        self.added = {}
+        self.max_size = max_size
+        self.timeout = timeout
+
+    def add(self, ip: str, port: int, init_sequence_number: int, options: Optional[HandshakeOptions] = None) -> None:
+        self.expire()
+        self.remove(ip, port)
+        while len(self.tcp_client) >= self.max_size:
+            self.remove(*next(iter(self.tcp_client)))
 
-    def add(self, ip: str, port: int, init_sequence_number: int) -> None:
         self.tcp_client.update({(ip, port): init_sequence_number})
+        self.options.update({(ip, port): options if options is not None else HandshakeOptions()})
+        self.added.update({(ip, port): monotonic()})
 
     def remove(self, ip: str, port: int) -> None:
-        self.tcp_client.pop((ip, port))
+        self.tcp_client.pop((ip, port), None)
+        self.options.pop((ip, port), None)
+        self.added.pop((ip, port), None)
+
+    def expire(self) -> None:
+        deadline = monotonic() - self.timeout
+        while self.added and next(iter(self.added.values())) < deadline:
+            self.remove(*next(iter(self.added)))
+
+    @property
+    def full(self) -> bool:
+        self.expire()
+        return len(self.tcp_client) >= self.max_size
+
+    def __len__(self) -> int:
+        return len(self.tcp_client)
 
     def is_pending(self, ip: str, port: int) -> bool:
         return (ip, port) in self.tcp_client
-    
-    def get_init_sequence_number(self, ip: str, port: int) -> int:    
-        return self.tcp_client[(ip, port)]
\ No newline at end of file
+
+    def get_init_sequence_number(self, ip: str, port: int) -> int:
+        return self.tcp_client[(ip, port)]
+
+    def get_options(self, ip: str, port: int) -> HandshakeOptions:
+        return self.options.get((ip, port), HandshakeOptions())
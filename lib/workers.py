@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import multiprocessing
+from queue import Empty
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from .arg import ServerArg
+from .async_connection import AsyncConnection
+from .async_tcp_manager import AsyncTCPManager
+from .handler import FileSender
+from .stats import ServerStats
+
+# (worker index, stats of that worker so far)
+WorkerReport = Tuple[int, ServerStats]
+
+class WorkerTCPManager(AsyncTCPManager):
+    # one shard of the server, the kernel picks the worker of each client by hashing
+    # its address over every socket bound to the port with SO_REUSEPORT
+    index: int
+    reports: 'multiprocessing.Queue[WorkerReport]'
+
+    def __init__(self, args: ServerArg, connection: AsyncConnection, index: int, reports: 'multiprocessing.Queue[WorkerReport]'):
+        super().__init__(args, connection)
+        self.index = index
+        self.reports = reports
+
+    def _release_connection(self, tcp_server: FileSender):
+        super()._release_connection(tcp_server)
+        self.reports.put((self.index, self.stats))
+
+def run_worker(args: ServerArg, index: int, reports: 'multiprocessing.Queue[WorkerReport]', log_level: int) -> None:
+    logging.basicConfig(format=f"[i] [Worker {index}] %(message)s", level=log_level, force=True)
+    manager = WorkerTCPManager(args, AsyncConnection("", args.port_server, True, args.rcvbuf, args.sndbuf), index, reports)
+
+    try:
+        asyncio.run(manager.serve())
+    except KeyboardInterrupt:
+        pass
+
+class WorkerPool:
+    # every worker owns its handshakes, transfers, timers and codec work under its own GIL
+    args: ServerArg
+    workers: int
+    processes: List[multiprocessing.Process]
+    reports: 'multiprocessing.Queue[WorkerReport]'
+    stats: Dict[int, ServerStats]
+
+    def __init__(self, args: ServerArg, workers: int) -> None:
+        self.args = args
+        self.workers = workers
+        self.processes = []
+        self.reports = multiprocessing.Queue()
+        self.stats = {}
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            process = multiprocessing.Process(target=run_worker, args=(self.args, index, self.reports, logging.getLogger().level), name=f"worker-{index}", daemon=True)
+            process.start()
+            self.processes.append(process)
+
+        logging.info(f"Started {self.workers} workers on port {self.args.port_server}")
+
+    def collect(self, expected_connections: int = 0, timeout: Optional[float] = None) -> ServerStats:
+        # expected_connections > 0 returns once the workers released that many connections together
+        deadline = monotonic() + timeout if timeout is not None else None
+
+        while not expected_connections or self.total().connections < expected_connections:
+            try:
+                (index, stats) = self.reports.get(timeout=1)
+            except Empty:
+                if not any(process.is_alive() for process in self.processes):
+                    raise Exception("Every worker exited")
+
+                if deadline is not None and monotonic() >= deadline:
+                    raise TimeoutError(f"workers released {self.total().connections} of {expected_connections} connections in {timeout} seconds")
+                continue
+
+            self.stats[index] = stats
+            logging.info(f"[Worker {index}] {stats.connections} connections released, total {self.total()}")
+
+        return self.total()
+
+    def total(self) -> ServerStats:
+        return ServerStats.total(self.stats.values())
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+
+        self.processes = []
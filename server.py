@@ -1,17 +1,46 @@
 from lib.connection import Connection
 from lib.tcp_manager import TCPManager
+from lib.async_connection import AsyncConnection
+from lib.async_tcp_manager import AsyncTCPManager
+from lib.workers import WorkerPool
 from lib.arg import ServerArg
 
+import asyncio
 import logging
 import sys
 import socket
 import traceback
 
+async def main_async(args: ServerArg):
+    tcp_manager = AsyncTCPManager(args=args, connection=AsyncConnection("", args.port_server, rcvbuf=args.rcvbuf, sndbuf=args.sndbuf))
+
+    await tcp_manager.serve()
+
 def main():
     logging.basicConfig(format="[i] [Server] %(message)s", level=logging.INFO)
     args = ServerArg()
 
-    connection = Connection("", args.port_server)
+    if args.workers > 1:
+        pool = WorkerPool(args, args.workers)
+        pool.start()
+
+        try:
+            pool.collect()
+        except KeyboardInterrupt:
+            logging.info("Received KeyboardInterrupt. Stopping workers.")
+        finally:
+            pool.stop()
+            logging.info(f"Total: {pool.total()}")
+        return
+
+    if args.use_asyncio:
+        try:
+            asyncio.run(main_async(args))
+        except KeyboardInterrupt:
+            logging.info("Received KeyboardInterrupt. Closing connection.")
+        return
+
+    connection = Connection("", args.port_server, rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
 
     tcp_manager = TCPManager(args=args, connection=connection)
 
@@ -20,6 +49,10 @@ def main():
 
         tcp_manager.print_all_connections()
 
+        if args.multicast is not None:
+            tcp_manager.multicast_handle()
+            return
+
         result = input("Use parallel transfer? [y/n] ")
 
         if result == "y":
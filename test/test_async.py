@@ -0,0 +1,41 @@
+from lib.arg import ServerArg
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.async_tcp_manager import AsyncTCPManager
+from lib.scheduler import LoopScheduler
+import asyncio
+import os
+import random
+
+def test_transfers_share_one_event_loop(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(200_000))
+    port = random.randint(20000, 50000)
+
+    async def transfer():
+        loop = asyncio.get_running_loop()
+        manager = AsyncTCPManager(ServerArg([str(port), str(source), "--cc", "reno"]), AsyncConnection("", port))
+        server = asyncio.ensure_future(manager.serve(expected_connections=2))
+
+        receivers = []
+        for index in range(2):
+            output = tmp_path / f"client{index}"
+            output.mkdir()
+            connection = AsyncConnection("", 0)
+            await connection.open()
+            receivers.append(AsyncFileReceiver(connection, "127.0.0.1", port, str(output), scheduler=LoopScheduler(loop)))
+
+        clients = [asyncio.ensure_future(receiver.run()) for receiver in receivers]
+
+        # the server is done once both FIN exchanges completed, the clients would linger in TIME_WAIT
+        await asyncio.wait_for(server, 30)
+        for client in clients:
+            client.cancel()
+
+        return receivers
+
+    receivers = asyncio.run(transfer())
+
+    for receiver in receivers:
+        assert receiver.is_file_received
+        assert open(receiver.file_path, "rb").read() == source.read_bytes()
@@ -1,5 +1,6 @@
-from lib.checksum import calculate_checksum
+from lib.checksum import calculate_checksum, Checksum, BACKENDS
 import binascii
+import os
 
 def test_calculate_checksum():
     data = b"hello world"
@@ -13,5 +14,21 @@ def test_calculate_checksum():
     assert calculated_checksum == expected_checksum
     print(f"Checksum: {hex(calculated_checksum)}, binascii: {hex(expected_checksum)}")
 
+def test_backends_agree():
+    data = os.urandom(4096)
+    expected_checksum = binascii.crc_hqx(data, 0xFFFF)
+
+    for backend in BACKENDS:
+        assert calculate_checksum(data, backend) == expected_checksum
+        assert calculate_checksum(b"", backend) == 0xFFFF
+
+def test_streaming_checksum():
+    header = os.urandom(9)
+    payload = os.urandom(1000)
+
+    for backend in BACKENDS:
+        streamed = Checksum(header, backend).update(memoryview(payload)).digest()
+        assert streamed == calculate_checksum(header + payload)
+
 if __name__ == "__main__":
     test_calculate_checksum()
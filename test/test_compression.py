@@ -0,0 +1,105 @@
+from lib.arg import ServerArg
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.async_tcp_manager import AsyncTCPManager
+from lib.codec import get_codec
+from lib.compression import CompressedPayload, Compressor, choose_compression, decompress, parse_compression
+from lib.constants import CodecEnum, CompressionEnum
+from lib.file import FilePayload
+from lib.scheduler import LoopScheduler
+from lib.segment import Segment
+from lib.segment_cache import SegmentCache
+from lib.segment_sender import encode_segments
+import asyncio
+import os
+import random
+
+def text(size: int) -> bytes:
+    rng = random.Random(1)
+    words = [b"segment", b"window", b"ack", b"retransmit", b"checksum", b"hamming", b"server", b"client"]
+    lines = []
+    while sum(len(line) for line in lines) < size:
+        lines.append(b"INFO " + b" ".join(rng.choice(words) for _ in range(8)) + b" %d\n" % rng.randrange(100000))
+
+    return b"".join(lines)[:size]
+
+def test_chunks_round_trip_compressed_or_raw():
+    for method in [CompressionEnum.ZLIB, CompressionEnum.LZMA]:
+        compressor = Compressor(method)
+        for data in [text(12000), os.urandom(12000)]:
+            encoded = compressor.compress(data)
+            assert decompress(encoded) == data
+
+        # the text shrinks, the random chunk goes out raw behind one byte
+        assert compressor.chunks_compressed == 1 and compressor.chunks_skipped == 1
+        assert compressor.compressed_bytes < compressor.raw_bytes
+
+def test_incompressible_data_stops_being_probed():
+    compressor = Compressor(CompressionEnum.ZLIB)
+    for _ in range(40):
+        compressor.compress(os.urandom(12000))
+
+    assert compressor.chunks_compressed == 0
+    assert compressor.backoff > 4
+
+def test_server_picks_the_first_allowed_method():
+    assert parse_compression("lzma, zlib") == [CompressionEnum.LZMA, CompressionEnum.ZLIB]
+    assert choose_compression([CompressionEnum.LZMA, CompressionEnum.ZLIB], [CompressionEnum.ZLIB]) == CompressionEnum.ZLIB
+    assert choose_compression([CompressionEnum.LZMA], []) == CompressionEnum.NONE
+
+def test_clients_at_different_levels_share_the_segment_cache(tmp_path):
+    content = text(120_000)
+    source = tmp_path / "server.log"
+    source.write_bytes(content)
+    cache = SegmentCache()
+
+    for codec_id in [CodecEnum.NONE, CodecEnum.HAMMING]:
+        codec = get_codec(codec_id)
+        for level in [6, 1]:
+            compressor = Compressor(CompressionEnum.ZLIB)
+            compressor.level = level
+            payload = CompressedPayload(FilePayload(str(source), 10000), compressor)
+            segments = []
+            for number in range(1, payload.total_chunk + 1):
+                segment = payload.get_segment(number)
+                segment.sequence_number = 100 + number
+                segments.append(segment)
+
+            received = b""
+            for (segment, encoded) in zip(segments, encode_segments(segments, payload, 100, codec, cache)):
+                wire = b"".join(bytes(piece) for piece in encoded) if isinstance(encoded, list) else bytes(encoded if encoded is not None else segment.to_raw_bytes())
+                # raises on a checksum made of other bytes than those sent
+                received += decompress(Segment.from_raw_bytes(codec.decode_with_errors(wire)[0]).data)
+            payload.close()
+
+            assert received == content
+
+def test_compressed_transfer(tmp_path):
+    content = text(300_000)
+    source = tmp_path / "server.log"
+    source.write_bytes(content)
+    output = tmp_path / "client"
+    output.mkdir()
+    port = random.randint(20000, 50000)
+
+    async def transfer():
+        loop = asyncio.get_running_loop()
+        manager = AsyncTCPManager(ServerArg([str(port), str(source), "--cc", "reno"]), AsyncConnection("", port))
+        server = asyncio.ensure_future(manager.serve(expected_connections=1))
+
+        connection = AsyncConnection("", 0)
+        await connection.open()
+        receiver = AsyncFileReceiver(connection, "127.0.0.1", port, str(output), scheduler=LoopScheduler(loop), compression=[CompressionEnum.ZLIB])
+        client = asyncio.ensure_future(receiver.run())
+
+        await asyncio.wait_for(server, 30)
+        client.cancel()
+
+        return (manager, receiver)
+
+    (manager, receiver) = asyncio.run(transfer())
+
+    assert receiver.compression == CompressionEnum.ZLIB
+    assert open(receiver.file_path, "rb").read() == content
+    assert manager.stats.compression_input >= len(content)
+    assert manager.stats.compression_ratio < 0.5
@@ -0,0 +1,56 @@
+from lib.connection import Connection, MessageInfo
+from lib.constants import CodecEnum
+from lib.segment import Segment
+from socket import timeout as socket_timeout
+import os
+import random
+
+import pytest
+
+def bound_pair():
+    port = random.randint(20000, 50000)
+    receiver = Connection("127.0.0.1", port)
+    receiver.listen()
+    sender = Connection("127.0.0.1", port + 1)
+    sender.listen()
+
+    return (sender, receiver, port)
+
+def test_receive_batch_drains_every_queued_datagram():
+    (sender, receiver, port) = bound_pair()
+
+    try:
+        for sequence_number in range(5):
+            sender.send(MessageInfo("127.0.0.1", port, Segment.ack_segment(sequence_number, 0)))
+
+        messages = receiver.receive_batch(1)
+        while len(messages) < 5:
+            messages += receiver.receive_batch(1)
+
+        assert [message.segment.sequence_number for message in messages] == list(range(5))
+
+        # nothing left, the next call times out instead of blocking forever
+        with pytest.raises(socket_timeout):
+            receiver.receive_batch(0.05)
+    finally:
+        sender.close()
+        receiver.close()
+
+def test_scatter_gather_send_without_codec():
+    (sender, receiver, port) = bound_pair()
+    sender.set_codec("127.0.0.1", port, CodecEnum.NONE)
+    receiver.set_codec("127.0.0.1", port + 1, CodecEnum.NONE)
+    data = os.urandom(5000)
+
+    try:
+        segment = Segment.ack_segment(7, 3, window=12)
+        segment.data = data
+        sender.send(MessageInfo("127.0.0.1", port, segment))
+
+        [message] = receiver.receive_batch(1)
+        assert message.segment.sequence_number == 7
+        assert message.segment.window == 12
+        assert bytes(message.segment.data) == data
+    finally:
+        sender.close()
+        receiver.close()
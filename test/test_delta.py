@@ -0,0 +1,132 @@
+from lib.arg import ServerArg
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.async_tcp_manager import AsyncTCPManager
+from lib.connection import Connection
+from lib.handler import FileReceiver
+from lib.scheduler import LoopScheduler
+from lib.tcp_manager import TCPManager
+from lib import delta, tcp
+from socket import timeout as socket_timeout
+import asyncio
+import os
+import random
+import threading
+
+import pytest
+
+def test_chunks_resynchronize_after_an_insertion():
+    data = random.Random(1).randbytes(300_000)
+    edited = data[:100_000] + b"inserted" + data[100_000:]
+
+    before = delta.signatures(data)
+    after = delta.signatures(edited)
+    assert sum(length for (length, _) in before) == len(data)
+    assert all(delta.DELTA_MIN_CHUNK <= length <= delta.DELTA_MAX_CHUNK for (length, _) in before[:-1])
+
+    # only the chunk around the insertion differs
+    shared = {digest for (_, digest) in before} & {digest for (_, digest) in after}
+    assert len(shared) >= len(before) - 2
+
+def test_python_and_numpy_boundaries_agree(monkeypatch):
+    if delta.np is None:
+        return
+
+    data = random.Random(2).randbytes(500_000)
+    with_numpy = delta.content_chunks(data)
+    monkeypatch.setattr(delta, "np", None)
+    assert delta.content_chunks(data) == with_numpy
+
+def test_delta_transfer_sends_only_the_changed_chunks(tmp_path):
+    rng = random.Random(3)
+    old = rng.randbytes(400_000)
+    new = bytearray(old)
+    new[200_000:200_100] = rng.randbytes(100)
+    source = tmp_path / "source.bin"
+    source.write_bytes(bytes(new))
+    output = tmp_path / "client"
+    output.mkdir()
+    (output / "source.bin").write_bytes(old)
+    port = random.randint(20000, 50000)
+
+    async def transfer():
+        loop = asyncio.get_running_loop()
+        manager = AsyncTCPManager(ServerArg([str(port), str(source), "--cc", "reno"]), AsyncConnection("", port))
+        server = asyncio.ensure_future(manager.serve(expected_connections=2))
+
+        receivers = []
+        for (resume, delta_source) in [(False, str(output / "source.bin")), (True, None)]:
+            connection = AsyncConnection("", 0)
+            await connection.open()
+            receiver = AsyncFileReceiver(connection, "127.0.0.1", port, str(output), scheduler=LoopScheduler(loop), resume=resume, delta_source=delta_source)
+            client = asyncio.ensure_future(receiver.run())
+            while not receiver.is_file_received:
+                await asyncio.sleep(0.01)
+            if delta_source is not None:
+                receiver.apply_delta()
+            receivers.append((receiver, client))
+
+        await asyncio.wait_for(server, 30)
+        for (_, client) in receivers:
+            client.cancel()
+
+        return (manager, [receiver for (receiver, _) in receivers])
+
+    (manager, (signatures, receiver)) = asyncio.run(transfer())
+
+    assert signatures.signature_header is not None
+    assert receiver.resumed_ranges
+    assert open(receiver.file_path, "rb").read() == bytes(new)
+    assert sorted(os.listdir(output)) == ["source.bin"]
+    # the signatures and the chunks around the change, not the whole file again
+    assert manager.stats.bytes_sent < len(new) // 4
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_blocking_server_takes_the_delta_client_back(tmp_path, monkeypatch, parallel):
+    monkeypatch.setattr(tcp, "TIME_WAIT", 0.5)
+    rng = random.Random(4)
+    old = rng.randbytes(400_000)
+    new = bytearray(old)
+    new[100_000:100_100] = rng.randbytes(100)
+    source = tmp_path / "source.bin"
+    source.write_bytes(bytes(new))
+    output = tmp_path / "client"
+    output.mkdir()
+    (output / "source.bin").write_bytes(old)
+    port = random.randint(20000, 50000)
+
+    manager = TCPManager(ServerArg([str(port), str(source), "--cc", "reno"]), Connection("", port))
+    receivers = []
+
+    def run_client():
+        # as client.py does with --delta: the signatures, then the rest from the same port
+        connection = Connection("", port + 1)
+        for (resume, delta_source) in [(False, str(output / "source.bin")), (True, None)]:
+            receiver = FileReceiver(connection, "127.0.0.1", port, str(output), resume=resume, delta_source=delta_source)
+            receivers.append(receiver)
+            receiver.connect()
+            while not receiver.closed:
+                try:
+                    for message in connection.receive_batch(0.1):
+                        receiver.handle_message(message)
+                except socket_timeout:
+                    continue
+            if delta_source is not None:
+                receiver.apply_delta()
+        connection.close()
+
+    client = threading.Thread(target=run_client, daemon=True)
+    client.start()
+    manager.listen_for_connection(expected_connections=1)
+    server = threading.Thread(target=manager.parallel_handle if parallel else manager.sequential_handle, daemon=True)
+    server.start()
+    server.join(60)
+    client.join(30)
+    manager.connection.close()
+
+    assert not server.is_alive() and not client.is_alive()
+    (signatures, receiver) = receivers
+    assert signatures.signature_header is not None
+    assert receiver.resumed_ranges
+    assert open(receiver.file_path, "rb").read() == bytes(new)
+    assert manager.stats.connections == 2
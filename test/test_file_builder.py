@@ -0,0 +1,49 @@
+from lib.file import FileBuilder, FSYNC_END
+import os
+
+import pytest
+
+def test_file_is_preallocated_and_written_at_offsets(tmp_path):
+    path = str(tmp_path / "out.bin")
+    content = os.urandom(1000)
+    builder = FileBuilder(path, len(content), chunk_size=100)
+    assert os.path.getsize(path) == len(content)
+
+    for chunk in [9, 3, 0, 5]:
+        builder.write(content[chunk * 100:(chunk + 1) * 100], chunk * 100)
+    assert [chunk for chunk in range(10) if builder.has_chunk(chunk)] == [0, 3, 5, 9]
+    assert not builder.is_completed()
+
+    for chunk in [1, 2, 4, 6, 7, 8]:
+        builder.write(content[chunk * 100:(chunk + 1) * 100], chunk * 100)
+    assert builder.is_completed()
+    assert open(path, "rb").read() == content
+
+def test_queued_adjacent_chunks_are_coalesced(tmp_path):
+    path = str(tmp_path / "out.bin")
+    content = os.urandom(1000)
+    builder = FileBuilder(path, len(content), chunk_size=100, fsync_policy=FSYNC_END)
+
+    # hold the writer until everything is queued so it sees one batch
+    with builder.condition:
+        for chunk in reversed(range(10)):
+            builder.queue(content[chunk * 100:(chunk + 1) * 100], chunk * 100)
+    builder.flush()
+
+    assert builder.is_completed()
+    assert builder.writes == 1
+    assert open(path, "rb").read() == content
+
+def test_unaligned_or_oversized_writes_are_rejected(tmp_path):
+    builder = FileBuilder(str(tmp_path / "out.bin"), 250, chunk_size=100)
+
+    with pytest.raises(Exception):
+        builder.write(b"x" * 100, 50)
+    with pytest.raises(Exception):
+        builder.write(b"x" * 100, 200)
+
+    # without an offset writes append
+    builder.write(b"a" * 100)
+    builder.write(b"b" * 100)
+    builder.write(b"c" * 50)
+    assert builder.is_completed()
@@ -0,0 +1,48 @@
+from lib.file import FilePayload, MappedFile
+import os
+
+def test_payloads_of_one_file_share_a_mapping(tmp_path):
+    source = tmp_path / "source.bin"
+    content = os.urandom(10_000)
+    source.write_bytes(content)
+
+    first = FilePayload(str(source), 3000)
+    second = FilePayload(str(source), 3000)
+    assert first.mapped is not None and first.mapped is second.mapped
+
+    chunks = [first.get_chunk(number) for number in range(1, first.total_chunk + 1)]
+    assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert b"".join(chunks) == content
+
+    first.close()
+    second.close()
+    assert str(source.resolve()) not in MappedFile.registry
+    # chunks still held by segments in flight stay readable
+    assert bytes(chunks[0]) == content[:3000]
+
+def test_modified_file_is_mapped_again(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"a" * 100)
+    first = FilePayload(str(source), 10)
+
+    source.write_bytes(b"b" * 200)
+    second = FilePayload(str(source), 10)
+
+    assert first.mapped is not second.mapped
+    assert bytes(second.get_chunk(1)) == b"b" * 10
+
+    first.close()
+    second.close()
+
+def test_unmappable_file_falls_back_to_reads(tmp_path):
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    payload = FilePayload(str(empty))
+    assert payload.mapped is None and payload.total_chunk == 0
+    payload.close()
+
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"0123456789")
+    payload = FilePayload(str(source), 4, use_mmap=False)
+    assert [payload.get_chunk(number) for number in range(1, 4)] == [b"0123", b"4567", b"89"]
+    payload.close()
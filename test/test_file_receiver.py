@@ -0,0 +1,68 @@
+from lib.handler import FileReceiver
+from lib.metadata import Metadata
+from lib.segment import Segment
+import time
+
+class RecordingConnection:
+    def __init__(self):
+        self.acks = []
+
+    def send(self, message, encoded=None):
+        self.acks.append((message.segment.ack, message.segment.sack_blocks()))
+
+def data_segment(sequence_number, data):
+    segment = Segment.data_segment(data)
+    segment.sequence_number = sequence_number
+
+    return segment
+
+def test_delayed_and_immediate_acks(tmp_path):
+    connection = RecordingConnection()
+    receiver = FileReceiver(connection, "127.0.0.1", 1, str(tmp_path), ack_every=2, ack_delay=0.05)
+    receiver.server_sequence_number = 1
+    # announced by the server in the handshake, segments land at (n - 1) * chunk_size
+    receiver.chunk_size = 10
+
+    receiver.handle_data(data_segment(1, Metadata("payload.bin", 100).to_bytes()))
+    assert connection.acks == [(2, [])]
+
+    # the second in-order segment releases one cumulative ack
+    receiver.handle_data(data_segment(2, b"a" * 10))
+    assert len(connection.acks) == 1
+    receiver.handle_data(data_segment(3, b"b" * 10))
+    assert connection.acks[-1] == (4, [])
+
+    # a gap is reported at once, and again when it is filled
+    receiver.handle_data(data_segment(5, b"d" * 10))
+    assert connection.acks[-1] == (4, [(5, 6)])
+    receiver.handle_data(data_segment(4, b"c" * 10))
+    assert connection.acks[-1] == (6, [])
+
+    # a lone segment is acked by the timer
+    receiver.handle_data(data_segment(6, b"e" * 10))
+    assert connection.acks[-1] == (6, [])
+    time.sleep(0.2)
+    assert connection.acks[-1] == (7, [])
+    assert receiver.acks_sent == 5
+
+def test_segments_ahead_of_a_gap_go_straight_to_their_offset(tmp_path):
+    connection = RecordingConnection()
+    receiver = FileReceiver(connection, "127.0.0.1", 1, str(tmp_path))
+    receiver.server_sequence_number = 1
+    receiver.chunk_size = 4
+    content = b"0123456789"
+
+    # the last chunk arrives before the metadata, the middle one after it
+    receiver.handle_data(data_segment(4, content[8:]))
+    receiver.handle_data(data_segment(1, Metadata("payload.bin", len(content)).to_bytes()))
+    receiver.handle_data(data_segment(3, content[4:8]))
+    assert receiver.out_of_order == {3: None, 4: None}
+
+    receiver.file_handle.flush()
+    assert receiver.file_handle.has_chunk(1) and receiver.file_handle.has_chunk(2)
+    assert not receiver.file_handle.has_chunk(0)
+
+    receiver.close = lambda: None
+    receiver.handle_data(data_segment(2, content[:4]))
+    assert receiver.is_file_received
+    assert (tmp_path / "payload.bin").read_bytes() == content
@@ -0,0 +1,61 @@
+from lib.hamming import Hamming
+import os
+
+def test_encode_matches_wire_format():
+    hamming = Hamming()
+
+    # codewords produced by the original bit-string implementation
+    assert hamming.encode(b"\x12\xab").hex() == "692a5a33"
+    assert hamming.encode(bytes(range(16)))[1::2].hex() == "00692a434c25660f70195a333c55167f"
+
+def test_roundtrip():
+    hamming = Hamming()
+    data = os.urandom(2048)
+
+    assert hamming.decode(hamming.encode(data)) == data
+    assert hamming.decode(hamming.encode(memoryview(data))) == data
+    assert not hamming.error
+    assert hamming.corrected_errors == 0
+
+def test_single_bit_correction():
+    hamming = Hamming()
+    data = os.urandom(256)
+    encoded = bytearray(hamming.encode(data))
+
+    # flip one of the seven meaningful bits in every codeword
+    for i in range(len(encoded)):
+        encoded[i] ^= 1 << (i % 7)
+
+    decoded, corrected = hamming.decode_with_errors(bytes(encoded))
+
+    assert decoded == data
+    assert corrected == len(encoded)
+
+def test_batch_matches_scalar():
+    hamming = Hamming()
+    payloads = [os.urandom(size) for size in (0, 1, 17, 1024)]
+
+    encoded = hamming.encode_batch(payloads)
+    assert list(encoded) == [hamming.encode(payload) for payload in payloads]
+
+    corrupted = [bytes([encoded[3][0] ^ 0x08]) + encoded[3][1:]] + list(encoded[:3])
+    decoded, corrected = hamming.decode_batch_with_errors(corrupted)
+    assert decoded == [payloads[3]] + payloads[:3]
+    assert corrected == [1, 0, 0, 0]
+
+def test_batch_array():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+
+    hamming = Hamming()
+    payloads = np.frombuffer(os.urandom(4 * 64), dtype=np.uint8).reshape(4, 64)
+
+    encoded = hamming.encode_batch(payloads)
+    assert encoded.shape == (4, 128)
+    assert encoded[2].tobytes() == hamming.encode(payloads[2].tobytes())
+
+    decoded, corrected = hamming.decode_batch_with_errors(encoded)
+    assert (decoded == payloads).all()
+    assert corrected == [0, 0, 0, 0]
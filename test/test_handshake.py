@@ -0,0 +1,27 @@
+from lib.handshake import HandshakeOptions
+from lib.codec import choose_codec, chunk_size_for
+from lib.constants import CodecEnum, PAYLOAD_SIZE, RAW_PAYLOAD_SIZE
+
+def test_options_roundtrip():
+    options = HandshakeOptions(codecs=[CodecEnum.NONE, CodecEnum.HAMMING], codec=CodecEnum.NONE, adaptive_codec=True)
+
+    decoded = HandshakeOptions.from_bytes(options.to_bytes())
+
+    assert decoded.codecs == [CodecEnum.NONE, CodecEnum.HAMMING]
+    assert decoded.codec == CodecEnum.NONE
+    assert decoded.adaptive_codec
+
+def test_unknown_options_are_skipped():
+    src = b"\xfe\x02\x00ab" + HandshakeOptions(codec=CodecEnum.HAMMING).to_bytes()
+
+    assert HandshakeOptions.from_bytes(src).codec == CodecEnum.HAMMING
+    assert HandshakeOptions.from_bytes(b"").codec is None
+
+def test_choose_codec():
+    assert choose_codec([CodecEnum.NONE, CodecEnum.HAMMING], [CodecEnum.HAMMING]) == CodecEnum.HAMMING
+    assert choose_codec([CodecEnum.NONE, CodecEnum.HAMMING], [CodecEnum.HAMMING, CodecEnum.NONE]) == CodecEnum.NONE
+    assert choose_codec([], [CodecEnum.NONE]) == CodecEnum.HAMMING
+
+def test_chunk_size():
+    assert chunk_size_for(CodecEnum.NONE, False) == RAW_PAYLOAD_SIZE
+    assert chunk_size_for(CodecEnum.NONE, True) == PAYLOAD_SIZE
@@ -0,0 +1,60 @@
+from lib.manifest import Manifest, ManifestEntry, TreeBuilder, TreePayload, ENTRY_FILE, open_payload
+import os
+import random
+
+import pytest
+
+def sample_tree(root):
+    (root / "docs" / "deep").mkdir(parents=True)
+    (root / "empty_dir").mkdir()
+    (root / "a.bin").write_bytes(os.urandom(250))
+    (root / "empty.txt").write_bytes(b"")
+    (root / "docs" / "b.txt").write_bytes(os.urandom(37))
+    (root / "docs" / "deep" / "c.bin").write_bytes(os.urandom(1000))
+
+def read_tree(root):
+    result = {}
+    for (current, directories, files) in os.walk(root):
+        relative = os.path.relpath(current, root)
+        result[relative] = None
+        for name in files:
+            result[os.path.join(relative, name)] = open(os.path.join(current, name), "rb").read()
+
+    return result
+
+def test_directory_round_trip_in_any_chunk_order(tmp_path):
+    source = tmp_path / "tree"
+    sample_tree(source)
+    payload = open_payload(str(source), 64)
+    assert isinstance(payload, TreePayload)
+
+    header = payload.get_chunk(0)
+    assert Manifest.is_manifest(header)
+    manifest = Manifest.from_header(header)
+    assert manifest.root == "tree"
+    assert manifest.stream_size == payload.filesize
+
+    output = tmp_path / "out"
+    builder = TreeBuilder(str(output / manifest.root), manifest, chunk_size=64)
+
+    # data chunks ahead of the manifest entries are held until the tree exists
+    chunks = list(range(1, payload.total_chunk + 1))
+    random.Random(1).shuffle(chunks)
+    for chunk in chunks:
+        builder.write(bytes(payload.get_chunk(chunk)), (chunk - 1) * 64)
+    payload.close()
+
+    assert builder.is_completed()
+    assert not builder.open_files
+    assert read_tree(output / "tree") == read_tree(source)
+
+def test_paths_outside_the_root_are_rejected():
+    for path in ["../escape", "/etc/passwd", "a/../../b", "a//b"]:
+        manifest = Manifest("root", [ManifestEntry(ENTRY_FILE, 0, 1, path)])
+        received = Manifest.from_header(manifest.header_to_bytes())
+
+        with pytest.raises(NameError):
+            received.read_entries(manifest.entries_to_bytes())
+
+    with pytest.raises(NameError):
+        Manifest.from_header(Manifest("..").header_to_bytes())
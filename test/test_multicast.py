@@ -0,0 +1,86 @@
+from lib.arg import ServerArg
+from lib.connection import Connection, MessageInfo
+from lib.constants import CodecEnum
+from lib.handshake import HandshakeOptions
+from lib.multicast import MulticastReceiver, parse_group
+from lib.tcp_manager import TCPManager
+from socket import timeout as socket_timeout
+import os
+import random
+import threading
+import time
+
+import pytest
+
+class LossyReceiver(MulticastReceiver):
+    # loses the first copy of some segments, as a congested link to this member would
+    def __init__(self, *args, dropped=(), **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.dropped = set(dropped)
+
+    def handle_message(self, message: MessageInfo):
+        if message.segment.data and message.segment.sequence_number in self.dropped:
+            self.dropped.discard(message.segment.sequence_number)
+            return
+        super().handle_message(message)
+
+def test_group_option_roundtrip():
+    assert parse_group("239.255.0.1:9100") == ("239.255.0.1", 9100)
+    with pytest.raises(ValueError):
+        parse_group("127.0.0.1:9100")
+
+    offer = HandshakeOptions.from_bytes(HandshakeOptions(multicast=True).to_bytes())
+    assert offer.multicast and offer.multicast_group is None
+    answer = HandshakeOptions.from_bytes(HandshakeOptions(codec=CodecEnum.NONE, multicast_group=("239.255.0.1", 9100)).to_bytes())
+    assert answer.multicast_group == ("239.255.0.1", 9100)
+
+def test_file_goes_once_to_the_group_and_losses_are_repaired(tmp_path):
+    content = os.urandom(600_000)
+    source = tmp_path / "source.bin"
+    source.write_bytes(content)
+    port = random.randint(20000, 40000)
+    group = f"239.255.{random.randint(0, 255)}.{random.randint(1, 254)}:{port + 100}"
+
+    manager = TCPManager(ServerArg([str(port), str(source), "--fec", "none", "--multicast", group, "--multicast-rate", "5"]), Connection("", port))
+    # every member misses segment 10, one of them a few more
+    group_isn = manager.multicast_sequence_number + 1
+    losses = [{group_isn + 10}, {group_isn + 10}, {group_isn + 10, group_isn + 3, group_isn + 4, group_isn + 15}]
+    receivers = []
+
+    def run_client(index: int):
+        output = tmp_path / f"client{index}"
+        output.mkdir()
+        connection = Connection("", port + 1 + index)
+        receiver = LossyReceiver(connection, "127.0.0.1", port, str(output), [CodecEnum.NONE], dropped=losses[index])
+        receivers.append(receiver)
+        receiver.connect()
+        while not receiver.is_file_received:
+            try:
+                for message in connection.receive_batch(0.1):
+                    receiver.handle_message(message)
+            except socket_timeout:
+                continue
+
+    for index in range(len(losses)):
+        threading.Thread(target=run_client, args=(index,), daemon=True).start()
+
+    manager.listen_for_connection(expected_connections=len(losses))
+    server = threading.Thread(target=manager.multicast_handle, daemon=True)
+    server.start()
+    server.join(30)
+    assert not server.is_alive()
+
+    deadline = time.monotonic() + 10
+    while not all(receiver.is_file_received for receiver in receivers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    for receiver in receivers:
+        assert receiver.group is not None
+        assert open(receiver.file_path, "rb").read() == content
+    assert not any(receiver.dropped for receiver in receivers)
+
+    stats = manager.stats
+    chunks = stats.segments_sent
+    assert stats.connections == 3
+    # segment 10 once more to the group, the others to the one member missing them
+    assert 4 <= stats.retransmissions < chunks
@@ -0,0 +1,81 @@
+from lib.arg import ServerArg
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.async_tcp_manager import AsyncTCPManager
+from lib.codec import chunk_size_for
+from lib.constants import CodecEnum
+from lib.file import FileBuilder, file_identity
+from lib.journal import Journal
+from lib.scheduler import LoopScheduler
+import asyncio
+import os
+import random
+
+def test_journal_keeps_the_written_chunks(tmp_path):
+    content = os.urandom(1000)
+    journal = Journal(str(tmp_path / ".journal"), b"12345678", 100, len(content), "out.bin")
+    builder = FileBuilder(str(tmp_path / "out.bin"), len(content), chunk_size=100, journal=journal)
+    for chunk in [0, 1, 2, 5, 9]:
+        builder.write(content[chunk * 100:(chunk + 1) * 100], chunk * 100)
+    builder.close()
+
+    loaded = Journal.load(str(tmp_path / ".journal"))
+    assert loaded is not None
+    assert (loaded.file_id, loaded.file_name, loaded.file_size) == (b"12345678", "out.bin", 1000)
+    assert loaded.ranges() == [(0, 3), (5, 6), (9, 10)]
+    assert loaded.ranges(limit=2) == [(0, 3), (5, 6)]
+
+    # the kept chunks are neither truncated nor written again
+    builder = FileBuilder(str(tmp_path / "out.bin"), len(content), chunk_size=100, resumed=loaded.ranges(), journal=loaded)
+    for chunk in [3, 4, 6, 7, 8]:
+        builder.write(content[chunk * 100:(chunk + 1) * 100], chunk * 100)
+
+    assert builder.is_completed()
+    assert open(tmp_path / "out.bin", "rb").read() == content
+    assert not os.path.exists(tmp_path / ".journal")
+
+def test_interrupted_transfer_skips_the_chunks_on_disk(tmp_path):
+    source = tmp_path / "source.bin"
+    content = os.urandom(200_000)
+    source.write_bytes(content)
+    port = random.randint(20000, 50000)
+    chunk_size = chunk_size_for(CodecEnum.HAMMING, False)
+    chunks = -(-len(content) // chunk_size)
+
+    # what an earlier run left: chunks 0-5 and 8 on disk, the rest never written
+    output = tmp_path / "client"
+    output.mkdir()
+    kept = [(0, 6), (8, 9)]
+    partial = bytearray(len(content))
+    bitmap = bytearray((chunks + 7) // 8)
+    for (start, end) in kept:
+        partial[start * chunk_size:end * chunk_size] = content[start * chunk_size:end * chunk_size]
+        for chunk in range(start, end):
+            bitmap[chunk >> 3] |= 1 << (chunk & 7)
+    (output / "source.bin").write_bytes(bytes(partial))
+    identity = file_identity(str(source))
+    assert identity is not None
+    Journal(Journal.path_for(str(output), "127.0.0.1", port), identity, chunk_size, len(content), "source.bin").save(bytes(bitmap))
+
+    async def transfer():
+        loop = asyncio.get_running_loop()
+        manager = AsyncTCPManager(ServerArg([str(port), str(source), "--cc", "reno"]), AsyncConnection("", port))
+        server = asyncio.ensure_future(manager.serve(expected_connections=1))
+
+        connection = AsyncConnection("", 0)
+        await connection.open()
+        receiver = AsyncFileReceiver(connection, "127.0.0.1", port, str(output), scheduler=LoopScheduler(loop), resume=True)
+        client = asyncio.ensure_future(receiver.run())
+
+        await asyncio.wait_for(server, 30)
+        client.cancel()
+
+        return (manager, receiver)
+
+    (manager, receiver) = asyncio.run(transfer())
+
+    assert receiver.resumed_ranges == kept
+    assert open(receiver.file_path, "rb").read() == content
+    assert not os.path.exists(Journal.path_for(str(output), "127.0.0.1", port))
+    # the metadata and the chunks missing from disk
+    assert manager.stats.segments_sent - manager.stats.retransmissions == 1 + chunks - 7
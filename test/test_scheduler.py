@@ -0,0 +1,36 @@
+from lib.scheduler import Scheduler
+import threading
+import time
+
+def test_timers_fire_in_deadline_order_and_reschedule():
+    scheduler = Scheduler()
+    fired = []
+    done = threading.Event()
+    repeats = [2]
+
+    def repeating():
+        fired.append("repeat")
+        repeats[0] -= 1
+        if repeats[0] == 0:
+            done.set()
+            return None
+        return 0.01
+
+    scheduler.schedule(0.02, lambda: fired.append("late"))
+    scheduler.schedule(0.0, lambda: fired.append("early"))
+    scheduler.schedule(0.05, repeating)
+
+    assert done.wait(2)
+    assert fired == ["early", "late", "repeat", "repeat"]
+
+def test_cancelled_timer_does_not_fire():
+    scheduler = Scheduler()
+    fired = []
+
+    timer = scheduler.schedule(0.01, lambda: fired.append("cancelled"))
+    scheduler.cancel(timer)
+    scheduler.schedule(0.02, lambda: fired.append("kept"))
+
+    time.sleep(0.1)
+    assert fired == ["kept"]
+    assert scheduler.pending() == 0
@@ -0,0 +1,45 @@
+from lib.segment import Segment, SegmentFlag, InvalidChecksumException
+from lib.constants import FlagEnum
+import os
+
+def test_roundtrip():
+    segment = Segment.data_segment(os.urandom(100))
+    segment.sequence_number = 7
+    segment.ack = 3
+
+    decoded = Segment.from_bytes(segment.to_bytes())
+
+    assert decoded.sequence_number == 7
+    assert decoded.ack == 3
+    assert decoded.flag == FlagEnum.NO_FLAG
+    assert bytes(decoded.data) == segment.data
+
+def test_pack_into_preallocated_buffer():
+    segment = Segment.syn_ack_segment(10, 11)
+    buffer = bytearray(64)
+
+    length = segment.pack_into(buffer, 4)
+
+    assert Segment.from_raw_bytes(buffer[4:4 + length]).flag == FlagEnum.SYN_ACK_FLAG
+
+def test_corrupted_segment_is_rejected():
+    raw = Segment.ack_segment(0, 5).to_raw_bytes()
+    raw[4] ^= 0xFF
+
+    try:
+        Segment.from_raw_bytes(raw)
+        assert False, "corrupted segment accepted"
+    except InvalidChecksumException:
+        pass
+
+def test_flags_are_shared():
+    assert SegmentFlag(int(FlagEnum.ACK_FLAG)) is Segment.ack_segment(0, 1).flag
+
+def test_sack_blocks_roundtrip():
+    segment = Segment.ack_segment(0, 5, [(7, 9), (12, 13)])
+
+    decoded = Segment.from_raw_bytes(segment.to_raw_bytes())
+
+    assert decoded.ack == 5
+    assert decoded.sack_blocks() == [(7, 9), (12, 13)]
+    assert Segment.ack_segment(0, 5).sack_blocks() == []
@@ -0,0 +1,76 @@
+from lib.codec import get_codec
+from lib.compression import CompressedPayload, Compressor
+from lib.constants import CodecEnum, CompressionEnum
+from lib.file import FilePayload
+from lib.segment import Segment
+from lib.segment_cache import EncodedChunk, SegmentCache, ENTRY_OVERHEAD
+from lib.segment_sender import encode_segments
+import os
+
+import pytest
+
+def test_cached_payload_with_own_header_matches_full_encoding(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(5000))
+    payload = FilePayload(str(source), 1000)
+    cache = SegmentCache()
+
+    for codec_id in CodecEnum:
+        codec = get_codec(codec_id)
+        [chunk] = cache.get_chunks(payload, [3], codec)
+
+        segment = payload.get_segment(3)
+        segment.sequence_number = 42
+        header = segment.pack_header(chunk.crc16)
+        pieces = codec.encode(header) + (chunk.encoded if chunk.encoded is not None else bytes(segment.data))
+
+        assert pieces == codec.encode(segment.to_raw_bytes())
+        assert Segment.from_raw_bytes(codec.decode_with_errors(pieces)[0]).sequence_number == 42
+
+    payload.close()
+
+def test_hits_misses_and_eviction(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(5000))
+    payload = FilePayload(str(source), 1000)
+    codec = get_codec(CodecEnum.HAMMING)
+    # room for two encoded chunks
+    cache = SegmentCache(2 * (2000 + ENTRY_OVERHEAD))
+
+    cache.get_chunks(payload, [1, 2], codec)
+    cache.get_chunks(payload, [1], codec)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # chunk 2 is the least recently used
+    cache.get_chunks(payload, [3], codec)
+    assert cache.evictions == 1
+    cache.get_chunks(payload, [1], codec)
+    cache.get_chunks(payload, [2], codec)
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert cache.size <= cache.capacity
+
+    payload.close()
+
+def test_only_deterministic_payloads_are_cached_and_sent_bytes_match_the_checksum(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(5000))
+    payload = FilePayload(str(source), 1000)
+    cache = SegmentCache()
+
+    with pytest.raises(ValueError):
+        cache.get_chunks(CompressedPayload(payload, Compressor(CompressionEnum.ZLIB)), [1], get_codec(CodecEnum.NONE))
+
+    for codec_id in [CodecEnum.NONE, CodecEnum.HAMMING]:
+        codec = get_codec(codec_id)
+        # an entry of other bytes under the key of chunk 2
+        [other] = cache.get_chunks(payload, [1], codec)
+        cache.entries[(payload.key, payload.chunk_size, 2, codec.codec_id)] = EncodedChunk(other.encoded[:100] if other.encoded is not None else None, other.crc16, 100)
+
+        segment = payload.get_segment(2)
+        segment.sequence_number = 42
+        [encoded] = encode_segments([segment], payload, 40, codec, cache)
+        wire = b"".join(bytes(piece) for piece in encoded) if isinstance(encoded, list) else bytes(encoded)
+
+        assert Segment.from_raw_bytes(codec.decode_with_errors(wire)[0]).data == segment.data
+
+    payload.close()
@@ -0,0 +1,62 @@
+from lib.codec import NoCodec
+from lib.segment_sender import SenderBuffer
+import time
+
+class RecordingConnection:
+    def __init__(self):
+        self.sent = []
+
+    def get_codec(self, ip, port):
+        return NoCodec()
+
+    def send(self, message, encoded=None):
+        self.sent.append(message.segment.sequence_number)
+
+def sender_for(tmp_path, chunks, min_rto=0.2):
+    path = tmp_path / "payload.bin"
+    path.write_bytes(b"x" * 100 * chunks)
+    connection = RecordingConnection()
+
+    return (SenderBuffer(connection, "127.0.0.1", 1, str(path), 1, 100, min_rto=min_rto, congestion_control="reno"), connection)
+
+def test_sacks_above_a_hole_trigger_one_fast_retransmit(tmp_path):
+    (sender, connection) = sender_for(tmp_path, 10)
+    sender.send(1)
+    sender.send(2)
+    assert connection.sent == [1, 2, 3, 4, 5, 6]
+
+    # segment 2 is lost, everything after it reaches the receiver
+    for end in (4, 5, 6):
+        sender.send(2, [(3, end)])
+
+    assert connection.sent.count(2) == 2
+    assert sender.fast_retransmits == 1
+    assert sender.in_recovery
+    sender.cancel_all()
+
+def test_tail_loss_probe_resends_the_last_segment(tmp_path):
+    (sender, connection) = sender_for(tmp_path, 1)
+    sender.send(1)
+    sender.send(2)
+
+    time.sleep(0.1)
+
+    assert connection.sent == [1, 2, 2]
+    assert sender.probes == 1
+    sender.cancel_all()
+
+def test_zero_window_is_probed_until_it_reopens(tmp_path):
+    (sender, connection) = sender_for(tmp_path, 10, min_rto=0.01)
+    sender.send(1)
+    sender.send(5, window=0)
+    assert connection.sent == [1, 2, 3, 4]
+
+    time.sleep(0.1)
+    assert sender.window_probes >= 1
+    assert set(connection.sent[4:]) == {5}
+
+    # the window update lets the dropped probe and the next segments out, within the new window
+    probes = len(connection.sent)
+    sender.send(5, window=4)
+    assert connection.sent[probes:] == [5, 6, 7, 8]
+    sender.cancel_all()
@@ -0,0 +1,66 @@
+from lib.arg import ServerArg
+from lib.connection import Connection
+from lib.constants import CodecEnum
+from lib.handshake import HandshakeOptions
+from lib.stripe import SharedFile, StripeReceiver, skipped_ranges, stripe_range
+from lib.tcp_manager import TCPManager
+from socket import timeout as socket_timeout
+import os
+import random
+import threading
+import time
+
+def test_stripes_cover_every_chunk_once():
+    for (chunks, count) in [(19, 4), (3, 8), (0, 2), (100, 1)]:
+        covered = []
+        for index in range(count):
+            (start, end) = stripe_range(index, count, chunks)
+            covered.extend(range(start, end))
+            assert sum(last - first for (first, last) in skipped_ranges(index, count, chunks)) == chunks - (end - start)
+        assert covered == list(range(chunks))
+
+    assert HandshakeOptions.from_bytes(HandshakeOptions(stripe=(2, 4)).to_bytes()).stripe == (2, 4)
+    assert HandshakeOptions.from_bytes(HandshakeOptions(stripe=(4, 4)).to_bytes()).stripe is None
+
+def test_streams_merge_into_one_file(tmp_path):
+    content = os.urandom(700_000)
+    source = tmp_path / "source.bin"
+    source.write_bytes(content)
+    output = tmp_path / "client"
+    output.mkdir()
+    port = random.randint(20000, 40000)
+    streams = 3
+
+    manager = TCPManager(ServerArg([str(port), str(source), "--fec", "none"]), Connection("", port))
+    shared = SharedFile()
+
+    def run_client(index: int):
+        connection = Connection("", port + 1 + index)
+        receiver = StripeReceiver(connection, "127.0.0.1", port, str(output), shared, index, streams, codecs=[CodecEnum.NONE])
+        receiver.connect()
+        while not receiver.is_file_received:
+            try:
+                for message in connection.receive_batch(0.1):
+                    receiver.handle_message(message)
+            except socket_timeout:
+                continue
+
+    for index in range(streams):
+        threading.Thread(target=run_client, args=(index,), daemon=True).start()
+
+    manager.listen_for_connection(expected_connections=streams)
+    server = threading.Thread(target=manager.parallel_handle, daemon=True)
+    server.start()
+    server.join(30)
+    assert not server.is_alive()
+
+    deadline = time.monotonic() + 10
+    while not (len(shared.receivers) == streams and all(receiver.is_file_received for receiver in shared.receivers)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert all(receiver.striped for receiver in shared.receivers)
+    assert len({id(receiver.file_handle) for receiver in shared.receivers}) == 1
+    assert open(shared.receivers[0].file_path, "rb").read() == content
+    # every chunk went over exactly one of the connections
+    assert manager.stats.connections == streams
+    assert manager.stats.bytes_sent == len(content)
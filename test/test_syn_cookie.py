@@ -0,0 +1,138 @@
+from lib.arg import ServerArg
+from lib.codec import get_codec
+from lib.connection import Connection
+from lib.constants import CodecEnum, FlagEnum, MAX_PENDING, SYN_COOKIE_SLOT, SYN_COOKIE_SLOTS, TIMEOUT
+from lib.handler import FileReceiver
+from lib.handshake import HandshakeOptions
+from lib.scheduler import get_scheduler
+from lib.segment import Segment
+from lib.syn_cookie import SynCookies
+from lib.tcp_manager import TCPManager
+from lib.tcp_pending import TCPPending
+from socket import timeout as socket_timeout
+import os
+import random
+import socket
+import threading
+import time
+
+import pytest
+
+SYNS = 10_000
+
+def test_cookie_is_checked_against_address_offer_and_age():
+    cookies = SynCookies(b"secret")
+    offer = HandshakeOptions(codecs=[CodecEnum.NONE]).to_bytes()
+    now = 1000 * SYN_COOKIE_SLOT
+    cookie = cookies.make("127.0.0.1", 4000, 7, offer, now)
+
+    assert cookie < 2 ** 28
+    assert cookies.check("127.0.0.1", 4000, 7, offer, cookie, now + (SYN_COOKIE_SLOTS - 1) * SYN_COOKIE_SLOT)
+    assert not cookies.check("127.0.0.1", 4000, 7, offer, cookie, now + SYN_COOKIE_SLOTS * SYN_COOKIE_SLOT)
+    assert not cookies.check("127.0.0.1", 4001, 7, offer, cookie, now)
+    assert not cookies.check("127.0.0.1", 4000, 8, offer, cookie, now)
+    assert not cookies.check("127.0.0.1", 4000, 7, HandshakeOptions(codecs=[CodecEnum.HAMMING]).to_bytes(), cookie, now)
+    assert not SynCookies(b"other").check("127.0.0.1", 4000, 7, offer, cookie, now)
+
+def test_pending_handshakes_are_bounded_and_expire():
+    pending = TCPPending(max_size=100, timeout=0.05)
+    for port in range(SYNS):
+        pending.add("127.0.0.2", port, 1)
+
+    assert len(pending) == 100 and pending.full
+    # the oldest ones made room
+    assert pending.is_pending("127.0.0.2", SYNS - 1) and not pending.is_pending("127.0.0.2", 0)
+
+    time.sleep(0.1)
+    pending.expire()
+    assert len(pending) == 0 and not pending.full
+
+class EvictedWhileChecked(dict):
+    # the main thread evicts the entry right after the scheduler thread saw it
+    def __contains__(self, key):
+        found = super().__contains__(key)
+        self.pop(key, None)
+        return found
+
+def test_syn_ack_resend_survives_a_concurrent_eviction():
+    port = random.randint(20000, 40000)
+    manager = TCPManager(ServerArg([str(port), __file__]), Connection("", port))
+    manager.pending_connections.add("127.0.0.2", 4000, 7)
+    manager.pending_connections.tcp_client = EvictedWhileChecked(manager.pending_connections.tcp_client)
+
+    assert manager._resend_syn_ack("127.0.0.2", 4000, 1, 7) is TIMEOUT
+    manager.pending_connections.remove("127.0.0.2", 4000)
+    assert manager._resend_syn_ack("127.0.0.2", 4000, 1, 7) is None
+    manager.connection.close()
+
+@pytest.mark.parametrize("syn_cookies", [True, False])
+def test_syn_flood_keeps_bounded_state_and_a_client_still_connects(tmp_path, syn_cookies):
+    content = os.urandom(300_000)
+    source = tmp_path / "source.bin"
+    source.write_bytes(content)
+    output = tmp_path / "client"
+    output.mkdir()
+    port = random.randint(20000, 40000)
+
+    manager = TCPManager(ServerArg([str(port), str(source), "--fec", "none"] + (["--syn-cookies"] if syn_cookies else [])), Connection("", port, rcvbuf=4 * 1024 * 1024))
+    scheduler = get_scheduler()
+    timers = scheduler.pending()
+    listener = threading.Thread(target=manager.listen_for_connection, kwargs={"expected_connections": 1}, daemon=True)
+    listener.start()
+
+    # every SYN from a socket of its own, as many spoofed sources would. None of them answers
+    # handshakes go out with the default codec
+    codec = get_codec()
+    offer = HandshakeOptions(codecs=[CodecEnum.NONE]).to_bytes()
+    largest = 0
+    for index in range(SYNS):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as flooder:
+            flooder.sendto(codec.encode(Segment.syn_segment(index % 50, offer).to_raw_bytes()), ("127.0.0.1", port))
+        if index % 100 == 0:
+            largest = max(largest, len(manager.pending_connections))
+            time.sleep(0.002)
+
+    # the SYN-ACK of one last SYN, the server got through the flood before it
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as last:
+        last.settimeout(10)
+        last.sendto(codec.encode(Segment.syn_segment(1, offer).to_raw_bytes()), ("127.0.0.1", port))
+        assert Segment.from_raw_bytes(codec.decode_with_errors(last.recv(4096))[0]).flag == FlagEnum.SYN_ACK_FLAG
+    largest = max(largest, len(manager.pending_connections))
+
+    if syn_cookies:
+        assert largest == 0
+        assert scheduler.pending() - timers < 100
+    else:
+        # the table fills up, every SYN after that is answered with a cookie
+        assert largest == MAX_PENDING
+        assert scheduler.pending() - timers <= MAX_PENDING + 100
+
+    receivers = []
+
+    def run_client():
+        connection = Connection("", port + 1)
+        receiver = FileReceiver(connection, "127.0.0.1", port, str(output), [CodecEnum.NONE])
+        receivers.append(receiver)
+        receiver.connect()
+        while not receiver.is_file_received:
+            try:
+                for message in connection.receive_batch(0.1):
+                    receiver.handle_message(message)
+            except socket_timeout:
+                continue
+
+    threading.Thread(target=run_client, daemon=True).start()
+    listener.join(30)
+    assert not listener.is_alive()
+    server = threading.Thread(target=manager.parallel_handle, daemon=True)
+    server.start()
+    server.join(30)
+    assert not server.is_alive()
+
+    deadline = time.monotonic() + 10
+    while not receivers[0].is_file_received and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert open(receivers[0].file_path, "rb").read() == content
+    assert manager.stats.connections == 1
+    assert not manager.pending_connections.is_pending("127.0.0.1", port + 1)
+    manager.connection.close()
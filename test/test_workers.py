@@ -0,0 +1,54 @@
+from lib.arg import ServerArg
+from lib.async_connection import AsyncConnection
+from lib.async_handler import AsyncFileReceiver
+from lib.scheduler import LoopScheduler
+from lib.tcp import TCPStatusEnum
+from lib.workers import WorkerPool
+import asyncio
+import os
+import random
+import socket
+import time
+
+import pytest
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="needs SO_REUSEPORT")
+def test_workers_share_the_port_and_report_stats(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(200_000))
+    port = random.randint(20000, 50000)
+    clients = 4
+
+    pool = WorkerPool(ServerArg([str(port), str(source), "--cc", "reno", "--workers", "2"]), 2)
+    pool.start()
+    time.sleep(0.5)
+
+    async def receive():
+        loop = asyncio.get_running_loop()
+        receivers = []
+        for index in range(clients):
+            output = tmp_path / f"client{index}"
+            output.mkdir()
+            connection = AsyncConnection("", 0)
+            await connection.open()
+            receivers.append(AsyncFileReceiver(connection, "127.0.0.1", port, str(output), scheduler=LoopScheduler(loop)))
+
+        tasks = [asyncio.ensure_future(receiver.run()) for receiver in receivers]
+        while not all(receiver.status in (TCPStatusEnum.CLOSE_TIME_WAIT, TCPStatusEnum.CLOSED) for receiver in receivers):
+            await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+
+        return receivers
+
+    try:
+        receivers = asyncio.run(asyncio.wait_for(receive(), 30))
+        stats = pool.collect(expected_connections=clients, timeout=30)
+    finally:
+        pool.stop()
+
+    for receiver in receivers:
+        assert open(receiver.file_path, "rb").read() == source.read_bytes()
+
+    assert stats.connections == clients
+    assert stats.bytes_sent == clients * len(source.read_bytes())